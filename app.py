@@ -1,12 +1,27 @@
 import os
+import atexit
 import logging
 from flask import Flask, session, request, g
 from datetime import datetime
 import json
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from models.persistence import encode_default
+
+
+class DataStoreJSONProvider(DefaultJSONProvider):
+    """JSON provider that also serialises compact DataStore records"""
+    @staticmethod
+    def default(o):
+        try:
+            return encode_default(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
+
 
 # Initialize Flask application
 app = Flask(__name__)
+app.json = DataStoreJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "simrs-development-key")
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///simrs.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -32,7 +47,58 @@ app.register_blueprint(main_bp)
 app.register_blueprint(api_bp, url_prefix='/api')
 
 # Create global data store
-data_store = DataStore()
+# Collections are stored one file each under SIMRS_DATA_DIR and loaded on first
+# access; SIMRS_DATA_FILE is the legacy single-file snapshot migrated on first start.
+# Set SIMRS_JOURNAL_FILE to append mutations to a journal instead of
+# rewriting collection files
+app.config['DATA_DIR'] = os.environ.get('SIMRS_DATA_DIR', 'simrs_data')
+app.config['DATA_FILE'] = os.environ.get('SIMRS_DATA_FILE', 'simrs_data.json')
+# Collection file format: json, pickle or msgpack, optionally compressed with gzip, zstd or lz4
+app.config['DATA_CODEC'] = os.environ.get('SIMRS_DATA_CODEC', 'json')
+app.config['DATA_COMPRESSION'] = os.environ.get('SIMRS_DATA_COMPRESSION', 'none')
+app.config['JOURNAL_FILE'] = os.environ.get('SIMRS_JOURNAL_FILE')
+app.config['JOURNAL_COMPACT_BYTES'] = int(os.environ.get('SIMRS_JOURNAL_COMPACT_BYTES', 8 * 1024 * 1024))
+# Changes are persisted by a background thread, debounced by SIMRS_FLUSH_INTERVAL seconds;
+# set SIMRS_WRITE_BEHIND=0 to write at the end of each request instead
+app.config['WRITE_BEHIND'] = os.environ.get('SIMRS_WRITE_BEHIND', '1') != '0'
+app.config['FLUSH_INTERVAL'] = float(os.environ.get('SIMRS_FLUSH_INTERVAL', 1.0))
+# Set SIMRS_WARM_UP=1 to load all collections in the background after boot
+app.config['WARM_UP'] = os.environ.get('SIMRS_WARM_UP', '0') == '1'
+# Core records are kept as compact slotted objects; SIMRS_COMPACT_RECORDS=0 keeps plain dicts
+app.config['COMPACT_RECORDS'] = os.environ.get('SIMRS_COMPACT_RECORDS', '1') != '0'
+# Set SIMRS_DATA_BACKEND=sqlite to keep collections in tables of the SQLAlchemy
+# database instead, so several workers can share one dataset
+app.config['DATA_BACKEND'] = os.environ.get('SIMRS_DATA_BACKEND', 'file')
+# Number of most recent activities kept in the activity log
+app.config['ACTIVITY_RETENTION'] = int(os.environ.get('SIMRS_ACTIVITY_RETENTION', 100))
+# Activities are streamed to rotating, compressed NDJSON segments under
+# SIMRS_ACTIVITY_DIR (set it empty to keep them in the data snapshot instead)
+app.config['ACTIVITY_DIR'] = os.environ.get('SIMRS_ACTIVITY_DIR', 'simrs_activity')
+app.config['ACTIVITY_SEGMENT_BYTES'] = int(os.environ.get('SIMRS_ACTIVITY_SEGMENT_BYTES', 8 * 1024 * 1024))
+app.config['ACTIVITY_SEGMENT_SECONDS'] = int(os.environ.get('SIMRS_ACTIVITY_SEGMENT_SECONDS', 3600))
+app.config['ACTIVITY_COMPRESSION'] = os.environ.get('SIMRS_ACTIVITY_COMPRESSION', 'gzip')
+# Set SIMRS_VERIFY_COUNTERS=1 to cross-check the dashboard counters against a
+# full recount on every dashboard hit (slow; for troubleshooting only)
+app.config['VERIFY_COUNTERS'] = os.environ.get('SIMRS_VERIFY_COUNTERS', '0') == '1'
+data_store_options = dict(data_dir=app.config['DATA_DIR'],
+                          data_file=app.config['DATA_FILE'],
+                          journal_file=app.config['JOURNAL_FILE'],
+                          journal_compact_bytes=app.config['JOURNAL_COMPACT_BYTES'],
+                          codec=app.config['DATA_CODEC'],
+                          compression=app.config['DATA_COMPRESSION'],
+                          compact_records=app.config['COMPACT_RECORDS'],
+                          verify_counters=app.config['VERIFY_COUNTERS'],
+                          activity_retention=app.config['ACTIVITY_RETENTION'],
+                          activity_dir=app.config['ACTIVITY_DIR'] or None,
+                          activity_segment_bytes=app.config['ACTIVITY_SEGMENT_BYTES'],
+                          activity_segment_seconds=app.config['ACTIVITY_SEGMENT_SECONDS'],
+                          activity_compression=app.config['ACTIVITY_COMPRESSION'])
+if app.config['DATA_BACKEND'] == 'sqlite':
+    from models.sqlite_store import SQLiteDataStore
+    with app.app_context():
+        data_store = SQLiteDataStore(db.engine, **data_store_options)
+else:
+    data_store = DataStore(**data_store_options)
 
 @app.before_request
 def before_request():
@@ -66,11 +132,11 @@ except TypeError:
     # Fallback for older Flask-Babel versions
     babel.localeselector(get_locale)
 
-# Save data to file before shutting down
+# Persist pending changes (a no-op when the write-behind flusher is running)
 @app.teardown_appcontext
 def teardown_appcontext(exception):
     if hasattr(g, 'data_store'):
-        g.data_store.save_to_file()
+        g.data_store.persist()
 
 # Load data from file and create database tables when starting
 with app.app_context():
@@ -78,4 +144,13 @@ with app.app_context():
     db.create_all()
     
     # Initialize data loading
-    data_store.load_from_file()
\ No newline at end of file
+    data_store.load_from_file()
+    if app.config['WARM_UP']:
+        data_store.warm_up()
+
+# Enable write-behind persistence and flush whatever is pending at shutdown.
+# The flusher thread starts with the first write in each process, so it also
+# runs in workers forked after import (gunicorn --preload).
+if app.config['WRITE_BEHIND']:
+    data_store.start_flusher(app.config['FLUSH_INTERVAL'])
+atexit.register(data_store.stop_flusher)
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Benchmark: activity logging, list with re-slicing vs queued ring buffer
+
+Logs activities from several threads the way before_request does, once
+into the previous structure (a list appended and trimmed under the store
+lock, sorted by timestamp on every read) and once into the ActivityLog
+ring buffer, and reports logging throughput and recent-activities latency
+for a few retention sizes.
+
+Usage:
+    python benchmarks/bench_activity_log.py [--threads 8] [--per-thread 50000] [--retention 100 1000 10000]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.activity_log import ActivityLog
+from models.locking import RWLock
+
+
+class ListLog:
+    """The previous activity log: a list trimmed on append and sorted on read"""
+    def __init__(self, retention):
+        self.retention = retention
+        self._activities = []
+        self._lock = RWLock()
+
+    def append(self, activity):
+        with self._lock.write():
+            self._activities.append(activity)
+            if len(self._activities) > self.retention:
+                del self._activities[:-self.retention]
+
+    def recent(self, limit):
+        with self._lock.read():
+            activities = list(self._activities)
+        return sorted(activities, key=lambda x: x['timestamp'], reverse=True)[:limit]
+
+
+def log_throughput(log, threads, per_thread):
+    """Activities logged per second by `threads` threads"""
+    def work():
+        for _ in range(per_thread):
+            log.append({'timestamp': datetime.now().isoformat(), 'endpoint': 'api_bp.get_patients',
+                        'method': 'GET', 'ip': '127.0.0.1'})
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * per_thread / (time.perf_counter() - start)
+
+
+def read_latency(log, repeat=200):
+    """Median seconds of reading the 5 most recent activities (as the dashboard does)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        log.recent(5)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--per-thread', type=int, default=50000)
+    parser.add_argument('--retention', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.per_thread} activities")
+    print(f"{'retention':>9} {'log':12} {'logged/s':>10} {'recent(5)':>10}")
+    for retention in args.retention:
+        for label, log in (('list', ListLog(retention)), ('ring buffer', ActivityLog(retention=retention))):
+            rate = log_throughput(log, args.threads, args.per_thread)
+            latency = read_latency(log)
+            print(f"{retention:>9} {label:12} {rate:>10.0f} {latency * 1e6:>8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
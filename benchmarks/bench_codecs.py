@@ -0,0 +1,91 @@
+"""
+Benchmark: collection file codecs (load/save time and size on disk)
+
+Writes a synthetic appointments collection with every available
+codec/compression pair and reports save time, load time and file size
+against plain JSON.
+
+Usage:
+    python benchmarks/bench_codecs.py [--sizes 100000,1000000,5000000]
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.persistence import CollectionFiles, CODECS, COMPRESSIONS
+
+STATUSES = ('scheduled', 'completed', 'cancelled', 'no-show')
+
+
+def build_appointments(size):
+    """Build a synthetic appointments collection"""
+    appointments = {}
+    for i in range(size):
+        appointment_id = str(uuid.uuid4())
+        appointments[appointment_id] = {
+            'id': appointment_id,
+            'patient_id': str(uuid.uuid4()),
+            'doctor_id': i % 40,
+            'department_id': str(i % 6 + 1),
+            'appointment_date': f"2025-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}T09:00",
+            'appointment_time': '09:00',
+            'reason': 'Kontrol rutin',
+            'status': STATUSES[i % 4],
+            'notes': None,
+            'created_at': '2025-01-01T08:00:00.000000'
+        }
+    return appointments
+
+
+def available_formats():
+    """Codec/compression pairs whose libraries are installed"""
+    formats = []
+    for codec in CODECS:
+        for compression in COMPRESSIONS:
+            storage = CollectionFiles(os.devnull, codec, compression)
+            if storage.codec == codec and storage.compression == compression:
+                formats.append((codec, compression))
+    return formats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='100000,1000000,5000000')
+    args = parser.parse_args()
+    formats = available_formats()
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        appointments = build_appointments(size)
+        print(f"\n{size} records")
+        print(f"{'format':<16} {'save s':>8} {'load s':>8} {'size MB':>9} {'vs json':>8}")
+        json_size = None
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            for codec, compression in formats:
+                storage = CollectionFiles(os.path.join(workdir, f"{codec}-{compression}"), codec, compression)
+                gc.collect()
+                start = time.perf_counter()
+                written = storage.write('appointments', appointments)
+                save_time = time.perf_counter() - start
+                gc.collect()
+                start = time.perf_counter()
+                storage.read('appointments', {})
+                load_time = time.perf_counter() - start
+                if json_size is None:
+                    json_size = written
+                print(f"{codec + '/' + compression:<16} {save_time:8.2f} {load_time:8.2f} "
+                      f"{written / 1e6:9.1f} {written / json_size:7.0%}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        del appointments
+
+
+if __name__ == '__main__':
+    main()
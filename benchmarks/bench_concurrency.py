@@ -0,0 +1,120 @@
+"""
+Benchmark: DataStore throughput under concurrent readers and writers
+
+Runs a mixed request workload (patient lookups, day queries, activity
+logging, new appointments) from 1, 4 and 16 threads while a background
+thread keeps writing snapshots, and reports operations per second and any
+errors raised (e.g. "dictionary changed size during iteration").
+
+Usage:
+    python benchmarks/bench_concurrency.py [--patients 5000] [--seconds 3] [--write-ratio 0.1]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+from models.appointment import Appointment
+from models.patient import Patient
+
+
+def build_store(data_dir, patients):
+    """Create a data store with `patients` patients and two appointments each"""
+    data_store = DataStore(data_dir=data_dir)
+    data_store.load_from_file()
+    patient_ids = []
+    for i in range(patients):
+        patient = Patient(id=str(uuid.uuid4()), name=f"Patient {i}", gender='male',
+                          birth_date='1980-01-01')
+        data_store.add_patient(patient)
+        patient_ids.append(patient.id)
+        for day in ('2025-01-01', datetime.now().strftime('%Y-%m-%d')):
+            data_store.add_appointment(Appointment(patient_id=patient.id, doctor_id=1, department_id='1',
+                                                   appointment_date=f"{day}T09:00"))
+    data_store.flush()
+    return data_store, patient_ids
+
+
+def worker(data_store, patient_ids, write_ratio, deadline, counts, errors):
+    """Issue a mix of reads and writes until the deadline"""
+    rng = random.Random()
+    ops = 0
+    while time.perf_counter() < deadline:
+        try:
+            data_store.log_activity({'timestamp': datetime.now().isoformat(), 'endpoint': 'bench',
+                                     'method': 'GET', 'ip': '127.0.0.1'})
+            if rng.random() < write_ratio:
+                data_store.add_appointment(Appointment(patient_id=rng.choice(patient_ids), doctor_id=1,
+                                                       department_id='1',
+                                                       appointment_date=datetime.now().isoformat()))
+            else:
+                patient_id = rng.choice(patient_ids)
+                data_store.get_patient(patient_id)
+                data_store.get_appointments_by_patient(patient_id)
+                data_store.get_outpatient_count()
+                data_store.get_recent_activities()
+            ops += 1
+        except Exception as e:
+            errors.append(repr(e))
+    counts.append(ops)
+
+
+def snapshotter(data_store, stop, flushes):
+    """Keep persisting snapshots while the workers run"""
+    while not stop.is_set():
+        data_store._mark_dirty('appointments')
+        data_store.flush()
+        flushes.append(1)
+
+
+def run(data_store, patient_ids, threads, seconds, write_ratio):
+    """Run the workload on `threads` threads and return (ops/s, errors, flushes)"""
+    counts, errors, flushes = [], [], []
+    stop = threading.Event()
+    saver = threading.Thread(target=snapshotter, args=(data_store, stop, flushes))
+    saver.start()
+    deadline = time.perf_counter() + seconds
+    workers = [threading.Thread(target=worker, args=(data_store, patient_ids, write_ratio,
+                                                     deadline, counts, errors))
+               for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    stop.set()
+    saver.join()
+    return sum(counts) / seconds, errors, len(flushes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+    try:
+        data_store, patient_ids = build_store(os.path.join(workdir, 'simrs_data'), args.patients)
+        print(f"{'threads':>8} {'ops/s':>12} {'snapshots':>10} {'errors':>8}")
+        for threads in (1, 4, 16):
+            throughput, errors, flushes = run(data_store, patient_ids, threads, args.seconds,
+                                              args.write_ratio)
+            print(f"{threads:>8} {throughput:>12,.0f} {flushes:>10} {len(errors):>8}")
+            for error in sorted(set(errors))[:3]:
+                print(f"         {error}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: dashboard totals from maintained counters vs full scans
+
+Fills a DataStore with growing numbers of synthetic appointments and
+inpatients, and times reading the dashboard totals plus the 30- and
+365-day visit breakdowns (by department, by doctor and by weekday) from
+the incrementally maintained counters and visit matrices against
+recounting them with full scans of the collections.
+
+Usage:
+    python benchmarks/bench_dashboard.py [--sizes 10000 100000 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+
+STATUSES = ('scheduled', 'completed', 'cancelled', 'no-show')
+
+
+def build_store(data_dir, size):
+    """Data store with `size` appointments over the last 730 days and size / 10 inpatients"""
+    data_store = DataStore(data_dir=data_dir)
+    data_store.load_from_file()
+    data_store.initialize()
+    appointments = {}
+    for i in range(size):
+        appointment_id = str(uuid.uuid4())
+        day = (datetime.now() - timedelta(days=i % 730)).strftime('%Y-%m-%d')
+        appointments[appointment_id] = {
+            'id': appointment_id, 'patient_id': f"patient-{i % 50000}",
+            'doctor_id': str(i % 40), 'department_id': str(i % 6 + 1), 'appointment_date': f"{day}T{8 + i % 9:02d}:00",
+            'status': STATUSES[i % len(STATUSES)]}
+    inpatients = {f"patient-{i}": {'patient_id': f"patient-{i}", 'admission_date': '2025-01-01',
+                                   'discharge_date': None if i % 3 else '2025-01-05'}
+                  for i in range(size // 10)}
+    data_store.__dict__['appointments'] = data_store._compact_collection('appointments', appointments)
+    data_store.__dict__['inpatients'] = inpatients
+    data_store._build_indexes('appointments')
+    data_store._build_indexes('inpatients')
+    return data_store
+
+
+def scan_visits(data_store, days=30):
+    """Visits by department, by doctor and by weekday computed with a scan of the appointments"""
+    start = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    departments = {dept_id: 0 for dept_id, _ in data_store.items('departments')}
+    doctors = {}
+    weekdays = [0] * 7
+    for appointment in data_store.values('appointments'):
+        day = appointment['appointment_date'][:10]
+        if day < start or appointment['status'] == 'cancelled':
+            continue
+        if appointment['department_id'] in departments:
+            departments[appointment['department_id']] += 1
+        doctors[appointment['doctor_id']] = doctors.get(appointment['doctor_id'], 0) + 1
+        weekdays[date.fromisoformat(day).weekday()] += 1
+    return departments, doctors, weekdays
+
+
+def matrix_visits(data_store, days=30):
+    """The same breakdowns read from the visit matrices"""
+    return (data_store.get_department_visits(days), data_store.get_doctor_visits(days),
+            data_store.get_weekday_visits(days))
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'appointments':>12} {'counters':>10} {'full scan':>10}")
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            data_store = build_store(os.path.join(workdir, 'simrs_data'), size)
+            assert data_store.get_dashboard_counts() == data_store.recount_dashboard()
+            for days in (30, 365):
+                assert matrix_visits(data_store, days) == scan_visits(data_store, days)
+
+            def counters():
+                data_store.get_dashboard_counts()
+                matrix_visits(data_store, 30)
+                matrix_visits(data_store, 365)
+
+            def full_scan():
+                data_store.recount_dashboard()
+                scan_visits(data_store, 30)
+                scan_visits(data_store, 365)
+
+            counter_time = median_time(counters, args.repeat)
+            scan_time = median_time(full_scan, max(1, args.repeat // 10))
+            print(f"{size:>12} {counter_time * 1000:>8.2f}ms {scan_time * 1000:>8.1f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: blocked duplicate patient detection
+
+Fills a DataStore with growing numbers of synthetic patients, a few
+percent of them re-registered under a variant spelling, then times
+building the blocking index, checking the whole registry for duplicate
+pairs, and the on-insert check of one new registration. Recall is the
+share of the planted duplicates that were found; the number of pairs an
+all-pairs comparison would have to score is shown for scale.
+
+Usage:
+    python benchmarks/bench_duplicates.py [--sizes 10000 100000 1000000] [--duplicates 0.02]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+
+FIRST_NAMES = ('Agus', 'Budi', 'Dewi', 'Eko', 'Fitri', 'Hendra', 'Indah', 'Joko', 'Kartika', 'Lestari',
+               'Muhammad', 'Nur', 'Putri', 'Rina', 'Sri', 'Teguh', 'Wahyu', 'Yanti', 'Siti', 'Bambang')
+LAST_NAMES = ('Santoso', 'Wijaya', 'Saputra', 'Hidayat', 'Kusuma', 'Pratama', 'Nugroho', 'Setiawan',
+              'Rahmawati', 'Susanto', 'Gunawan', 'Purnomo', 'Siregar', 'Nasution', 'Simanjuntak',
+              'Hutapea', 'Wibowo', 'Permana', 'Halim', 'Sukarno')
+# Re-registration spellings of a name
+VARIANTS = (('u', 'oe'), ('j', 'dj'), ('mm', 'm'), ('y', 'j'), ('i', 'y'))
+
+
+def misspell(name, rng):
+    """A variant spelling of a name"""
+    for old, new in rng.sample(VARIANTS, len(VARIANTS)):
+        if old in name:
+            return name.replace(old, new, 1)
+    return name + 'h'
+
+
+def build_patients(size, share):
+    """`size` synthetic patients plus re-registrations of a `share` of them, and the planted pairs"""
+    rng = random.Random(7)
+    patients, planted = {}, set()
+    first_day = date(1940, 1, 1)
+    for i in range(size):
+        patients[f"patient-{i}"] = {
+            'id': f"patient-{i}", 'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'gender': rng.choice(('male', 'female')),
+            'birth_date': (first_day + timedelta(days=rng.randrange(30000))).isoformat(),
+            'phone': f"0812{i:08d}" if rng.random() < 0.7 else None}
+    for i in rng.sample(range(size), int(size * share)):
+        original = patients[f"patient-{i}"]
+        patients[f"duplicate-{i}"] = dict(original, id=f"duplicate-{i}", name=misspell(original['name'], rng),
+                                          phone=None)
+        planted.add((f"duplicate-{i}", f"patient-{i}"))
+    return patients, planted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--duplicates', type=float, default=0.02, help='share of patients registered twice')
+    args = parser.parse_args()
+
+    print(f"{'patients':>10} {'index':>8} {'registry':>9} {'on insert':>10} {'pairs':>8} {'recall':>7} "
+          f"{'all pairs':>14}")
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            data_store = DataStore(data_dir=os.path.join(workdir, 'simrs_data'))
+            data_store.load_from_file()
+            patients, planted = build_patients(size, args.duplicates)
+            data_store.__dict__['patients'] = data_store._compact_collection('patients', patients)
+            start = time.perf_counter()
+            data_store._patient_duplicates.rebuild(data_store.patients)
+            index_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            pairs = data_store.find_duplicate_patients()
+            registry_time = time.perf_counter() - start
+            found = {tuple(sorted(pair[:2])) for pair in pairs}
+            recall = len(found & planted) / len(planted) if planted else 1.0
+
+            new_patient = dict(patients['patient-0'], id='new', name=misspell(patients['patient-0']['name'],
+                                                                               random.Random(1)))
+            start = time.perf_counter()
+            for _ in range(100):
+                data_store.find_patient_duplicates(new_patient)
+            insert_time = (time.perf_counter() - start) / 100
+            total = len(patients)
+            print(f"{total:>10} {index_time:>7.1f}s {registry_time:>8.1f}s {insert_time * 1000:>8.2f}ms "
+                  f"{len(pairs):>8} {recall:>6.1%} {total * (total - 1) // 2:>14}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: peak RSS of a full appointments export, jsonify vs streaming
+
+Loads synthetic appointments into a DataStore and exports all of them
+through GET /api/appointments, once as a single jsonify() response (the
+previous behaviour) and once streamed as NDJSON. RSS is sampled from
+/proc (Linux) while the export runs; each mode runs in its own process.
+
+Usage:
+    python benchmarks/bench_export.py [--rows 1000000]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STATUSES = ('scheduled', 'completed', 'cancelled', 'no-show')
+
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1e6
+
+
+class RSSSampler(threading.Thread):
+    """Track the highest RSS seen while running"""
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_mb()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def export(mode, rows):
+    """Run one export in this process and print: rows, bytes, seconds, base MB, peak MB"""
+    import tempfile
+    from flask import Flask, g
+    from models.data_store import DataStore
+    from models.persistence import encode_default
+    from routes.api_routes import api_bp
+
+    data_store = DataStore(data_dir=tempfile.mkdtemp(prefix='simrs-bench-'))
+    data_store.load_from_file()
+    records = {}
+    for i in range(rows):
+        appointment_id = str(uuid.uuid4())
+        day = f"2025-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}"
+        records[appointment_id] = {
+            'id': appointment_id, 'patient_id': f"patient-{i % 50000}", 'doctor_id': str(i % 40),
+            'department_id': str(i % 6 + 1), 'appointment_date': f"{day}T{8 + i % 9:02d}:00",
+            'appointment_time': f"{8 + i % 9:02d}:00", 'reason': 'Kontrol rutin',
+            'status': STATUSES[i % len(STATUSES)], 'notes': None, 'created_at': f"{day}T07:00:00"}
+    data_store.__dict__['appointments'] = data_store._compact_collection('appointments', records)
+    data_store._build_indexes('appointments')
+    del records
+
+    app = Flask(__name__)
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    @app.route('/legacy/appointments')
+    def legacy_appointments():
+        # What jsonify() does: serialise the whole list into one string
+        return app.response_class(json.dumps(data_store.values('appointments'), default=encode_default),
+                                  mimetype='application/json')
+
+    @app.before_request
+    def before_request():
+        g.data_store = data_store
+
+    import gc
+    gc.collect()
+    base = rss_mb()
+    sampler = RSSSampler()
+    sampler.start()
+    url = '/legacy/appointments' if mode == 'jsonify' else '/api/appointments?format=ndjson'
+    start = time.perf_counter()
+    size = 0
+    response = app.test_client().get(url, buffered=False)
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    print(rows, size, elapsed, base, sampler.peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--mode', choices=('jsonify', 'ndjson'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        export(args.mode, args.rows)
+        return
+
+    print(f"{'mode':8} {'rows':>9} {'body':>9} {'time':>8} {'RSS before':>11} {'peak RSS':>9} {'export':>8}")
+    for mode in ('jsonify', 'ndjson'):
+        output = subprocess.run([sys.executable, __file__, '--mode', mode, '--rows', str(args.rows)],
+                                check=True, capture_output=True, text=True).stdout.split()
+        rows, size, elapsed, base, peak = int(output[0]), int(output[1]), *map(float, output[2:])
+        print(f"{mode:8} {rows:>9} {size / 1e6:>7.0f}MB {elapsed:>7.1f}s {base:>9.0f}MB "
+              f"{peak:>7.0f}MB {peak - base:>6.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
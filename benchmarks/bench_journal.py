@@ -0,0 +1,110 @@
+"""
+Benchmark: per-request write cost of journal mode vs full-file rewrite
+
+Fills a DataStore with N synthetic patients, then times requests that each
+register one patient and log one activity. In journal mode the cost of a
+request should stay flat as N grows; the legacy save_to_file() rewrite is
+timed alongside for comparison (up to --rewrite-max records).
+
+Usage:
+    python benchmarks/bench_journal.py [--sizes 1000,10000,100000,1000000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+from models.patient import Patient
+
+
+def make_patient_dict(i):
+    """Build a synthetic stored patient row"""
+    patient_id = str(uuid.uuid4())
+    return patient_id, {
+        'id': patient_id,
+        'medical_record_number': f"MRN-20250101-{i:08d}",
+        'name': f"Patient {i}",
+        'gender': 'male' if i % 2 else 'female',
+        'birth_date': '1980-01-01',
+        'address': 'Jl. Merdeka No. 1, Jakarta',
+        'phone': f"0812{i:08d}",
+        'id_number': f"3171{i:012d}",
+        'insurance_number': f"000{i:010d}",
+        'insurance_provider': 'BPJS',
+        'blood_type': 'O',
+        'allergies': [],
+        'emergency_contact': {},
+        'registration_date': datetime.now().isoformat()
+    }
+
+
+def fill(data_store, size):
+    """Fill the data store with synthetic patients"""
+    for i in range(size):
+        patient_id, patient = make_patient_dict(i)
+        data_store.patients[patient_id] = patient
+
+
+def simulate_request(data_store, i):
+    """One write request: a registration plus its activity log entry"""
+    data_store.log_activity({
+        'timestamp': datetime.now().isoformat(),
+        'endpoint': 'main_bp.add_patient',
+        'method': 'POST',
+        'ip': '127.0.0.1'
+    })
+    data_store.add_patient(Patient(name=f"New Patient {i}", gender='female', birth_date='1990-05-05'))
+    data_store.persist()
+
+
+def time_requests(data_store, requests):
+    """Average wall time per simulated request in microseconds"""
+    start = time.perf_counter()
+    for i in range(requests):
+        simulate_request(data_store, i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rewrite-max', type=int, default=100000,
+                        help='largest size to time the full-file rewrite for')
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'journal us/req':>15} {'rewrite us/req':>15}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            journal_store = DataStore(data_dir=os.path.join(workdir, 'data'),
+                                      journal_file=os.path.join(workdir, 'data.journal'),
+                                      journal_compact_bytes=1 << 40)
+            fill(journal_store, size)
+            journal_us = time_requests(journal_store, args.requests)
+            journal_store.journal.close()
+            del journal_store
+
+            rewrite_us = None
+            if size <= args.rewrite_max:
+                rewrite_store = DataStore(data_dir=os.path.join(workdir, 'rewrite'))
+                fill(rewrite_store, size)
+                # Full rewrites get slow quickly; a few requests are enough
+                rewrite_us = time_requests(rewrite_store, min(args.requests, 20))
+                del rewrite_store
+
+            rewrite = f"{rewrite_us:15.1f}" if rewrite_us is not None else f"{'skipped':>15}"
+            print(f"{size:>10} {journal_us:15.1f} {rewrite}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
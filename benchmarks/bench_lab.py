@@ -0,0 +1,106 @@
+"""
+Benchmark: laboratory worklist and result index vs rescanning history
+
+Fills a DataStore with growing numbers of synthetic lab requests (about 1%
+still active) and medical records with lab results, then times reading the
+worklist and one patient's trend of one test from the indexes against
+scanning every request and every medical record.
+
+Usage:
+    python benchmarks/bench_lab.py [--sizes 10000 100000 500000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+from models.lab_index import COMPLETED, LAB_PRIORITIES, is_active, test_key, worklist_entry
+
+TESTS = ('Hemoglobin', 'Leukosit', 'Trombosit', 'Glukosa', 'Kreatinin', 'Ureum', 'SGOT', 'SGPT')
+
+
+def build_collections(size):
+    """`size` lab requests and medical records spread over `size // 20` patients"""
+    rng = random.Random(42)
+    patients = max(size // 20, 1)
+    lab_requests, medical_records = {}, {}
+    for i in range(size):
+        day = f"202{rng.randint(0, 5)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        active = rng.random() < 0.01
+        lab_requests[f"request-{i}"] = {
+            'id': f"request-{i}", 'patient_id': f"patient-{i % patients}", 'doctor_id': 1,
+            'priority': rng.choice(LAB_PRIORITIES), 'requested_at': f"{day}T08:00:00",
+            'tests': [{'name': rng.choice(TESTS)}], 'status': 'pending' if active else COMPLETED,
+            'completed_at': None if active else f"{day}T11:00:00"}
+        medical_records[f"record-{i}"] = {
+            'id': f"record-{i}", 'patient_id': f"patient-{i % patients}", 'doctor_id': 1, 'visit_date': f"{day}T09:00:00",
+            'lab_results': [{'test_name': test, 'result': f"{rng.uniform(1, 200):.1f}", 'recorded_at': f"{day}T11:00:00"}
+                            for test in rng.sample(TESTS, 3)]}
+    return {'lab_requests': lab_requests, 'medical_records': medical_records}
+
+
+def scan_worklist(data_store):
+    """Active requests by scanning every request"""
+    active = [(worklist_entry(request_id, request), request) for request_id, request in data_store.items('lab_requests')
+              if is_active(request)]
+    active.sort(key=lambda item: item[0])
+    return [request for _, request in active]
+
+
+def scan_results(data_store, patient_id, test_name):
+    """One patient's results of one test by scanning every medical record"""
+    key = test_key(test_name)
+    results = [result for record in data_store.values('medical_records') if record.get('patient_id') == patient_id
+               for result in record.get('lab_results') or () if test_key(result.get('test_name')) == key]
+    results.sort(key=lambda result: result.get('recorded_at') or '')
+    return results
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'active':>7} {'worklist':>10} {'scan':>10} {'trend':>10} {'scan':>10}")
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            data_store = DataStore(data_dir=os.path.join(workdir, 'simrs_data'))
+            data_store.load_from_file()
+            for name, records in build_collections(size).items():
+                data_store.__dict__[name] = data_store._compact_collection(name, records)
+                data_store._build_indexes(name)
+            active = len(data_store.get_lab_worklist())
+            worklist_time = median_time(data_store.get_lab_worklist, args.repeat)
+            worklist_scan = median_time(lambda: scan_worklist(data_store), max(1, args.repeat // 10))
+            # A patient of build_collections, which spreads the records over size // 20 patients
+            patient_id = f"patient-{max(size // 20, 1) // 2}"
+            trend_time = median_time(lambda: data_store.get_lab_results(patient_id, 'hemoglobin'), args.repeat)
+            trend_scan = median_time(lambda: scan_results(data_store, patient_id, 'hemoglobin'),
+                                     max(1, args.repeat // 10))
+            print(f"{size:>10} {active:>7} {worklist_time * 1000:>8.2f}ms {worklist_scan * 1000:>8.1f}ms "
+                  f"{trend_time * 1000:>8.3f}ms {trend_scan * 1000:>8.1f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: vectorised lab result flagging vs flagging row by row
+
+Builds batches of synthetic analyser results (already normalised at
+ingest, as MedicalRecord.add_lab_result stores them), then times flagging
+each batch with flag_results (NumPy over the whole batch) against a
+per-result Python loop computing the same H/L, critical and delta flags.
+
+Usage:
+    python benchmarks/bench_lab_flags.py [--sizes 1000 10000 100000] [--repeat 10]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.lab_index import test_key
+from models.lab_results import (CRITICAL_LIMITS, DELTA_FRACTION, FLAG_CRITICAL_HIGH, FLAG_CRITICAL_LOW,
+                                FLAG_HIGH, FLAG_LOW, FLAG_NORMAL, flag_results, normalise_lab_result,
+                                normalised)
+
+TESTS = (('Hemoglobin', '12-16 g/dL', 14.0), ('Kalium', '3,5 s/d 5,0 mmol/L', 4.2),
+         ('Glukosa', '70-140 mg/dL', 100.0), ('Kreatinin', '0.6-1.2 mg/dL', 0.9),
+         ('Trombosit', '150.000-400.000 /uL', 250000.0), ('Kolesterol', '< 200 mg/dL', 180.0))
+
+
+def build_batch(size):
+    """`size` normalised results and the previous result of the same test for each"""
+    rng = random.Random(42)
+    results, previous = [], []
+    for _ in range(size):
+        test_name, reference_range, typical = rng.choice(TESTS)
+        value = round(typical * rng.uniform(0.3, 2.2), 2)
+        result = {'test_name': test_name, 'result': str(value), 'reference_range': reference_range}
+        result.update(normalise_lab_result(result['result'], reference_range))
+        results.append(result)
+        before = None
+        if rng.random() < 0.8:
+            before = {'test_name': test_name, 'value': round(typical * rng.uniform(0.5, 1.5), 2),
+                      'unit': result['unit'], 'reference_low': None, 'reference_high': None}
+        previous.append(before)
+    return results, previous
+
+
+def flag_one(result, before):
+    """Flags of one result, computed in plain Python"""
+    fields = normalised(result)
+    value, low, high = fields['value'], fields['reference_low'], fields['reference_high']
+    unit, critical_low, critical_high = CRITICAL_LIMITS.get(test_key(result.get('test_name')), (None, None, None))
+    if unit is not None and fields['unit'] and fields['unit'].lower() != unit:
+        critical_low = critical_high = None
+    flag = FLAG_NORMAL
+    if value is not None:
+        if low is not None and value < low:
+            flag = FLAG_LOW
+        if high is not None and value > high:
+            flag = FLAG_HIGH
+        if critical_low is not None and value <= critical_low:
+            flag = FLAG_CRITICAL_LOW
+        if critical_high is not None and value >= critical_high:
+            flag = FLAG_CRITICAL_HIGH
+    previous_value = normalised(before)['value'] if before else None
+    delta = (value is not None and previous_value not in (None, 0)
+             and abs(value - previous_value) / abs(previous_value) > DELTA_FRACTION)
+    return {'flag': flag, 'critical': flag in (FLAG_CRITICAL_LOW, FLAG_CRITICAL_HIGH), 'delta': delta,
+            'previous_value': previous_value}
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'results':>10} {'flagged':>8} {'vectorised':>12} {'per row':>10}")
+    for size in args.sizes:
+        results, previous = build_batch(size)
+        flags = flag_results(results, previous)
+        assert [item['flag'] for item in flags] == [flag_one(*pair)['flag'] for pair in zip(results, previous)]
+        flagged = sum(1 for item in flags if item['flag'])
+        vectorised_time = median_time(lambda: flag_results(results, previous), args.repeat)
+        row_time = median_time(lambda: [flag_one(*pair) for pair in zip(results, previous)], args.repeat)
+        print(f"{size:>10} {flagged:>8} {vectorised_time * 1000:>10.1f}ms {row_time * 1000:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
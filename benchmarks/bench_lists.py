@@ -0,0 +1,107 @@
+"""
+Benchmark: list page projections vs joining every row per request
+
+Fills a DataStore with growing numbers of synthetic medical records and
+bills, then times rendering the data of one list page (50 rows) from the
+maintained projections against the previous approach of iterating the
+collection, joining patient and doctor names for every row and sorting.
+
+Usage:
+    python benchmarks/bench_lists.py [--sizes 10000 100000 500000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+
+
+def build_collections(size):
+    """Patients, doctors, medical records and bills for `size` visits"""
+    rng = random.Random(42)
+    patients = {f"patient-{i}": {'id': f"patient-{i}", 'name': f"Pasien {i}", 'medical_record_number': f"MRN-{i:08d}"}
+                for i in range(max(size // 5, 1))}
+    users = {f"doctor-{i}": {'id': f"doctor-{i}", 'name': f"Dokter {i}", 'role': 'doctor'} for i in range(50)}
+    patient_ids, doctor_ids = list(patients), list(users)
+    medical_records, billing_records = {}, {}
+    for i in range(size):
+        day = f"202{rng.randint(0, 5)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        patient_id = rng.choice(patient_ids)
+        medical_records[f"record-{i}"] = {
+            'id': f"record-{i}", 'patient_id': patient_id, 'doctor_id': rng.choice(doctor_ids),
+            'visit_date': f"{day}T10:00:00", 'diagnosis': ['J06.9'], 'record_type': 'outpatient'}
+        billing_records[f"bill-{i}"] = {
+            'id': f"bill-{i}", 'patient_id': patient_id, 'total_amount': 150000.0, 'status': 'pending',
+            'issued_date': day}
+    return {'patients': patients, 'users': users, 'medical_records': medical_records,
+            'billing_records': billing_records}
+
+
+def join_page(data_store, page=1, per_page=50):
+    """One page of medical records the way the list view used to build it"""
+    records = []
+    for record_id, record in data_store.items('medical_records'):
+        patient_name = data_store.patients.get(record.get('patient_id'), {}).get('name', 'Unknown')
+        doctor_name = data_store.users.get(record.get('doctor_id'), {}).get('name', 'Unknown')
+        records.append({'id': record_id, 'patient_name': patient_name, 'doctor_name': doctor_name,
+                        'visit_date': record.get('visit_date'), 'diagnosis': record.get('diagnosis'),
+                        'record_type': record.get('record_type')})
+    records.sort(key=lambda record: record['visit_date'] or '', reverse=True)
+    offset = (page - 1) * per_page
+    return records[offset:offset + per_page]
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'build':>8} {'page 1':>10} {'page 100':>10} {'rename':>10} {'join+sort':>10}")
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            data_store = DataStore(data_dir=os.path.join(workdir, 'simrs_data'))
+            data_store.load_from_file()
+            for name, records in build_collections(size).items():
+                data_store.__dict__[name] = data_store._compact_collection(name, records)
+            start = time.perf_counter()
+            for name in ('medical_records', 'billing_records'):
+                data_store._build_indexes(name)
+                # Projections are built by their first page read
+                data_store.list_page(name, 1)
+            build_time = time.perf_counter() - start
+            first = median_time(lambda: data_store.list_page('medical_records', 1), args.repeat)
+            deep = median_time(lambda: data_store.list_page('medical_records', 100), args.repeat)
+            patient = dict(data_store.patients['patient-0'])
+
+            def rename():
+                patient['name'] = patient['name'] + 'x'
+                data_store._put('patients', 'patient-0', dict(patient))
+            rename_time = median_time(rename, args.repeat)
+            join_time = median_time(lambda: join_page(data_store), max(1, args.repeat // 10))
+            print(f"{size:>10} {build_time:>7.1f}s {first * 1000:>8.3f}ms {deep * 1000:>8.3f}ms "
+                  f"{rename_time * 1000:>8.3f}ms {join_time * 1000:>8.1f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: memory held by appointments as plain dicts vs compact records
+
+Loads the same synthetic appointments into a DataStore with plain record
+dicts and with compact records, and reports the memory each collection
+(including its indexes) keeps allocated, measured with tracemalloc.
+
+Usage:
+    python benchmarks/bench_memory.py [--appointments 1000000] [--patients 50000]
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+
+STATUSES = ('scheduled', 'completed', 'cancelled', 'no-show')
+
+
+def write_appointments(data_dir, appointments, patients):
+    """Write a synthetic appointments collection file"""
+    patient_ids = [str(uuid.uuid4()) for _ in range(patients)]
+    records = {}
+    for i in range(appointments):
+        appointment_id = str(uuid.uuid4())
+        day = f"2025-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}"
+        records[appointment_id] = {
+            'id': appointment_id, 'patient_id': patient_ids[i % patients], 'doctor_id': str(i % 40),
+            'department_id': str(i % 6 + 1), 'appointment_date': f"{day}T{8 + i % 9:02d}:00",
+            'appointment_time': f"{8 + i % 9:02d}:00", 'reason': 'Kontrol rutin',
+            'status': STATUSES[i % len(STATUSES)], 'notes': None,
+            'created_at': f"{day}T07:{i % 60:02d}:{i % 59:02d}.{i % 999999:06d}"}
+    os.makedirs(data_dir)
+    with open(os.path.join(data_dir, 'appointments.json'), 'w') as f:
+        json.dump(records, f)
+
+
+def measure(data_dir, compact_records):
+    """Load appointments and return (MB allocated, load seconds)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    data_store = DataStore(data_dir=data_dir, compact_records=compact_records)
+    data_store.load_from_file()
+    data_store.appointments
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 1e6, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--appointments', type=int, default=1000000)
+    parser.add_argument('--patients', type=int, default=50000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+    try:
+        data_dir = os.path.join(workdir, 'simrs_data')
+        write_appointments(data_dir, args.appointments, args.patients)
+        dict_mb, dict_time = measure(data_dir, False)
+        compact_mb, compact_time = measure(data_dir, True)
+        print(f"{args.appointments} appointments, {args.patients} patients")
+        print(f"{'':16} {'resident':>10} {'per record':>11} {'load':>8}")
+        for label, mb, elapsed in (('plain dicts', dict_mb, dict_time),
+                                   ('compact records', compact_mb, compact_time)):
+            print(f"{label:16} {mb:>8.0f}MB {mb * 1e6 / args.appointments:>9.0f} B {elapsed:>7.2f}s")
+        print(f"{'reduction':16} {1 - compact_mb / dict_mb:>10.0%}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
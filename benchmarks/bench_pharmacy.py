@@ -0,0 +1,93 @@
+"""
+Benchmark: pharmacy queue vs flattening every prescription
+
+Fills a DataStore with growing numbers of synthetic medical records whose
+older prescriptions are mostly dispensed, then times reading the first
+page of pending prescriptions from the pharmacy queue against flattening
+and sorting every prescription ever written, and times dispensing the
+prescription at the head of the queue.
+
+Usage:
+    python benchmarks/bench_pharmacy.py [--sizes 10000 100000 500000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+from models.prescription_queue import DISPENSED, PENDING, URGENCIES, prescription_status, queue_entry
+
+
+def build_medical_records(size):
+    """`size` medical records with one to three prescriptions each; about 2% still pending"""
+    rng = random.Random(42)
+    records = {}
+    for i in range(size):
+        day = f"202{rng.randint(0, 5)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        records[f"record-{i}"] = {
+            'id': f"record-{i}", 'patient_id': f"patient-{i % 1000}", 'doctor_id': 1, 'visit_date': f"{day}T10:00:00",
+            'prescriptions': [{'medication': f"Obat {j}", 'dosage': '500mg', 'frequency': '3x sehari',
+                               'urgency': rng.choice(URGENCIES), 'prescribed_at': f"{day}T10:0{j}:00",
+                               'status': PENDING if rng.random() < 0.02 else DISPENSED}
+                              for j in range(rng.randint(1, 3))]}
+    return records
+
+
+def scan_pending(data_store, per_page=50):
+    """First page of pending prescriptions by flattening every medical record"""
+    pending = [(queue_entry(record_id, position, prescription), prescription)
+               for record_id, record in data_store.items('medical_records')
+               for position, prescription in enumerate(record.get('prescriptions') or ())
+               if prescription_status(prescription) == PENDING]
+    pending.sort(key=lambda item: item[0])
+    return pending[:per_page]
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'pending':>8} {'queue page':>11} {'dispense':>10} {'scan':>10}")
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            data_store = DataStore(data_dir=os.path.join(workdir, 'simrs_data'))
+            data_store.load_from_file()
+            records = build_medical_records(size)
+            data_store.__dict__['medical_records'] = data_store._compact_collection('medical_records', records)
+            data_store._build_indexes('medical_records')
+            rows, pending = data_store.get_pending_prescriptions()
+            page_time = median_time(lambda: data_store.get_pending_prescriptions(), args.repeat)
+
+            def dispense_head():
+                row = data_store.get_pending_prescriptions(1, 1)[0][0]
+                data_store.set_prescription_status(row.record_id, row.position, DISPENSED)
+            dispense_time = median_time(dispense_head, args.repeat)
+            scan_time = median_time(lambda: scan_pending(data_store), max(1, args.repeat // 10))
+            print(f"{size:>10} {pending:>8} {page_time * 1000:>9.3f}ms {dispense_time * 1000:>8.3f}ms "
+                  f"{scan_time * 1000:>8.1f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
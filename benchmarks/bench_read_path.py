@@ -0,0 +1,98 @@
+"""
+Benchmark: /api/patients latency and allocations, model objects vs stored dicts
+
+Serves GET /api/patients from a DataStore with synthetic patients, once
+through the previous read path (a Patient object per row, converted back
+with __dict__) and once through the current one (stored dicts serialised
+directly), and reports latency and peak traced memory for each.
+
+Usage:
+    python benchmarks/bench_read_path.py [--patients 100000] [--repeat 5]
+"""
+import argparse
+import gc
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, g, jsonify
+
+from models.data_store import DataStore
+from models.patient import Patient
+from routes.api_routes import api_bp
+
+
+def build_app(data_dir, patients):
+    """Flask app serving the API blueprint from a data store with synthetic patients"""
+    data_store = DataStore(data_dir=data_dir)
+    data_store.load_from_file()
+    for i in range(patients):
+        patient_id = str(uuid.uuid4())
+        data_store.patients[patient_id] = {
+            'id': patient_id, 'medical_record_number': f"MRN-20250101-{i:08d}", 'name': f"Patient {i}",
+            'gender': 'female', 'birth_date': '1985-03-12', 'address': 'Jl. Merdeka 1, Jakarta',
+            'phone': f"0812{i:08d}", 'id_number': f"3171{i:012d}", 'insurance_number': f"{i:013d}",
+            'insurance_provider': 'BPJS', 'blood_type': 'O', 'allergies': [],
+            'emergency_contact': {}, 'registration_date': '2025-01-01T08:00:00'}
+
+    app = Flask(__name__)
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    @app.route('/legacy/patients')
+    def legacy_patients():
+        patients = [Patient(**p) for p in g.data_store.values('patients')]
+        return jsonify([p.__dict__ for p in patients])
+
+    @app.before_request
+    def before_request():
+        g.data_store = data_store
+
+    return app
+
+
+def measure(client, url, repeat):
+    """Return (median seconds, peak traced MB) for GET url"""
+    client.get(url)
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        client.get(url)
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    client.get(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--patients', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+    try:
+        client = build_app(os.path.join(workdir, 'simrs_data'), args.patients).test_client()
+        legacy_time, legacy_peak = measure(client, '/legacy/patients', args.repeat)
+        direct_time, direct_peak = measure(client, '/api/patients', args.repeat)
+        print(f"{args.patients} patients")
+        print(f"{'':24} {'latency':>10} {'peak alloc':>12}")
+        print(f"{'Patient objects':24} {legacy_time * 1000:>8.0f}ms {legacy_peak:>10.1f}MB")
+        print(f"{'stored dicts':24} {direct_time * 1000:>8.0f}ms {direct_peak:>10.1f}MB")
+        print(f"{'reduction':24} {1 - direct_time / legacy_time:>9.0%} {1 - direct_peak / legacy_peak:>11.0%}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
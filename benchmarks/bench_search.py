@@ -0,0 +1,101 @@
+"""
+Benchmark: patient search index vs a linear scan
+
+Fills a DataStore with growing numbers of synthetic patients with
+Indonesian names, then times building the search index and answering
+identifier (NIK, phone), exact name, name prefix and misspelt name
+queries from the index against a scan comparing every patient.
+
+Usage:
+    python benchmarks/bench_search.py [--sizes 10000 100000 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+
+FIRST_NAMES = ('Agus', 'Budi', 'Dewi', 'Eko', 'Fitri', 'Hendra', 'Indah', 'Joko', 'Kartika', 'Lestari',
+               'Muhammad', 'Nur', 'Putri', 'Rina', 'Sri', 'Teguh', 'Wahyu', 'Yanti', 'Siti', 'Bambang')
+LAST_NAMES = ('Santoso', 'Wijaya', 'Saputra', 'Hidayat', 'Kusuma', 'Pratama', 'Nugroho', 'Setiawan',
+              'Rahmawati', 'Susanto', 'Gunawan', 'Purnomo', 'Siregar', 'Nasution', 'Simanjuntak',
+              'Hutapea', 'Wibowo', 'Permana', 'Halim', 'Sukarno')
+SYLLABLES = ('ba', 'di', 'har', 'jo', 'ka', 'lu', 'man', 'ni', 'pur', 'ra', 'san', 'ti', 'wa', 'yu', 'sum')
+QUERIES = (('NIK', '3201000000012345'), ('phone', '+62 812-0001-2345'), ('exact name', 'Joko Santoso'),
+           ('prefix', 'siti nasu'), ('misspelt', 'Bambang Simanyuntak'))
+
+
+def build_patients(size):
+    """`size` synthetic patient records"""
+    rng = random.Random(42)
+    patients = {}
+    for i in range(size):
+        patient_id = f"patient-{i}"
+        patients[patient_id] = {
+            'id': patient_id, 'medical_record_number': f"MRN-{i:08d}",
+            'name': ' '.join((rng.choice(FIRST_NAMES), ''.join(rng.choices(SYLLABLES, k=3)).title(),
+                              rng.choice(LAST_NAMES))),
+            'id_number': f"3201{i:012d}", 'phone': f"0812{i:08d}", 'insurance_number': f"000{i:010d}"}
+    return patients
+
+
+def scan_search(data_store, query, limit=10):
+    """Search by comparing every patient's identifiers and lower-cased name"""
+    query = query.lower()
+    words = query.split()
+    results = []
+    for patient in data_store.values('patients'):
+        name = (patient.get('name') or '').lower()
+        if (query in (patient.get('id_number'), patient.get('phone'), patient.get('medical_record_number'))
+                or all(word in name for word in words)):
+            results.append(patient)
+            if len(results) >= limit:
+                break
+    return results
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            data_store = DataStore(data_dir=os.path.join(workdir, 'simrs_data'))
+            data_store.load_from_file()
+            data_store.__dict__['patients'] = data_store._compact_collection('patients', build_patients(size))
+            start = time.perf_counter()
+            data_store._build_indexes('patients')
+            print(f"{size} patients: index built in {time.perf_counter() - start:.1f}s")
+            print(f"{'query':>12} {'index':>10} {'scan':>10}  top match")
+            for label, query in QUERIES:
+                results = data_store.search_patients(query)
+                index_time = median_time(lambda: data_store.search_patients(query), args.repeat)
+                scan_time = median_time(lambda: scan_search(data_store, query), max(1, args.repeat // 10))
+                top = f"{results[0][0]['name']} ({results[0][2]})" if results else '-'
+                print(f"{label:>12} {index_time * 1000:>8.2f}ms {scan_time * 1000:>8.1f}ms  {top}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: worker startup time with lazy per-collection loading
+
+Writes a synthetic dataset both as the legacy single simrs_data.json file
+and as per-collection files, then compares parsing the whole legacy file
+with booting a DataStore and loading only the collections an
+appointments-only worker touches.
+
+Usage:
+    python benchmarks/bench_startup.py [--records 200000]
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+
+
+def build_dataset(records):
+    """Build synthetic collections of roughly `records` rows each"""
+    patients, appointments, medical_records, billing_records = {}, {}, {}, {}
+    patient_ids = []
+    for i in range(max(records // 4, 1)):
+        patient_id = str(uuid.uuid4())
+        patient_ids.append(patient_id)
+        patients[patient_id] = {'id': patient_id, 'name': f"Patient {i}", 'gender': 'female',
+                                'birth_date': '1985-03-12', 'phone': f"0812{i:08d}",
+                                'medical_record_number': f"MRN-20250101-{i:08d}"}
+    for i in range(records):
+        patient_id = patient_ids[i % len(patient_ids)]
+        day = f"2025-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}"
+        appointment_id = str(uuid.uuid4())
+        appointments[appointment_id] = {'id': appointment_id, 'patient_id': patient_id, 'doctor_id': 1,
+                                        'department_id': '1', 'appointment_date': f"{day}T09:00",
+                                        'reason': 'Kontrol rutin', 'status': 'completed'}
+        record_id = str(uuid.uuid4())
+        medical_records[record_id] = {'id': record_id, 'patient_id': patient_id, 'doctor_id': 1,
+                                      'visit_date': f"{day}T09:30", 'chief_complaint': 'Demam',
+                                      'diagnosis': ['J06.9'], 'treatment': 'Istirahat',
+                                      'prescriptions': [{'medication': 'Paracetamol', 'dosage': '500mg',
+                                                         'frequency': '3x1', 'duration': '3 hari'}],
+                                      'vitals': {'blood_pressure': '120/80', 'heart_rate': '80'},
+                                      'record_type': 'outpatient'}
+        bill_id = str(uuid.uuid4())
+        billing_records[bill_id] = {'id': bill_id, 'patient_id': patient_id, 'total_amount': 150000,
+                                    'items': [{'description': 'Konsultasi', 'quantity': 1,
+                                               'unit_price': 150000, 'total': 150000}],
+                                    'status': 'paid', 'issued_date': f"{day}T10:00"}
+    return {'patients': patients, 'appointments': appointments, 'medical_records': medical_records,
+            'billing_records': billing_records, 'users': {}, 'departments': {},
+            'pharmacy_inventory': {}, 'lab_requests': {}, 'radiology_requests': {},
+            'inpatients': {}, 'activities': []}
+
+
+def timed(func):
+    """Run func and return (result, seconds)"""
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=200000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+    try:
+        legacy_file = os.path.join(workdir, 'simrs_data.json')
+        data_dir = os.path.join(workdir, 'simrs_data')
+        data = build_dataset(args.records)
+        with open(legacy_file, 'w') as f:
+            json.dump(data, f)
+        del data
+        # Let the data store do the one-time migration into per-collection files
+        DataStore(data_dir=data_dir, data_file=legacy_file).load_from_file()
+
+        def load_legacy():
+            with open(legacy_file, 'r') as f:
+                return json.load(f)
+
+        _, legacy_time = timed(load_legacy)
+
+        data_store = DataStore(data_dir=data_dir, data_file=legacy_file)
+        _, boot_time = timed(data_store.load_from_file)
+        _, appointments_time = timed(lambda: data_store.get_appointments_by_date('2025-01-01'))
+        _, all_time = timed(lambda: [getattr(data_store, name) for name in
+                                     ('patients', 'medical_records', 'billing_records')])
+
+        print(f"legacy file size:            {os.path.getsize(legacy_file) / 1e6:8.1f} MB")
+        print(f"legacy eager load:           {legacy_time:8.3f} s")
+        print(f"lazy boot (load_from_file):  {boot_time:8.3f} s")
+        print(f"first /api/appointments:     {appointments_time:8.3f} s  (loads appointments only)")
+        print(f"loading remaining collections:{all_time:7.3f} s")
+        print(f"loaded collections: {', '.join(data_store.loaded_collections())}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
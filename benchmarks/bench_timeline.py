@@ -0,0 +1,100 @@
+"""
+Benchmark: patient timeline pages from the timeline indexes vs scanning
+
+Fills a DataStore with synthetic appointments, medical records (with
+prescriptions and lab results) and bills for many patients, then times
+reading the first page of one patient's timeline with the k-way merge
+of the per-patient timeline indexes against collecting the same events
+with full scans of the collections and sorting them.
+
+Usage:
+    python benchmarks/bench_timeline.py [--sizes 10000 100000 1000000] [--page 50] [--repeat 20]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+from models.timeline import TIMELINE_SOURCES, timeline_entries, timeline_event
+
+PATIENTS = 1000
+
+
+def build_store(data_dir, size):
+    """Data store with `size` records of each timeline collection spread over PATIENTS patients"""
+    data_store = DataStore(data_dir=data_dir)
+    data_store.load_from_file()
+    start = datetime(2020, 1, 1)
+    collections = {'appointments': {}, 'medical_records': {}, 'billing_records': {}}
+    for i in range(size):
+        patient_id = f"patient-{i % PATIENTS}"
+        when = (start + timedelta(minutes=37 * i)).isoformat()
+        collections['appointments'][f"a{i}"] = {'id': f"a{i}", 'patient_id': patient_id, 'doctor_id': '1',
+                                                'department_id': '1', 'appointment_date': when,
+                                                'status': 'completed'}
+        collections['medical_records'][f"m{i}"] = {
+            'id': f"m{i}", 'patient_id': patient_id, 'doctor_id': '1', 'visit_date': when,
+            'prescriptions': [{'medication': 'Paracetamol', 'prescribed_at': when}],
+            'lab_results': [{'test_name': 'Hb', 'result': '13', 'recorded_at': when}]}
+        collections['billing_records'][f"b{i}"] = {'id': f"b{i}", 'patient_id': patient_id, 'issued_date': when,
+                                                   'status': 'paid'}
+    for name, records in collections.items():
+        data_store.__dict__[name] = data_store._compact_collection(name, records)
+        data_store._build_indexes(name)
+    return data_store
+
+
+def scan_timeline(data_store, patient_id, limit):
+    """The first timeline page collected with full scans and a sort"""
+    events = []
+    for name in TIMELINE_SOURCES:
+        for record_id, record in data_store.items(name):
+            if record.get('patient_id') == patient_id:
+                events += [(entry, name, record) for entry in timeline_entries(name, record_id, record)]
+    events.sort(key=lambda event: (event[0][0], event[1]) + event[0][1:], reverse=True)
+    return [timeline_event(name, entry, record) for entry, name, record in events[:limit]]
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'events/patient':>15} {'timeline':>10} {'full scan':>10}")
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            data_store = build_store(os.path.join(workdir, 'simrs_data'), size)
+            # A patient holding records even when size < PATIENTS
+            patient_id = f"patient-{min(size, PATIENTS) // 2}"
+            events, _ = data_store.get_patient_timeline(patient_id, args.page)
+            assert events == scan_timeline(data_store, patient_id, args.page)
+            index_time = median_time(lambda: data_store.get_patient_timeline(patient_id, args.page), args.repeat)
+            scan_time = median_time(lambda: scan_timeline(data_store, patient_id, args.page),
+                                    max(1, args.repeat // 10))
+            print(f"{size * 3:>10} {size * 4 // PATIENTS:>15} {index_time * 1000:>8.2f}ms {scan_time * 1000:>8.1f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
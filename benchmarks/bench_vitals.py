@@ -0,0 +1,127 @@
+"""
+Benchmark: vitals series in typed arrays vs vitals dicts
+
+Builds inpatient stays with growing numbers of vitals readings, then
+compares the memory of the readings kept as dicts (as entered) with the
+VitalsLog arrays, times recording one more reading with add_vitals (which
+should not grow with the readings already taken), and times one patient's
+downsampled chart from the DataStore against parsing that patient's
+reading dicts.
+
+Usage:
+    python benchmarks/bench_vitals.py [--patients 50] [--readings 1000 5000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_store import DataStore
+from models.vitals import VitalsLog, chart_series, merge_series, vitals_readings
+
+
+def build_stays(patients, readings):
+    """Inpatient stays of `patients` patients with `readings` hourly vitals readings each"""
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1)
+    stays = {}
+    for p in range(patients):
+        vitals = []
+        for i in range(readings):
+            vitals.append({
+                'blood_pressure': f"{rng.randint(95, 160)}/{rng.randint(60, 100)}",
+                'heart_rate': str(rng.randint(55, 120)), 'temperature': f"{rng.uniform(36, 39.5):.1f}",
+                'respiratory_rate': str(rng.randint(12, 28)), 'oxygen_saturation': str(rng.randint(88, 100)),
+                'weight': f"{rng.uniform(45, 90):.1f}",
+                'recorded_at': (start + timedelta(hours=i)).isoformat()})
+        stays[f"patient-{p}"] = {'patient_id': f"patient-{p}", 'admission_date': start.isoformat(), 'vitals': vitals}
+    return stays
+
+
+def allocated(build):
+    """Bytes allocated by what `build` returns, and the result"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    size = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    tracemalloc.stop()
+    return size, result
+
+
+def scan_chart(stay, points):
+    """One patient's chart parsed from the stay's reading dicts"""
+    series = {}
+    for timestamp, values in vitals_readings('inpatients', stay):
+        for parameter, value in values.items():
+            times, parameter_values = series.setdefault(parameter, ([], []))
+            times.append(timestamp)
+            parameter_values.append(value)
+    return chart_series({parameter: merge_series([(np.array(times, dtype=np.uint32),
+                                                   np.array(values, dtype=np.float32))])
+                         for parameter, (times, values) in series.items()}, points)
+
+
+def median_time(func, repeat):
+    """Median seconds of `repeat` calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--patients', type=int, default=50)
+    parser.add_argument('--readings', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--points', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'readings':>10} {'dicts':>10} {'arrays':>10} {'B/reading':>10} {'add':>10} {'chart':>10} {'scan':>10}")
+    for readings in args.readings:
+        workdir = tempfile.mkdtemp(prefix='simrs-bench-')
+        try:
+            total = args.patients * readings
+            dict_bytes, stays = allocated(lambda: build_stays(args.patients, readings))
+
+            def build_log():
+                log = VitalsLog()
+                for patient_id, stay in stays.items():
+                    for timestamp, values in vitals_readings('inpatients', stay):
+                        log.append(patient_id, timestamp, values)
+                return log
+            array_bytes, log = allocated(build_log)
+
+            data_store = DataStore(data_dir=os.path.join(workdir, 'simrs_data'))
+            data_store.load_from_file()
+            data_store.__dict__['inpatients'] = {patient_id: {key: value for key, value in stay.items() if key != 'vitals'}
+                                                 for patient_id, stay in stays.items()}
+            data_store._build_indexes('inpatients')
+            data_store.__dict__['vitals'] = log
+            patient_id = f"patient-{args.patients // 2}"
+            reading = dict(stays[patient_id]['vitals'][-1])
+            add_time = median_time(lambda: data_store.add_vitals(patient_id, reading), args.repeat)
+            chart_time = median_time(lambda: chart_series(data_store.get_vitals(patient_id), args.points),
+                                     args.repeat)
+            scan_time = median_time(lambda: scan_chart(stays[patient_id], args.points), max(1, args.repeat // 10))
+            print(f"{total:>10} {dict_bytes / 2 ** 20:>8.1f}MB {array_bytes / 2 ** 20:>8.1f}MB "
+                  f"{array_bytes / total:>10.1f} {add_time * 1e6:>8.1f}us {chart_time * 1000:>8.2f}ms "
+                  f"{scan_time * 1000:>8.1f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
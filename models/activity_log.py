@@ -0,0 +1,86 @@
+"""
+Bounded activity log for the DataStore
+"""
+import threading
+from collections import deque
+from itertools import islice
+from queue import Empty, SimpleQueue
+
+
+class ActivityLog:
+    """
+    Ring buffer of the most recent `retention` activities.
+    Request threads only put activities on a SimpleQueue, which takes no
+    lock and copies nothing. Readers move queued activities into the buffer
+    (in memory only); drain() also hands the activities not yet ingested to
+    `on_ingest` (e.g. to journal them), and is left to the DataStore's
+    flusher so request threads never write to disk.
+    Lock order: drain lock, then the caller's locks, then the buffer lock.
+    """
+    def __init__(self, activities=(), retention=100, on_ingest=None):
+        self.retention = retention
+        self.on_ingest = on_ingest
+        self._entries = deque(activities, maxlen=retention)
+        self._pending = SimpleQueue()
+        # Activities moved into the buffer but not yet passed to on_ingest, oldest first
+        self._uningested = []
+        self._drain_lock = threading.Lock()
+        self._entries_lock = threading.Lock()
+
+    def append(self, activity):
+        """Queue an activity for the log"""
+        self._pending.put(activity)
+
+    def _collect(self):
+        """Move queued activities into the buffer (the caller holds the buffer lock)"""
+        batch = []
+        try:
+            while True:
+                batch.append(self._pending.get_nowait())
+        except Empty:
+            pass
+        self._entries.extend(batch)
+        if self.on_ingest is not None:
+            self._uningested.extend(batch)
+
+    def drain(self):
+        """Pass the activities not yet ingested to on_ingest and return how many were passed"""
+        with self._drain_lock:
+            with self._entries_lock:
+                self._collect()
+                batch, self._uningested = self._uningested, []
+            if batch:
+                self.on_ingest(batch)
+            return len(batch)
+
+    def pending(self):
+        """Number of activities waiting for drain()"""
+        return self._pending.qsize() + len(self._uningested)
+
+    def hold(self):
+        """Block ingestion while held (e.g. while a snapshot is captured)"""
+        return self._drain_lock
+
+    def recent(self, limit=None):
+        """Get up to `limit` activities, newest first"""
+        with self._entries_lock:
+            self._collect()
+            return list(islice(reversed(self._entries), limit))
+
+    def snapshot(self):
+        """Copy the buffered activities already ingested, oldest first"""
+        with self._entries_lock:
+            self._collect()
+            entries = list(self._entries)
+            # The rest are persisted by the next drain()
+            return entries[:max(len(entries) - len(self._uningested), 0)]
+
+    def __iter__(self):
+        with self._entries_lock:
+            self._collect()
+            return iter(list(self._entries))
+
+    def __len__(self):
+        with self._entries_lock:
+            self._collect()
+            return len(self._entries)
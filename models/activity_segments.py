@@ -0,0 +1,194 @@
+"""
+On-disk activity (audit) log kept as rotating NDJSON segment files
+"""
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from models.persistence import COMPRESSIONS
+
+SEGMENT_PREFIX = 'activities-'
+
+# Rotated segments are named after their sequence number and the compact
+# timestamps (YYYYMMDDTHHMMSS) of their first and last activity, so time
+# range queries can skip them without opening them
+_ROTATED = re.compile(r'^activities-(\d+)-(\d{8}T\d{6})_(\d{8}T\d{6})\.ndjson(\.\w+)?$')
+_ACTIVE = re.compile(r'^activities-(\d+)\.ndjson$')
+
+
+def _compact_time(timestamp, end=False):
+    """
+    Compact, sortable form (YYYYMMDDTHHMMSS) of an ISO timestamp or date;
+    with `end`, missing parts are filled in as the end of the period.
+    """
+    compact = timestamp[:19].replace('-', '').replace(':', '')
+    if len(compact) <= 8:
+        compact = compact[:8] + 'T'
+    return compact.ljust(15, '9' if end else '0')
+
+
+def list_segments(directory):
+    """(seq, first, last, path) of the segment files, oldest first; the active one has no bounds"""
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        match = _ROTATED.match(name)
+        if match:
+            segments.append((int(match.group(1)), match.group(2), match.group(3), os.path.join(directory, name)))
+            continue
+        match = _ACTIVE.match(name)
+        if match:
+            segments.append((int(match.group(1)), None, None, os.path.join(directory, name)))
+    return sorted(segments)
+
+
+class ActivitySegments:
+    """
+    Appends activities as NDJSON lines to an active segment file, which is
+    compressed and renamed once it reaches `max_bytes` or is older than
+    `max_seconds`. The full history is kept on disk; only a small tail is
+    read back into memory on start.
+    """
+    def __init__(self, directory, max_bytes=8 * 1024 * 1024, max_seconds=3600, compression='gzip'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        try:
+            self.suffix, factory = COMPRESSIONS[compression]
+            self._compress = factory()[0]
+        except (ImportError, KeyError) as e:
+            logging.warning(f"Activity compression {compression} not available ({str(e)}), using gzip")
+            compression = 'gzip'
+            self.suffix, factory = COMPRESSIONS[compression]
+            self._compress = factory()[0]
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._opened_at = None
+        self._first = None
+        self._last = None
+        self._seq = None
+
+    def _active_path(self):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._seq:08d}.ndjson")
+
+    def _open(self):
+        """Open the active segment, continuing one left over from a previous run"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self._seq is None:
+            segments = list_segments(self.directory)
+            self._seq = segments[-1][0] if segments else 0
+            if segments and segments[-1][1] is not None:
+                self._seq += 1
+        path = self._active_path()
+        if os.path.exists(path):
+            lines = list(_read_lines(path))
+            if lines:
+                self._first = json.loads(lines[0]).get('timestamp')
+                self._last = json.loads(lines[-1]).get('timestamp')
+        # Binary, so the size and tell() count the bytes that get compressed
+        self._file = open(path, 'ab')
+        self._size = self._file.tell()
+        self._opened_at = time.monotonic()
+
+    def write(self, activities):
+        """Append a batch of activities to the active segment"""
+        with self._lock:
+            if self._file is None:
+                self._open()
+            elif self._size >= self.max_bytes or time.monotonic() - self._opened_at >= self.max_seconds:
+                self._rotate()
+                self._open()
+            encoded = ''.join(json.dumps(activity, separators=(',', ':')) + '\n'
+                              for activity in activities).encode('utf-8')
+            self._file.write(encoded)
+            self._file.flush()
+            self._size += len(encoded)
+            now = datetime.now().isoformat()
+            if self._first is None:
+                self._first = activities[0].get('timestamp') or now
+            self._last = activities[-1].get('timestamp') or now
+
+    def _rotate(self):
+        """Compress the active segment under its final name and start the next one"""
+        self._file.close()
+        self._file = None
+        path = self._active_path()
+        if self._size:
+            first, last = _compact_time(self._first), _compact_time(self._last)
+            rotated = os.path.join(self.directory,
+                                   f"{SEGMENT_PREFIX}{self._seq:08d}-{first}_{last}.ndjson{self.suffix}")
+            with open(path, 'rb') as f:
+                data = self._compress(f.read())
+            with open(rotated + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(rotated + '.tmp', rotated)
+            logging.info(f"Rotated activity segment {os.path.basename(rotated)}")
+        os.remove(path)
+        self._seq += 1
+        self._first = self._last = None
+
+    def close(self):
+        """Close the active segment; it is continued on the next start"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def tail(self, limit):
+        """Get the last `limit` activities, oldest first, reading only the newest segments"""
+        tail = []
+        if limit <= 0:
+            return tail
+        for _, _, _, path in reversed(list_segments(self.directory)):
+            tail = [json.loads(line) for line in _read_lines(path)][-(limit - len(tail)):] + tail
+            if len(tail) >= limit:
+                break
+        return tail
+
+
+def _read_lines(path):
+    """Iterate over the lines of a (possibly compressed) segment file"""
+    for suffix, factory in COMPRESSIONS.values():
+        if suffix and path.endswith(suffix):
+            with open(path, 'rb') as f:
+                raw = factory()[1](f.read())
+            yield from io.StringIO(raw.decode('utf-8'))
+            return
+    with open(path, encoding='utf-8') as f:
+        yield from f
+
+
+def query_segments(directory, endpoint=None, ip=None, method=None, start=None, end=None):
+    """
+    Yield the logged activities matching all given filters, oldest first.
+    `start` and `end` are inclusive ISO timestamps or dates (an end date
+    covers the whole day); segments outside the range are skipped by name,
+    and only one segment is held in memory at a time.
+    """
+    end_bound = end + '\uffff' if end else None
+    for _, first, last, path in list_segments(directory):
+        if first is not None:
+            if start and last < _compact_time(start):
+                continue
+            if end and first > _compact_time(end, end=True):
+                continue
+        for line in _read_lines(path):
+            if not line.strip():
+                continue
+            activity = json.loads(line)
+            timestamp = activity.get('timestamp') or ''
+            if ((endpoint and activity.get('endpoint') != endpoint)
+                    or (ip and activity.get('ip') != ip)
+                    or (method and activity.get('method') != method)
+                    or (start and timestamp < start)
+                    or (end_bound and timestamp > end_bound)):
+                continue
+            yield activity
@@ -0,0 +1,130 @@
+"""
+Visit aggregates kept as NumPy count matrices for the dashboard
+"""
+from datetime import date
+
+import numpy as np
+
+from models.indexes import appointment_day
+
+# Appointments with these statuses are not counted as visits
+EXCLUDED_STATUSES = frozenset({'cancelled'})
+
+# Days covered by a visit matrix (past days plus any future days already booked)
+VISIT_WINDOW_DAYS = 732
+
+
+class VisitMatrix:
+    """
+    Ring buffer of appointment counts per day and key (e.g. department_id).
+    Row `ordinal % window` holds one calendar day, whose ordinal is kept in
+    `_days`; a later day mapping onto the same row clears it, so the matrix
+    always covers the latest `window` days and never grows with the
+    history. Each key gets a column the first time it is seen. Sums over any
+    day range, per key or per weekday, are single vectorised reductions.
+    """
+    def __init__(self, key_field, window=VISIT_WINDOW_DAYS):
+        self.key_field = key_field
+        self.window = window
+        self._ordinals = {}
+        self._reset()
+
+    def _reset(self):
+        self._days = np.full(self.window, -1, dtype=np.int64)
+        self._counts = np.zeros((self.window, 8), dtype=np.int32)
+        self._columns = {}
+
+    def _ordinal(self, record):
+        """Day ordinal of a counted appointment, or None"""
+        if record.get('status') in EXCLUDED_STATUSES:
+            return None
+        day = appointment_day(record)
+        if not day:
+            return None
+        ordinal = self._ordinals.get(day)
+        if ordinal is None:
+            try:
+                ordinal = date.fromisoformat(day).toordinal()
+            except ValueError:
+                return None
+            self._ordinals[day] = ordinal
+        return ordinal
+
+    def _column(self, key):
+        """Column of a key, adding one (and growing the matrix) if needed"""
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[key] = len(self._columns)
+            if column == self._counts.shape[1]:
+                self._counts = np.hstack([self._counts, np.zeros_like(self._counts)])
+        return column
+
+    def add(self, record_id, record):
+        """Count an appointment"""
+        ordinal = self._ordinal(record)
+        if ordinal is None:
+            return
+        row = ordinal % self.window
+        held = self._days[row]
+        if held != ordinal:
+            if held > ordinal:
+                return  # older than the window
+            self._counts[row] = 0
+            self._days[row] = ordinal
+        self._counts[row, self._column(record.get(self.key_field))] += 1
+
+    def remove(self, record_id, record):
+        """Stop counting an appointment"""
+        ordinal = self._ordinal(record)
+        if ordinal is None:
+            return
+        row = ordinal % self.window
+        column = self._columns.get(record.get(self.key_field))
+        if column is not None and self._days[row] == ordinal and self._counts[row, column]:
+            self._counts[row, column] -= 1
+
+    def _rows(self, start=None, end=None):
+        """Mask of the rows holding days in the inclusive range [start, end] (dates)"""
+        mask = self._days >= (start.toordinal() if start else 0)
+        if end:
+            mask &= self._days <= end.toordinal()
+        return mask
+
+    def totals(self, start=None, end=None):
+        """Get the counts per key over a day range"""
+        sums = self._counts[self._rows(start, end)].sum(axis=0)
+        return {key: int(sums[column]) for key, column in self._columns.items()}
+
+    def weekday_totals(self, start=None, end=None, key=None):
+        """Get the counts per weekday (Monday first) over a day range, optionally for one key"""
+        mask = self._rows(start, end)
+        if key is None:
+            counts = self._counts[mask].sum(axis=1)
+        elif key in self._columns:
+            counts = self._counts[mask, self._columns[key]]
+        else:
+            return [0] * 7
+        # Ordinal 1 (0001-01-01) is a Monday
+        weekdays = (self._days[mask] - 1) % 7
+        return np.bincount(weekdays, weights=counts, minlength=7).astype(int).tolist()
+
+    def rebuild(self, records):
+        """Rebuild the counts from a collection dict"""
+        self._reset()
+        ordinals, columns = [], []
+        for record in records.values():
+            ordinal = self._ordinal(record)
+            if ordinal is not None:
+                ordinals.append(ordinal)
+                columns.append(self._column(record.get(self.key_field)))
+        if not ordinals:
+            return
+        ordinals = np.array(ordinals, dtype=np.int64)
+        columns = np.array(columns, dtype=np.int64)
+        rows = ordinals % self.window
+        # Each row keeps its latest day; counts for older days on that row are dropped
+        np.maximum.at(self._days, rows, ordinals)
+        kept = self._days[rows] == ordinals
+        width = self._counts.shape[1]
+        self._counts += np.bincount(rows[kept] * width + columns[kept],
+                                    minlength=self.window * width).reshape(self.window, width).astype(np.int32)
@@ -0,0 +1,135 @@
+"""
+Compact in-memory representation for DataStore records
+"""
+import inspect
+import sys
+from collections.abc import Mapping
+
+# Low-cardinality and id fields whose string values are interned, so every
+# record holding e.g. status "scheduled" or a given patient_id shares one object
+INTERNED_FIELDS = frozenset({
+    'id', 'patient_id', 'doctor_id', 'department_id', 'visit_id', 'head_doctor_id',
+    'status', 'gender', 'record_type', 'visit_type', 'role', 'blood_type',
+    'insurance_provider', 'payment_method', 'specialization', 'appointment_time'
+})
+
+
+class CompactRecord(Mapping):
+    """
+    Slotted, fixed-schema replacement for a stored record dict.
+    Every model field has its own slot (an unset slot means the key is
+    absent); keys outside the schema go to a small overflow dict. Records
+    behave like read-only dicts, so existing callers keep working.
+    Subclasses come from compact_class(), which generates the schema's
+    from_dict(data) classmethod and to_dict() method.
+    """
+    __slots__ = ('_extra',)
+    _slots = {}
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            try:
+                return slot.__get__(self)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        slot = self._slots.get(key)
+        if slot is not None:
+            try:
+                return slot.__get__(self)
+            except AttributeError:
+                return default
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __iter__(self):
+        for field, slot in self._slots.items():
+            try:
+                slot.__get__(self)
+            except AttributeError:
+                continue
+            yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # Pickle as a plain dict so snapshot files do not depend on this class
+        return dict, (self.to_dict(),)
+
+
+_compact_classes = {}
+
+
+def _schema_methods(slot_names):
+    """
+    Generate from_dict/to_dict for a schema as straight-line code (the way
+    collections.namedtuple builds its methods); looping over the slots
+    generically is several times slower when loading large collections.
+    """
+    from_dict = ['def from_dict(cls, data):', '    record = _new(cls)', '    found = 0']
+    to_dict = ['def to_dict(self):', '    data = {}']
+    for field, slot in slot_names.items():
+        value = '_intern(value) if type(value) is str else value' if field in INTERNED_FIELDS else 'value'
+        from_dict += [f'    value = data.get({field!r}, _MISSING)',
+                      '    if value is not _MISSING:',
+                      f'        record.{slot} = {value}',
+                      '        found += 1']
+        to_dict += ['    try:',
+                    f'        data[{field!r}] = self.{slot}',
+                    '    except AttributeError:',
+                    '        pass']
+    from_dict += ['    record._extra = ({key: value for key, value in data.items() if key not in _fields}',
+                  '                     if len(data) > found else None)',
+                  '    return record']
+    to_dict += ['    if self._extra:',
+                '        data.update(self._extra)',
+                '    return data']
+    namespace = {'_new': object.__new__, '_intern': sys.intern, '_MISSING': object(),
+                 '_fields': frozenset(slot_names)}
+    exec('\n'.join(from_dict + to_dict), namespace)
+    return classmethod(namespace['from_dict']), namespace['to_dict']
+
+
+def compact_class(model):
+    """
+    Get the compact record class for a model, with one slot per field of
+    the model's constructor. Fields that clash with the Mapping API (e.g. a
+    bill's `items`) get a slot with a trailing underscore instead.
+    """
+    cls = _compact_classes.get(model)
+    if cls is None:
+        fields = [name for name in inspect.signature(model.__init__).parameters
+                  if name not in ('self', 'kwargs')]
+        slot_names = {field: f"{field}_" if hasattr(CompactRecord, field) else field for field in fields}
+        from_dict, to_dict = _schema_methods(slot_names)
+        cls = type(f"Compact{model.__name__}", (CompactRecord,),
+                   {'__slots__': tuple(slot_names.values()), 'from_dict': from_dict, 'to_dict': to_dict})
+        cls._slots = {field: cls.__dict__[slot] for field, slot in slot_names.items()}
+        _compact_classes[model] = cls
+    return cls
+
+
+def compact(model, record):
+    """Convert a record dict to the compact representation of a model"""
+    if isinstance(record, CompactRecord):
+        return record
+    return compact_class(model).from_dict(record)
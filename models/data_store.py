@@ -1,6 +1,11 @@
 import json
 import os
+import sys
 import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from models.patient import Patient
 from models.appointment import Appointment
@@ -8,26 +13,193 @@ from models.medical_record import MedicalRecord
 from models.user import User
 from models.department import Department
 from models.billing import BillingRecord
+from models.indexes import (GroupIndex, DayIndex, SortedIndex, CountIndex, patient_key, inpatient_key,
+                            appointment_day, inpatient_status, user_role, field_key)
+from models.aggregates import VisitMatrix
+from models.search import PatientSearchIndex
+from models.projections import JOIN_FIELDS, JOINED_NAME_FIELDS, PROJECTIONS, ListProjection, prescription_rows
+from models.prescription_queue import DISPENSED, STATUS_TRANSITIONS, PrescriptionQueue, prescription_status
+from models.lab_index import COMPLETED, LAB_FINAL_STATUSES, LabResultIndex, LabWorklist, test_key, worklist_row
+from models.lab_results import flag_results
+from models.vitals import (VITAL_PARAMETERS, VITALS_SOURCES, VitalsIndex, VitalsLog, merge_series, parse_vitals,
+                           to_timestamp)
+from models.timeline import TIMELINE_SOURCES, TimelineIndex, merge_timelines, timeline_event
+from models.duplicates import DUPLICATE_THRESHOLD, DuplicateIndex, match_score, score_pairs
+from models.activity_log import ActivityLog
+from models.activity_segments import ActivitySegments
+from models.journal import Journal
+from models.locking import RWLock
+from models.views import views
+from models.compact import compact, compact_class
+from models.persistence import WriteBehindFlusher, CollectionFiles
+
+# Record collections persisted by the data store (activities are kept separately)
+COLLECTIONS = ('patients', 'appointments', 'medical_records', 'users', 'departments',
+               'billing_records', 'pharmacy_inventory', 'lab_requests',
+               'radiology_requests', 'inpatients')
+
+# Collections that keep a patient_id -> record ids index
+PATIENT_INDEXED_COLLECTIONS = ('appointments', 'medical_records', 'billing_records',
+                               'lab_requests', 'radiology_requests', 'inpatients')
+
+# Collections whose names are shown in list rows of other collections
+JOINED_COLLECTIONS = frozenset(JOIN_FIELDS.values())
+
+# Sort orders available for cursor pagination (the first is the default)
+PAGE_SORTS = {'patients': ('registration_date', 'name'),
+              'appointments': ('appointment_date',),
+              'medical_records': ('visit_date',)}
+
+# Fields pages can be filtered on; each is backed by a partition of the sorted indexes
+PAGE_FILTERS = {'patients': ('gender', 'insurance_provider'),
+                'appointments': ('status', 'department_id', 'doctor_id', 'patient_id'),
+                'medical_records': ('doctor_id', 'patient_id', 'record_type')}
+
+# Collections kept in memory as compact records of their model
+COMPACT_MODELS = {'patients': Patient, 'appointments': Appointment, 'medical_records': MedicalRecord,
+                  'billing_records': BillingRecord, 'users': User, 'departments': Department}
+
+class LazyCollection:
+    """
+    Collection attribute that is loaded from disk on first access.
+    Once loaded the collection lives in the instance __dict__, so later
+    attribute lookups bypass this descriptor entirely.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, data_store, owner=None):
+        if data_store is None:
+            return self
+        return data_store._load_collection(self.name)
 
 class DataStore:
     """
     In-memory data storage for SIMRS application
     Acts as a replacement for a SQL database
     """
-    def __init__(self):
-        self.patients = {}
-        self.appointments = {}
-        self.medical_records = {}
-        self.users = {}
-        self.departments = {}
-        self.billing_records = {}
-        self.pharmacy_inventory = {}
-        self.lab_requests = {}
-        self.radiology_requests = {}
-        self.inpatients = {}
-        self.activities = []
+    patients = LazyCollection()
+    appointments = LazyCollection()
+    medical_records = LazyCollection()
+    users = LazyCollection()
+    departments = LazyCollection()
+    billing_records = LazyCollection()
+    pharmacy_inventory = LazyCollection()
+    lab_requests = LazyCollection()
+    radiology_requests = LazyCollection()
+    inpatients = LazyCollection()
+    activities = LazyCollection()
+    # Vitals readings of inpatient stays, as typed arrays (see VitalsLog)
+    vitals = LazyCollection()
+
+    def __init__(self, data_dir='simrs_data', data_file='simrs_data.json', journal_file=None,
+                 journal_compact_bytes=8 * 1024 * 1024, codec='json', compression='none',
+                 compact_records=True, verify_counters=False, activity_retention=100,
+                 activity_dir=None, activity_segment_bytes=8 * 1024 * 1024, activity_segment_seconds=3600,
+                 activity_compression='gzip'):
         self._initialized = False
-        self.data_file = 'simrs_data.json'
+        # Number of most recent activities kept in the activity log
+        self.activity_retention = activity_retention
+        # Optional audit trail: with an activity_dir, every activity is
+        # streamed to rotating NDJSON segments there instead of being kept
+        # in the snapshot, and only the in-memory tail is read back on start
+        self.activity_segments = (ActivitySegments(activity_dir, activity_segment_bytes,
+                                                   activity_segment_seconds, activity_compression)
+                                  if activity_dir else None)
+        # Cross-check the dashboard counters against a full recount on every read
+        self.verify_counters = verify_counters
+        # Keep core model records as slotted compact records instead of dicts
+        self.compact_records = compact_records
+        # One file per collection under data_dir; data_file is the legacy
+        # single-file snapshot, migrated into data_dir on first start
+        self.storage = CollectionFiles(data_dir, codec, compression)
+        self.data_file = data_file
+        self._load_lock = threading.RLock()
+        self._journal_tail = {}
+
+        # Readers share the lock, writers hold it briefly. Stored records are
+        # never modified in place (_put replaces them), so a shallow copy taken
+        # under the read lock is a consistent view that can be serialised
+        # without holding any lock. Lock order: store lock, then journal locks.
+        self._lock = RWLock()
+
+        # Optional append-only journal; when enabled, mutations are appended
+        # to it and full snapshots are only written by compaction
+        self.journal = Journal(journal_file) if journal_file else None
+        self.journal_compact_bytes = journal_compact_bytes
+        self._compaction_lock = threading.Lock()
+
+        # Dirty tracking for write-behind persistence. Activities alone do not
+        # trigger a flush; they are written with the next flush of real data
+        # or at shutdown, so read-only traffic rewrites no collection files.
+        # Only the audit segments (activity_dir) are appended while idle.
+        self._dirty = set()
+        self._dirty_since = None
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Write-behind flush interval (None: flush at the end of each request).
+        # The flusher thread is started by the first change in each process,
+        # since threads do not survive a fork (e.g. gunicorn --preload).
+        self._flush_interval = None
+        self._flusher = None
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        self._persistence_metrics = {
+            'flushes': 0,
+            'bytes_written': 0,
+            'writes_by_collection': {},
+            'last_flush_at': None,
+            'last_flush_lag': None,
+            'max_flush_lag': 0.0
+        }
+
+        # Secondary indexes for patient-scoped lookups
+        self._patient_indexes = {
+            name: GroupIndex(inpatient_key if name == 'inpatients' else patient_key)
+            for name in PATIENT_INDEXED_COLLECTIONS
+        }
+        self._appointment_days = DayIndex(appointment_day)
+        # Per-patient event lists behind the patient timeline
+        self._timelines = {
+            name: TimelineIndex(name, inpatient_key if name == 'inpatients' else patient_key)
+            for name in TIMELINE_SOURCES
+        }
+        # Sorted indexes for cursor pagination: collection -> sort field -> index
+        self._sorted_indexes = {
+            name: {field: SortedIndex(field_key(field), PAGE_FILTERS[name]) for field in sorts}
+            for name, sorts in PAGE_SORTS.items()
+        }
+        # Counters behind the dashboard, kept up to date on every write.
+        # Today's appointments come from the day index, so "today" rolls
+        # over with the date and needs no reset.
+        self._count_indexes = {
+            'inpatients': CountIndex(inpatient_status),
+            'users': CountIndex(user_role)
+        }
+        # Per-day visit counts by department and by doctor
+        self._visit_matrices = {field: VisitMatrix(field) for field in ('department_id', 'doctor_id')}
+        # Pre-joined, sorted rows of the list pages
+        self._projections = {name: ListProjection(row_func, self._lookup)
+                             for name, (_, row_func) in PROJECTIONS.items()}
+        # Pharmacy work queue of pending prescriptions
+        self._prescription_queue = PrescriptionQueue()
+        # Laboratory worklist and lab results by patient and test
+        self._lab_worklist = LabWorklist()
+        self._lab_results = LabResultIndex(patient_key)
+        # Vital sign series by patient and parameter of the medical records
+        self._vitals = {
+            name: VitalsIndex(name, patient_key)
+            for name in VITALS_SOURCES
+        }
+        # Patient lookup by identifier or name
+        self._patient_search = PatientSearchIndex()
+        # Blocking index for duplicate patient detection
+        self._patient_duplicates = DuplicateIndex()
+
+        # Change counters for conditional requests (ETags). The epoch makes
+        # versions from different processes or restarts never look alike.
+        self._epoch = uuid.uuid4().hex[:8]
+        self._versions = {name: 0 for name in COLLECTIONS + ('activities', 'vitals')}
 
     def is_initialized(self):
         return self._initialized
@@ -50,7 +222,7 @@ class DataStore:
             Department(id=6, name="Internal Medicine", code="INT")
         ]
         for dept in departments:
-            self.departments[dept.id] = dept.__dict__
+            self._put('departments', dept.id, dept.__dict__)
 
     def _create_default_users(self):
         """Create default users (doctors, staff)"""
@@ -60,13 +232,362 @@ class DataStore:
             User(id=3, username="admin", name="Admin", role="admin", department_id=None)
         ]
         for user in users:
-            self.users[user.id] = user.__dict__
+            self._put('users', user.id, user.__dict__)
+
+    def _index_record(self, collection, record_id, record):
+        """Add a record to the secondary indexes of its collection"""
+        index = self._patient_indexes.get(collection)
+        if index is not None:
+            index.add(record_id, record)
+        timeline = self._timelines.get(collection)
+        if timeline is not None:
+            timeline.add(record_id, record)
+        vitals = self._vitals.get(collection)
+        if vitals is not None:
+            vitals.add(record_id, record)
+        if collection == 'patients':
+            self._patient_search.add(record_id, record)
+            self._patient_duplicates.add(record_id, record)
+        if collection == 'medical_records':
+            self._prescription_queue.add(record_id, record)
+            self._lab_results.add(record_id, record)
+        if collection == 'lab_requests':
+            self._lab_worklist.add(record_id, record)
+        if collection == 'appointments':
+            self._appointment_days.add(record_id, record)
+            for matrix in self._visit_matrices.values():
+                matrix.add(record_id, record)
+        count_index = self._count_indexes.get(collection)
+        if count_index is not None:
+            count_index.add(record_id, record)
+        for sorted_index in self._sorted_indexes.get(collection, {}).values():
+            sorted_index.add(record_id, record)
+        for name, (source, _) in PROJECTIONS.items():
+            if source == collection:
+                self._projections[name].add(record_id, record)
+
+    def _unindex_record(self, collection, record_id, record):
+        """Remove a record from the secondary indexes of its collection"""
+        index = self._patient_indexes.get(collection)
+        if index is not None:
+            index.remove(record_id, record)
+        timeline = self._timelines.get(collection)
+        if timeline is not None:
+            timeline.remove(record_id, record)
+        vitals = self._vitals.get(collection)
+        if vitals is not None:
+            vitals.remove(record_id, record)
+        if collection == 'patients':
+            self._patient_search.remove(record_id, record)
+            self._patient_duplicates.remove(record_id, record)
+        if collection == 'medical_records':
+            self._prescription_queue.remove(record_id, record)
+            self._lab_results.remove(record_id, record)
+        if collection == 'lab_requests':
+            self._lab_worklist.remove(record_id, record)
+        if collection == 'appointments':
+            self._appointment_days.remove(record_id, record)
+            for matrix in self._visit_matrices.values():
+                matrix.remove(record_id, record)
+        count_index = self._count_indexes.get(collection)
+        if count_index is not None:
+            count_index.remove(record_id, record)
+        for sorted_index in self._sorted_indexes.get(collection, {}).values():
+            sorted_index.remove(record_id, record)
+        for name, (source, _) in PROJECTIONS.items():
+            if source == collection:
+                self._projections[name].remove(record_id, record)
+
+    def _put(self, collection, record_id, record):
+        """Store a record, keeping the indexes and the journal up to date"""
+        records = getattr(self, collection)
+        stored = self._compact(collection, record)
+        if type(record_id) is str:
+            record_id = sys.intern(record_id)
+        with self._lock.write():
+            self._store(collection, records, record_id, record, stored)
+        self._mark_dirty(collection)
+
+    def _update(self, collection, record_id, update):
+        """
+        Change a record atomically: `update` gets the current record (or None)
+        and returns the new one, or None to leave it as it is. Returns the new
+        record or None. No other write can come between the read and the write.
+        """
+        records = getattr(self, collection)
+        with self._lock.write():
+            record = update(records.get(record_id))
+            if record is not None:
+                self._store(collection, records, record_id, record, self._compact(collection, record))
+        if record is not None:
+            self._mark_dirty(collection)
+        return record
+
+    def _store(self, collection, records, record_id, record, stored):
+        """Store a record and update the indexes and the journal (write lock held)"""
+        old_record = records.get(record_id)
+        if old_record is not None:
+            self._unindex_record(collection, record_id, old_record)
+        records[record_id] = stored
+        self._index_record(collection, record_id, stored)
+        if collection in JOINED_COLLECTIONS and (old_record is None or any(
+                old_record.get(field) != stored.get(field) for field in JOINED_NAME_FIELDS)):
+            self._refresh_projections(collection, record_id)
+        # Bump after storing, so a reader seeing the new version sees the new record
+        self._versions[collection] += 1
+        if self.journal is not None:
+            self._journal_append('put', collection, record_id, record)
+
+    def _lookup(self, collection, record_id):
+        """Get a record joined into a list row, or None (ids may have become strings on reload)"""
+        records = getattr(self, collection)
+        record = records.get(record_id)
+        if record is None and record_id is not None and type(record_id) is not str:
+            record = records.get(str(record_id))
+        return record
+
+    def _refresh_projections(self, collection, record_id):
+        """Rebuild the list rows showing a (renamed) patient, user or department"""
+        for name, (source, _) in PROJECTIONS.items():
+            if source in self.__dict__:
+                self._projections[name].refresh(collection, record_id, self.__dict__[source])
+
+    def list_page(self, name, page=1, per_page=50, start=None, end=None, descending=True):
+        """
+        Get one page (numbered from 1) of a list view as (rows, total rows).
+        Rows are pre-joined to patient, doctor and department names and
+        sorted by date, newest first unless `descending` is False; start/end
+        bound the date (inclusive).
+        """
+        source = PROJECTIONS[name][0]
+        # Touch the collection first so it is loaded
+        records = getattr(self, source)
+        projection = self._projections[name]
+        while True:
+            with self._lock.read():
+                if projection.built:
+                    return projection.page(page, per_page, start, end, descending)
+            # First read (or reset since): load the joined collections, then build
+            for joined in JOINED_COLLECTIONS:
+                getattr(self, joined)
+            with self._lock.write():
+                if not projection.built:
+                    projection.rebuild(records)
+
+    def collection_version(self, collection):
+        """Get the change counter of a collection"""
+        return self._versions[collection]
+
+    def etag(self, *collections):
+        """Get a strong ETag for the current contents of the given collections"""
+        return f"{self._epoch}-" + '.'.join(str(self._versions[name]) for name in collections)
+
+    def _compact(self, collection, record):
+        """Convert a record to its in-memory representation"""
+        model = COMPACT_MODELS.get(collection) if self.compact_records else None
+        return compact(model, record) if model else record
+
+    def _compact_collection(self, name, records):
+        """Convert a loaded collection to its in-memory representation"""
+        if not self.compact_records or name not in COMPACT_MODELS:
+            return records
+        from_dict = compact_class(COMPACT_MODELS[name]).from_dict
+        intern = sys.intern
+        return {intern(key) if type(key) is str else key: from_dict(record)
+                for key, record in records.items()}
+
+    def _mark_dirty(self, collection):
+        """Mark a collection as changed since the last flush"""
+        with self._dirty_lock:
+            self._dirty.add(collection)
+            if collection == 'activities':
+                return
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+        flusher = self._running_flusher()
+        if flusher is not None:
+            flusher.notify()
+
+    def _running_flusher(self):
+        """This process's flusher, started on first use; None without write-behind"""
+        if self._flush_interval is None:
+            return None
+        if self._flusher is None or self._flusher_pid != os.getpid():
+            with self._flusher_lock:
+                # Not started yet, or inherited from the parent process without its thread
+                if self._flusher is None or self._flusher_pid != os.getpid():
+                    self._flusher = WriteBehindFlusher(self, self._flush_interval)
+                    self._flusher_pid = os.getpid()
+                    self._flusher.start()
+        return self._flusher
+
+    def _build_indexes(self, collection, records=None):
+        """
+        Rebuild the secondary indexes of one collection. Other threads must
+        not write meanwhile: hold the write lock, or pass the records of a
+        collection that is not published yet (as _load_collection does).
+        """
+        if records is None:
+            records = getattr(self, collection)
+        index = self._patient_indexes.get(collection)
+        if index is not None:
+            index.rebuild(records)
+        timeline = self._timelines.get(collection)
+        if timeline is not None:
+            timeline.rebuild(records)
+        vitals = self._vitals.get(collection)
+        if vitals is not None:
+            vitals.rebuild(records)
+        if collection == 'patients':
+            self._patient_search.rebuild(records)
+            self._patient_duplicates.rebuild(records)
+        if collection == 'medical_records':
+            self._prescription_queue.rebuild(records)
+            self._lab_results.rebuild(records)
+        if collection == 'lab_requests':
+            self._lab_worklist.rebuild(records)
+        if collection == 'appointments':
+            self._appointment_days.rebuild(records)
+            for matrix in self._visit_matrices.values():
+                matrix.rebuild(records)
+        count_index = self._count_indexes.get(collection)
+        if count_index is not None:
+            count_index.rebuild(records)
+        for sorted_index in self._sorted_indexes.get(collection, {}).values():
+            sorted_index.rebuild(records)
+        for name, (source, _) in PROJECTIONS.items():
+            if source == collection:
+                # Built by list_page on first use, which loads the joined collections
+                self._projections[name].reset()
+
+    def _rebuild_indexes(self):
+        """Rebuild the secondary indexes of all loaded collections"""
+        for collection in self.loaded_collections():
+            self._build_indexes(collection)
+
+    def _load_collection(self, name):
+        """Load a collection from disk on first access"""
+        with self._load_lock:
+            if name in self.__dict__:
+                return self.__dict__[name]
+            start = time.perf_counter()
+            records = self.storage.read(name, [] if name == 'activities' else {})
+            if name == 'vitals':
+                records = VitalsLog(records)
+            for op, key, value in self._journal_tail.pop(name, ()):
+                self._apply_journal_entry(records, op, key, value)
+            if name == 'activities':
+                if self.activity_segments is not None:
+                    records = self.activity_segments.tail(self.activity_retention) or records
+                records = ActivityLog(records, self.activity_retention, self._activities_ingested)
+            elif name != 'vitals':
+                records = self._compact_collection(name, records)
+            # Index before publishing: once in __dict__, other threads can write to it
+            self._build_indexes(name, records)
+            self.__dict__[name] = records
+            logging.info(f"Loaded {name} ({len(records)} records) in {time.perf_counter() - start:.3f}s")
+            return records
+
+    def loaded_collections(self):
+        """Names of the collections loaded into memory so far"""
+        return [name for name in COLLECTIONS + ('activities', 'vitals') if name in self.__dict__]
+
+    def warm_up(self):
+        """Load every collection from a background thread"""
+        def load_all():
+            for name in COLLECTIONS + ('activities', 'vitals'):
+                getattr(self, name)
+        threading.Thread(target=load_all, name='datastore-warm-up', daemon=True).start()
+
+    def _get_by_patient(self, collection, patient_id):
+        """Get the raw records of a collection belonging to a patient"""
+        records = getattr(self, collection)
+        with self._lock.read():
+            return [records[record_id] for record_id in self._patient_indexes[collection].get(patient_id)
+                    if record_id in records]
+
+    def page(self, collection, sort=None, after=None, limit=100, start=None, end=None,
+             descending=False, **filters):
+        """
+        Get one page of a collection in sort order, as (records, next cursor).
+        `after` is the cursor returned with the previous page; start/end bound
+        the sort key (inclusive) and keyword filters match field values.
+        The next cursor is None on the last page.
+        """
+        sort = sort or PAGE_SORTS[collection][0]
+        if sort not in self._sorted_indexes[collection]:
+            raise ValueError(f"Cannot sort {collection} by {sort}")
+        filters = {field: str(value) for field, value in filters.items() if value is not None}
+        records = getattr(self, collection)
+
+        def accept(record_id):
+            record = records[record_id]
+            return all(str(record.get(field)) == value for field, value in filters.items())
+
+        with self._lock.read():
+            # One extra entry tells whether another page follows
+            entries = self._sorted_indexes[collection][sort].page(
+                after, limit + 1, start, end, descending, filters, accept if len(filters) > 1 else None)
+            page = [records[record_id] for _, record_id in entries[:limit]]
+        next_after = entries[limit - 1] if len(entries) > limit else None
+        return page, next_after
+
+    def iter_records(self, collection, chunk_size=1000, after=None, **page_args):
+        """
+        Yield every record of a collection in sort order, reading it one
+        chunk at a time so memory stays constant however large it is.
+        Takes the same sort/range/filter arguments as page().
+        """
+        while True:
+            page, after = self.page(collection, after=after, limit=chunk_size, **page_args)
+            yield from page
+            if after is None:
+                return
+
+    def items(self, collection):
+        """Get the (id, record) pairs of a collection, safe to iterate while others write"""
+        records = getattr(self, collection)
+        with self._lock.read():
+            return list(records.items())
+
+    def values(self, collection):
+        """Get the records of a collection, safe to iterate while others write"""
+        records = getattr(self, collection)
+        with self._lock.read():
+            return list(records.values())
 
     def add_patient(self, patient):
-        """Add a new patient"""
-        self.patients[patient.id] = patient.__dict__
+        """Add a new patient, flagging likely duplicates in its possible_duplicates field"""
+        duplicates = self.find_patient_duplicates(patient.__dict__)
+        if duplicates:
+            patient.possible_duplicates = [record['id'] for record, _ in duplicates]
+            logging.warning(f"Patient {patient.id} ({patient.name}) may duplicate {patient.possible_duplicates}")
+        self._put('patients', patient.id, patient.__dict__)
         return patient.id
 
+    def find_patient_duplicates(self, record, limit=5, threshold=DUPLICATE_THRESHOLD):
+        """
+        Find existing patients that are likely the same person as a (possibly
+        unsaved) patient record. Returns up to `limit` (record, score)
+        tuples, best first; only patients sharing a block key are scored.
+        """
+        patients = self.patients
+        with self._lock.read():
+            candidates = [patients[record_id] for record_id in self._patient_duplicates.candidates(record)
+                          if record_id != record.get('id') and record_id in patients]
+        scored = [(candidate, match_score(record, candidate)) for candidate in candidates]
+        scored = [item for item in scored if item[1] >= threshold]
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+    def find_duplicate_patients(self, threshold=DUPLICATE_THRESHOLD):
+        """Get (patient id, patient id, score) of all likely duplicate pairs, best first"""
+        patients = self.patients
+        with self._lock.read():
+            pairs = self._patient_duplicates.pairs()
+            records = {record_id: patients.get(record_id) for pair in pairs for record_id in pair}
+        return score_pairs(pairs, records, threshold)
+
     def get_patient(self, patient_id):
         """Get patient by ID"""
         patient_data = self.patients.get(patient_id)
@@ -74,13 +595,58 @@ class DataStore:
             return Patient(**patient_data)
         return None
 
+    def search_patients(self, query, limit=10):
+        """
+        Find patients by MRN, NIK, BPJS number, phone or (partial) name.
+        Returns up to `limit` (record, score, matched field) tuples, best first.
+        """
+        patients = self.patients
+        with self._lock.read():
+            return [(patients[record_id], score, field)
+                    for record_id, score, field in self._patient_search.search(query, limit)
+                    if record_id in patients]
+
+    def _timeline_sources(self, patient_id):
+        """
+        ({collection: sorted timeline entries}, {collection: records}) of a
+        patient; call with the read lock held, after loading the collections
+        """
+        return ({name: self._timelines[name].get(patient_id) for name in TIMELINE_SOURCES},
+                {name: getattr(self, name) for name in TIMELINE_SOURCES})
+
+    def get_patient_timeline(self, patient_id, limit=50, before=None, types=None):
+        """
+        Get one page of a patient's events (appointments, visits,
+        prescriptions, lab results, bills, lab and radiology requests,
+        admissions and discharges), newest first, as (events, next key).
+        `before` is the key returned with the previous page; `types`
+        optionally limits the event types. The next key is None on the last page.
+        """
+        for name in TIMELINE_SOURCES:
+            # Touch the collections first so they (and their indexes) are loaded
+            getattr(self, name)
+        # With no event taken (limit 0) the next page starts where this one did
+        events, last_key = [], before
+        with self._lock.read():
+            sources, records = self._timeline_sources(patient_id)
+            for key, entry in merge_timelines(sources, before):
+                if types and entry[3] not in types:
+                    continue
+                if len(events) == limit:
+                    return events, last_key
+                record = records[key[1]].get(entry[1])
+                if record is not None:
+                    events.append(timeline_event(key[1], entry, record))
+                    last_key = key
+        return events, None
+
     def get_all_patients(self):
-        """Get all patients"""
-        return [Patient(**p) for p in self.patients.values()]
+        """Get read-only views of all patients"""
+        return views(Patient, self.values('patients'))
 
     def add_appointment(self, appointment):
         """Add a new appointment"""
-        self.appointments[appointment.id] = appointment.__dict__
+        self._put('appointments', appointment.id, appointment.__dict__)
         return appointment.id
 
     def get_appointment(self, appointment_id):
@@ -91,14 +657,23 @@ class DataStore:
         return None
 
     def get_appointments_by_date(self, date):
-        """Get all appointments for a specific date"""
-        return [Appointment(**a) for a in self.appointments.values() 
-                if a['appointment_date'].split('T')[0] == date]
+        """Get read-only views of all appointments for a specific date"""
+        # Touch the collection first so it (and its index) is loaded
+        appointments = self.appointments
+        with self._lock.read():
+            records = [appointments[a_id] for a_id in self._appointment_days.get(date)]
+        return views(Appointment, records)
+
+    def get_appointments_between(self, start=None, end=None):
+        """Get read-only views of the appointments between two dates (YYYY-MM-DD, inclusive), ordered by date"""
+        appointments = self.appointments
+        with self._lock.read():
+            records = [appointments[a_id] for a_id in self._appointment_days.between(start, end)]
+        return views(Appointment, records)
 
     def get_appointments_by_patient(self, patient_id):
-        """Get all appointments for a specific patient"""
-        return [Appointment(**a) for a in self.appointments.values() 
-                if a['patient_id'] == patient_id]
+        """Get read-only views of all appointments for a specific patient"""
+        return views(Appointment, self._get_by_patient('appointments', patient_id))
 
     def get_today_appointments(self):
         """Get all appointments for today"""
@@ -107,7 +682,7 @@ class DataStore:
 
     def add_medical_record(self, record):
         """Add a new medical record"""
-        self.medical_records[record.id] = record.__dict__
+        self._put('medical_records', record.id, record.__dict__)
         return record.id
 
     def get_medical_record(self, record_id):
@@ -118,15 +693,51 @@ class DataStore:
         return None
 
     def get_medical_records_by_patient(self, patient_id):
-        """Get all medical records for a specific patient"""
-        return [MedicalRecord(**r) for r in self.medical_records.values() 
-                if r['patient_id'] == patient_id]
+        """Get read-only views of all medical records for a specific patient"""
+        return views(MedicalRecord, self._get_by_patient('medical_records', patient_id))
+
+    def get_pending_prescriptions(self, page=1, per_page=50):
+        """
+        Get one page (numbered from 1) of the pharmacy queue as (rows, total
+        pending): prescriptions not yet dispensed or cancelled, most urgent
+        first, then oldest first.
+        """
+        medical_records = self.medical_records
+        with self._lock.read():
+            keys, total = self._prescription_queue.pending(page, per_page)
+            rows = [prescription_rows(record_id, medical_records[record_id], self._lookup)[position][2]
+                    for record_id, position in keys]
+        return rows, total
+
+    def set_prescription_status(self, record_id, position, status, user_id=None):
+        """
+        Dispense or cancel a pending prescription (by medical record id and
+        position in its prescriptions); returns False if there is no such
+        prescription or it is no longer pending
+        """
+        def change(record):
+            # Checked and written in one step, so a prescription is dispensed once
+            prescriptions = list(record.get('prescriptions') or ()) if record is not None else []
+            if not 0 <= position < len(prescriptions) or \
+                    status not in STATUS_TRANSITIONS[prescription_status(prescriptions[position])]:
+                return None
+            prescription = dict(prescriptions[position], status=status)
+            prescription['dispensed_at' if status == DISPENSED else 'cancelled_at'] = datetime.now().isoformat()
+            if status == DISPENSED:
+                prescription['dispensed_by'] = user_id
+            prescriptions[position] = prescription
+            return dict(record, prescriptions=prescriptions, updated_at=datetime.now().isoformat())
+        return self._update('medical_records', record_id, change) is not None
 
     def add_billing_record(self, record):
         """Add a new billing record"""
-        self.billing_records[record.id] = record.__dict__
+        self._put('billing_records', record.id, record.__dict__)
         return record.id
 
+    def update_billing_record(self, record):
+        """Update an existing billing record (e.g. after a payment)"""
+        self._put('billing_records', record.id, record.__dict__)
+
     def get_billing_record(self, record_id):
         """Get billing record by ID"""
         record_data = self.billing_records.get(record_id)
@@ -135,9 +746,158 @@ class DataStore:
         return None
 
     def get_billing_records_by_patient(self, patient_id):
-        """Get all billing records for a specific patient"""
-        return [BillingRecord(**r) for r in self.billing_records.values() 
-                if r['patient_id'] == patient_id]
+        """Get read-only views of all billing records for a specific patient"""
+        return views(BillingRecord, self._get_by_patient('billing_records', patient_id))
+
+    def add_lab_request(self, lab_request):
+        """Add a new lab request"""
+        request_id = lab_request.setdefault('id', str(uuid.uuid4()))
+        self._put('lab_requests', request_id, lab_request)
+        return request_id
+
+    def get_lab_requests_by_patient(self, patient_id):
+        """Get all lab requests for a specific patient"""
+        return self._get_by_patient('lab_requests', patient_id)
+
+    def get_lab_worklist(self):
+        """Get the active (not completed or cancelled) lab requests, most urgent and then oldest first"""
+        lab_requests = self.lab_requests
+        with self._lock.read():
+            return [worklist_row(request_id, lab_requests[request_id], self._lookup)
+                    for request_id in self._lab_worklist.active()]
+
+    def set_lab_request_status(self, request_id, status):
+        """Update the status of an active lab request, stamping completed_at on completion; returns False if it has none"""
+        def change(lab_request):
+            # Checked and written in one step, so a request cancelled meanwhile stays cancelled
+            if lab_request is None or lab_request.get('status') in LAB_FINAL_STATUSES:
+                return None
+            lab_request = dict(lab_request, status=status)
+            if status == COMPLETED:
+                lab_request['completed_at'] = datetime.now().isoformat()
+            return lab_request
+        return self._update('lab_requests', request_id, change) is not None
+
+    def get_completed_lab_requests(self, start=None, end=None):
+        """Get the lab requests completed between two dates (YYYY-MM-DD, inclusive), in completion order"""
+        lab_requests = self.lab_requests
+        with self._lock.read():
+            return [lab_requests[request_id] for request_id in self._lab_worklist.completed_between(start, end)]
+
+    def get_lab_results(self, patient_id, test_name):
+        """Get a patient's results of one test (name matched case-insensitively), oldest first"""
+        return [result for _, result in self._lab_result_series(patient_id, test_name)]
+
+    def _lab_result_series(self, patient_id, test_name):
+        """(time, result) of a patient's results of one test in time order; the time is the index's sort key"""
+        medical_records = self.medical_records
+        with self._lock.read():
+            return [(recorded_at, dict(medical_records[record_id]['lab_results'][position], record_id=record_id))
+                    for recorded_at, record_id, position in self._lab_results.get(patient_id, test_name)]
+
+    def flag_lab_results(self, entries):
+        """
+        Flag a batch of lab results, given as (patient id, result dict) pairs,
+        in one vectorised pass: H/L and critical flags plus a delta check
+        against the patient's previous result of the same test. Stored
+        results are checked against the result before them; new ones
+        (without recorded_at) against the latest, including earlier ones of
+        the batch.
+        """
+        series, previous = {}, []
+        for patient_id, result in entries:
+            key = (patient_id, test_key(result.get('test_name')))
+            if key not in series:
+                # Stored results are ordered by recorded_at, or the visit date without one
+                earlier = self._lab_result_series(patient_id, result.get('test_name')) if key[1] else []
+                series[key] = ([time for time, _ in earlier], [item for _, item in earlier])
+            times, earlier = series[key]
+            recorded_at = result.get('recorded_at')
+            i = bisect_left(times, recorded_at) if recorded_at else len(times)
+            previous.append(earlier[i - 1] if i else None)
+            if not recorded_at:
+                times.append('\uffff')
+                earlier.append(result)
+        return flag_results([result for _, result in entries], previous)
+
+    def add_radiology_request(self, radiology_request):
+        """Add a new radiology request"""
+        request_id = radiology_request.setdefault('id', str(uuid.uuid4()))
+        self._put('radiology_requests', request_id, radiology_request)
+        return request_id
+
+    def get_radiology_requests_by_patient(self, patient_id):
+        """Get all radiology requests for a specific patient"""
+        return self._get_by_patient('radiology_requests', patient_id)
+
+    def add_inpatient(self, patient_id, admission):
+        """Admit a patient, keyed by patient ID"""
+        admission.setdefault('patient_id', patient_id)
+        self._put('inpatients', patient_id, admission)
+        return patient_id
+
+    def discharge_inpatient(self, patient_id, discharge_date=None):
+        """Record the discharge of an admitted patient; returns False if there is no active stay"""
+        def change(admission):
+            # Checked and written in one step, so a concurrent write cannot undo the discharge
+            if admission is None or admission.get('discharge_date') is not None:
+                return None
+            return dict(admission, discharge_date=discharge_date or datetime.now().isoformat())
+        return self._update('inpatients', patient_id, change) is not None
+
+    def add_vitals(self, patient_id, vitals):
+        """
+        Record a vitals reading (recorded_at defaults to now) of a patient's
+        active stay; returns False if not admitted or nothing could be read
+        """
+        values = parse_vitals(vitals)
+        timestamp = to_timestamp(vitals.get('recorded_at') or datetime.now().isoformat())
+        if not values or timestamp is None:
+            return False
+        inpatients, log = self.inpatients, self.vitals
+        # Under the write lock, so a discharge cannot come between the check and the append
+        with self._lock.write():
+            admission = inpatients.get(patient_id)
+            if admission is None or admission.get('discharge_date') is not None:
+                return False
+            log.append(patient_id, timestamp, values)
+            self._versions['vitals'] += 1
+            if self.journal is not None:
+                self._journal_append('vitals', 'vitals', patient_id, [timestamp, values])
+        self._mark_dirty('vitals')
+        return True
+
+    def _vitals_sources(self, patient_id):
+        """
+        The vitals indexes holding a patient's readings, loading them if needed.
+        Overridden by backends that read one patient's rows (see SQLiteDataStore);
+        the in-memory indexes cover every patient, so patient_id is not used here.
+        """
+        for name in VITALS_SOURCES:
+            getattr(self, name)
+        return [self._vitals[name] for name in VITALS_SOURCES] + [self.vitals]
+
+    def get_vitals(self, patient_id, parameters=None, start=None, end=None):
+        """
+        Get a patient's vital signs from medical records and inpatient stays
+        as {parameter: (timestamps, values)} NumPy arrays in time order,
+        optionally limited to some parameters and to [start, end] (seconds
+        since the epoch, see models.vitals.to_timestamp).
+        """
+        # Before taking the lock, as it may load collections
+        sources = self._vitals_sources(patient_id)
+        series = {}
+        with self._lock.read():
+            for parameter in parameters or VITAL_PARAMETERS:
+                parts = [source.get(patient_id, parameter) for source in sources]
+                times, values = merge_series([part.between(start, end) for part in parts if part is not None])
+                if len(times):
+                    series[parameter] = (times, values)
+        return series
+
+    def get_inpatients_by_patient(self, patient_id):
+        """Get the inpatient stays for a specific patient"""
+        return self._get_by_patient('inpatients', patient_id)
 
     def get_department(self, department_id):
         """Get department by ID"""
@@ -147,8 +907,8 @@ class DataStore:
         return None
 
     def get_all_departments(self):
-        """Get all departments"""
-        return [Department(**d) for d in self.departments.values()]
+        """Get read-only views of all departments"""
+        return views(Department, self.values('departments'))
 
     def get_user(self, user_id):
         """Get user by ID"""
@@ -158,93 +918,327 @@ class DataStore:
         return None
 
     def get_all_users(self):
-        """Get all users"""
-        return [User(**u) for u in self.users.values()]
+        """Get read-only views of all users"""
+        return views(User, self.values('users'))
 
     def get_doctors(self):
-        """Get all doctors"""
-        return [User(**u) for u in self.users.values() if u['role'] == 'doctor']
+        """Get read-only views of all doctors"""
+        return views(User, [u for u in self.values('users') if u['role'] == 'doctor'])
 
     def log_activity(self, activity):
-        """Log system activity"""
+        """Log system activity; it is persisted by the flusher, not the calling thread"""
         self.activities.append(activity)
-        # Keep only the last 100 activities
-        if len(self.activities) > 100:
-            self.activities = self.activities[-100:]
+        self._versions['activities'] += 1
+        # No notify: activities alone do not cause a flush; the flusher's idle
+        # tick hands them to the audit segments (see persist_activities)
+        self._running_flusher()
+
+    def _activities_ingested(self, activities):
+        """Persist a batch of activities queued in the activity log"""
+        # Batches arrive one at a time (under the log's drain lock)
+        if self.activity_segments is not None:
+            self.activity_segments.write(activities)
+            return
+        if self.journal is not None:
+            for activity in activities:
+                self._journal_append('activity', 'activities', None, activity)
+        self._mark_dirty('activities')
+
+    def _drain_activities(self):
+        """Persist the activities queued in the activity log, if it is loaded"""
+        activities = self.__dict__.get('activities')
+        if activities is not None:
+            activities.drain()
+
+    def persist_activities(self):
+        """
+        Write queued activities to the audit segments, or buffer them for the
+        journal or the next snapshot, without flushing any collection
+        """
+        self._drain_activities()
 
     def get_recent_activities(self, limit=10):
-        """Get recent activities"""
-        return sorted(self.activities, key=lambda x: x['timestamp'], reverse=True)[:limit]
+        """Get recent activities, newest first"""
+        return self.activities.recent(limit)
 
     def get_inpatient_count(self):
         """Get current inpatient count"""
-        return len([i for i in self.inpatients.values() if i.get('discharge_date') is None])
+        self.inpatients  # make sure inpatients and their counters are loaded
+        with self._lock.read():
+            return self._count_indexes['inpatients'].count('active')
+
+    def get_doctor_count(self):
+        """Get the number of doctors"""
+        self.users
+        with self._lock.read():
+            return self._count_indexes['users'].count('doctor')
 
     def get_outpatient_count(self):
         """Get today's outpatient count"""
         today = datetime.now().strftime('%Y-%m-%d')
-        return len(self.get_appointments_by_date(today))
+        self.appointments  # make sure appointments and their day index are loaded
+        with self._lock.read():
+            return self._appointment_days.count(today)
+
+    def _visit_totals(self, field, days):
+        """Visit counts per value of `field` from X days ago onwards (cancelled appointments excluded)"""
+        start_date = (datetime.now() - timedelta(days=days)).date()
+        self.appointments  # make sure appointments and their visit matrices are loaded
+        with self._lock.read():
+            return self._visit_matrices[field].totals(start_date)
 
     def get_department_visits(self, days=30):
         """Get visit statistics by department for past X days"""
-        start_date = datetime.now() - timedelta(days=days)
-        start_date_str = start_date.strftime('%Y-%m-%d')
-        
-        department_visits = {dept_id: 0 for dept_id in self.departments.keys()}
-        
-        for app in self.appointments.values():
-            app_date = app['appointment_date'].split('T')[0]
-            if app_date >= start_date_str and app['department_id'] in department_visits:
-                department_visits[app['department_id']] += 1
-                
-        return department_visits
+        visits = self._visit_totals('department_id', days)
+        return {dept_id: visits.get(dept_id, 0) for dept_id, _ in self.items('departments')}
+
+    def get_doctor_visits(self, days=30):
+        """Get visit statistics by doctor for past X days"""
+        visits = self._visit_totals('doctor_id', days)
+        return {doctor_id: count for doctor_id, count in visits.items() if doctor_id is not None and count}
+
+    def get_weekday_visits(self, days=30, department_id=None):
+        """Get visits per day of the week (Monday first) for past X days, optionally for one department"""
+        start_date = (datetime.now() - timedelta(days=days)).date()
+        self.appointments
+        with self._lock.read():
+            return self._visit_matrices['department_id'].weekday_totals(start_date, key=department_id)
+
+    def _dashboard_counters(self):
+        """Read the dashboard totals from the counters"""
+        return {
+            'total_patients': len(self.patients),
+            'appointments_today': self.get_outpatient_count(),
+            'inpatient_count': self.get_inpatient_count(),
+            'doctors_on_duty': self.get_doctor_count()
+        }
+
+    def get_dashboard_counts(self):
+        """Get the dashboard totals from the incrementally maintained counters"""
+        counts = self._dashboard_counters()
+        if self.verify_counters:
+            self.verify_dashboard_counts(counts)
+        return counts
+
+    def recount_dashboard(self):
+        """Compute the dashboard totals with full scans of the collections"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        return {
+            'total_patients': len(self.values('patients')),
+            'appointments_today': len([a for a in self.values('appointments') if appointment_day(a) == today]),
+            'inpatient_count': len([i for i in self.values('inpatients') if i.get('discharge_date') is None]),
+            'doctors_on_duty': len([u for u in self.values('users') if u.get('role') == 'doctor'])
+        }
+
+    def verify_dashboard_counts(self, counts=None):
+        """
+        Cross-check the dashboard counters against a full recount.
+        Returns the mismatching totals as {name: (counter, recount)}; on a
+        mismatch the indexes are rebuilt from the collections.
+        """
+        if counts is None:
+            counts = self._dashboard_counters()
+        recount = self.recount_dashboard()
+        mismatches = {name: (counts[name], recount[name]) for name in recount if counts[name] != recount[name]}
+        if mismatches:
+            logging.error(f"Dashboard counters out of sync: {mismatches}")
+            with self._lock.write():
+                self._rebuild_indexes()
+        return mismatches
+
+    def _snapshot_data(self):
+        """Take a consistent shallow copy of the loaded collections for writing a snapshot"""
+        # Collections with replayed journal entries must be loaded so the
+        # entries end up in the snapshot before the journal is dropped
+        for name in list(self._journal_tail):
+            getattr(self, name)
+        self._drain_activities()
+        with self._lock.read():
+            return self._copy_collections(self._snapshot_collections())
+
+    def _snapshot_collections(self):
+        """Loaded collections that are written to snapshots"""
+        return [name for name in self.loaded_collections()
+                if name != 'activities' or self.activity_segments is None]
+
+    def _copy_collections(self, names):
+        """Shallow-copy collections; the caller holds the store lock"""
+        return {name: self.__dict__[name].snapshot() if name in ('activities', 'vitals') else dict(self.__dict__[name])
+                for name in names}
+
+    def _write_snapshot(self, data):
+        """Write collections to their files and return the bytes written"""
+        return sum(self.storage.write(name, records) for name, records in data.items())
+
+    def _journal_append(self, op, collection, key, value):
+        """Buffer a mutation for the journal"""
+        # Keys are stored as strings, as they are after a JSON snapshot round-trip
+        self.journal.append(op, collection, None if key is None else str(key), value)
+
+    def _queue_journal_entry(self, op, collection, key, value):
+        """Hold a replayed journal entry until its collection is loaded"""
+        self._journal_tail.setdefault(collection, []).append((op, key, value))
+
+    def _apply_journal_entry(self, records, op, key, value):
+        """Apply one replayed journal entry to a collection"""
+        if op == 'put':
+            records[key] = value
+        elif op == 'activity':
+            records.append(value)
+        elif op == 'vitals':
+            records.append(key, value[0], value[1])
+
+    def compact_journal(self):
+        """Write a fresh snapshot and drop the journal entries it covers"""
+        if not self._compaction_lock.acquire(blocking=False):
+            return False
+        try:
+            # Load collections with replayed entries before blocking appends
+            for name in list(self._journal_tail):
+                getattr(self, name)
+            # Hold activity ingestion so no drained batch lands in both the
+            # captured snapshot and the new journal
+            with self.activities.hold(), self._lock.read():
+                data = self.journal.rotate(lambda: self._copy_collections(self._snapshot_collections()))
+            self._write_snapshot(data)
+            self.journal.discard_rotated()
+            logging.info(f"Journal compacted into {self.storage.data_dir}")
+            return True
+        except Exception as e:
+            logging.error(f"Error compacting journal: {str(e)}")
+            return False
+        finally:
+            self._compaction_lock.release()
+
+    def start_flusher(self, interval=1.0):
+        """
+        Persist changes from a background thread instead of the request thread.
+        The thread is started by the first change, in the process making it,
+        so this can be called before forking workers.
+        """
+        self._flush_interval = interval
+
+    def stop_flusher(self):
+        """Stop the background flusher, writing out anything still pending"""
+        with self._flusher_lock:
+            self._flush_interval = None
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None and self._flusher_pid == os.getpid():
+            flusher.stop()
+        else:
+            self.flush()
+        if self.activity_segments is not None:
+            self.activity_segments.close()
+
+    def persist(self):
+        """Persist pending changes at the end of a request"""
+        # With write-behind, request threads never write
+        if self._flush_interval is None:
+            self.flush()
+
+    def flush(self):
+        """Write all dirty collections to disk and return the number of bytes written"""
+        self._drain_activities()
+        with self._flush_lock:
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+                dirty_since, self._dirty_since = self._dirty_since, None
+            if not dirty:
+                return 0
+            try:
+                if self.journal is not None:
+                    written = self.journal.flush()
+                    if self.journal.size >= self.journal_compact_bytes:
+                        self.compact_journal()
+                else:
+                    written = self._flush_snapshot(dirty)
+            except Exception:
+                # Keep the changes pending so the next flush retries them
+                with self._dirty_lock:
+                    self._dirty |= dirty
+                    if self._dirty_since is None:
+                        self._dirty_since = dirty_since
+                raise
+            self._record_flush(dirty, dirty_since, written)
+            return written
+
+    def _flush_snapshot(self, dirty):
+        """Write only the dirty collections to their files"""
+        for name in dirty:
+            getattr(self, name)
+        with self._lock.read():
+            data = self._copy_collections(dirty)
+        return self._write_snapshot(data)
+
+    def _record_flush(self, dirty, dirty_since, written):
+        """Update persistence metrics after a flush"""
+        metrics = self._persistence_metrics
+        metrics['flushes'] += 1
+        metrics['bytes_written'] += written
+        for name in dirty:
+            metrics['writes_by_collection'][name] = metrics['writes_by_collection'].get(name, 0) + 1
+        metrics['last_flush_at'] = datetime.now().isoformat()
+        if dirty_since is not None:
+            lag = time.monotonic() - dirty_since
+            metrics['last_flush_lag'] = lag
+            metrics['max_flush_lag'] = max(metrics['max_flush_lag'], lag)
+
+    def get_persistence_metrics(self):
+        """Get write-behind persistence metrics"""
+        with self._dirty_lock:
+            dirty = sorted(self._dirty)
+            dirty_since = self._dirty_since
+        metrics = dict(self._persistence_metrics)
+        metrics['writes_by_collection'] = dict(metrics['writes_by_collection'])
+        metrics['mode'] = 'journal' if self.journal is not None else 'snapshot'
+        metrics['write_behind'] = self._flush_interval is not None
+        metrics['dirty_collections'] = dirty
+        metrics['loaded_collections'] = self.loaded_collections()
+        metrics['pending_lag'] = time.monotonic() - dirty_since if dirty_since is not None else 0.0
+        return metrics
 
     def save_to_file(self):
-        """Save data to JSON file for persistence"""
+        """Save all loaded collections to their files"""
         try:
-            data = {
-                'patients': self.patients,
-                'appointments': self.appointments,
-                'medical_records': self.medical_records,
-                'users': self.users,
-                'departments': self.departments,
-                'billing_records': self.billing_records,
-                'pharmacy_inventory': self.pharmacy_inventory,
-                'lab_requests': self.lab_requests,
-                'radiology_requests': self.radiology_requests,
-                'inpatients': self.inpatients,
-                'activities': self.activities
-            }
-            
-            with open(self.data_file, 'w') as f:
-                json.dump(data, f)
-            logging.info(f"Data saved to {self.data_file}")
+            self._write_snapshot(self._snapshot_data())
+            logging.info(f"Data saved to {self.storage.data_dir}")
         except Exception as e:
             logging.error(f"Error saving data: {str(e)}")
 
+    def _migrate_legacy_file(self):
+        """Split the legacy single-file snapshot into per-collection files"""
+        with open(self.data_file, 'r') as f:
+            data = json.load(f)
+        for name in COLLECTIONS + ('activities',):
+            self.storage.write(name, data.get(name, [] if name == 'activities' else {}))
+        logging.info(f"Migrated {self.data_file} into {self.storage.data_dir}")
+
     def load_from_file(self):
-        """Load data from JSON file"""
+        """
+        Prepare data loading. Collections are read from their files on first
+        access; in journal mode the journal tail is replayed as each loads.
+        """
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                
-                self.patients = data.get('patients', {})
-                self.appointments = data.get('appointments', {})
-                self.medical_records = data.get('medical_records', {})
-                self.users = data.get('users', {})
-                self.departments = data.get('departments', {})
-                self.billing_records = data.get('billing_records', {})
-                self.pharmacy_inventory = data.get('pharmacy_inventory', {})
-                self.lab_requests = data.get('lab_requests', {})
-                self.radiology_requests = data.get('radiology_requests', {})
-                self.inpatients = data.get('inpatients', {})
-                self.activities = data.get('activities', [])
-                
+            if not self.storage.has_data() and os.path.exists(self.data_file):
+                self._migrate_legacy_file()
+            loaded = self.storage.has_data()
+
+            if self.journal is not None:
+                pending_compaction = self.journal.has_rotated()
+                replayed = self.journal.replay(self._queue_journal_entry)
+                self.journal.open()
+                if replayed:
+                    loaded = True
+                    logging.info(f"Read {replayed} journal entries from {self.journal.path}")
+                if pending_compaction:
+                    # A previous compaction did not finish; finish it now
+                    self.compact_journal()
+
+            if loaded:
                 self._initialized = True
-                logging.info(f"Data loaded from {self.data_file}")
+                logging.info(f"Data available in {self.storage.data_dir}, collections load on first access")
             else:
-                logging.info(f"No data file found at {self.data_file}, initializing with default data")
+                logging.info(f"No data found in {self.storage.data_dir}, initializing with default data")
                 self.initialize()
         except Exception as e:
             logging.error(f"Error loading data: {str(e)}")
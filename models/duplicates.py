@@ -0,0 +1,181 @@
+"""
+Duplicate patient detection (master patient index) for the DataStore
+"""
+from functools import lru_cache
+from itertools import combinations
+
+from models.search import identifier_key, name_tokens, trigrams
+
+# Pairs scoring at least this are reported as likely duplicates
+DUPLICATE_THRESHOLD = 0.7
+
+# Blocks with more patients than this (e.g. a placeholder phone number shared
+# by thousands of charts) say nothing about identity and are not compared
+MAX_BLOCK_SIZE = 200
+
+# Match score weights; agreeing NIK or BPJS numbers add to the score,
+# conflicting ones scale it down since each belongs to one person only
+NAME_WEIGHT = 0.55
+BIRTH_DATE_WEIGHT = 0.25
+GENDER_WEIGHT = 0.05
+PHONE_WEIGHT = 0.15
+IDENTIFIER_WEIGHTS = {'id_number': (0.3, 0.4), 'insurance_number': (0.2, 0.6)}
+
+# Soundex-like consonant classes; vowels, h, w and y carry no code
+_CODES = {**dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+          'l': '4', **dict.fromkeys('mn', '5'), 'r': '6'}
+# Spellings that sound alike in Indonesian names (Akhmad/Ahmad, Nyoman/Noman, Syarif/Sarif)
+_PHONETIC_VARIANTS = (('kh', 'h'), ('ny', 'n'), ('ng', 'n'), ('sy', 's'))
+
+
+@lru_cache(maxsize=65536)
+def phonetic_key(word):
+    """Phonetic key of a canonical name word: its first sound plus up to four consonant codes"""
+    for old, new in _PHONETIC_VARIANTS:
+        word = word.replace(old, new)
+    if not word:
+        return ''
+    key = 'A' if word[0] in 'aiueohwy' else _CODES.get(word[0], word[0])
+    previous = key
+    for letter in word[1:]:
+        code = _CODES.get(letter)
+        if code is None:
+            continue
+        if code != previous:
+            key += code
+            if len(key) == 5:
+                break
+        previous = code
+    return key
+
+
+def block_keys(record):
+    """
+    Blocking keys of a patient record: birth date, gender and the phonetic
+    key of each name word, plus each identifier (NIK, BPJS number, phone).
+    Only patients sharing a key are ever compared.
+    """
+    keys = set()
+    birth_date = (record.get('birth_date') or '')[:10]
+    if birth_date:
+        gender = (record.get('gender') or '')[:1].lower()
+        for word in name_tokens(record.get('name')):
+            if len(word) > 1:
+                keys.add(f"{birth_date}|{gender}|{phonetic_key(word)}")
+    for field in ('id_number', 'insurance_number', 'phone'):
+        key = identifier_key(field, record.get(field))
+        if key:
+            keys.add(f"{field}:{key}")
+    return keys
+
+
+def name_similarity(name, other):
+    """
+    Similarity (0-1) of two names: each word of the shorter name is matched
+    to its most similar word of the other by trigrams (or 0.9 if they sound
+    alike), so word order and spelling variants matter little and a missing
+    middle name only a bit.
+    """
+    words, other_words = _name_words(name), _name_words(other)
+    if not words or not other_words:
+        return 0.0
+    if len(words) > len(other_words):
+        words, other_words = other_words, words
+    total = 0.0
+    for word_trigrams, key in words:
+        total += max(max(2 * len(word_trigrams & candidate) / (len(word_trigrams) + len(candidate)),
+                         0.9 if key == candidate_key else 0.0)
+                     for candidate, candidate_key in other_words)
+    return total / len(words) * (0.9 + 0.1 * len(words) / len(other_words))
+
+
+@lru_cache(maxsize=65536)
+def _name_words(name):
+    """(trigrams, phonetic key) of each word of a name; names repeat a lot, so this is cached"""
+    return tuple((frozenset(trigrams(word)), phonetic_key(word)) for word in name_tokens(name))
+
+
+def match_score(record, other):
+    """Likelihood (0-1) that two patient records are the same person"""
+    score = NAME_WEIGHT * name_similarity(record.get('name'), other.get('name'))
+    birth_date, other_birth_date = record.get('birth_date'), other.get('birth_date')
+    if birth_date and other_birth_date and birth_date[:10] == other_birth_date[:10]:
+        score += BIRTH_DATE_WEIGHT
+    if record.get('gender') and record.get('gender') == other.get('gender'):
+        score += GENDER_WEIGHT
+    phone = identifier_key('phone', record.get('phone'))
+    if phone and phone == identifier_key('phone', other.get('phone')):
+        score += PHONE_WEIGHT
+    for field, (agree, conflict) in IDENTIFIER_WEIGHTS.items():
+        key, other_key = identifier_key(field, record.get(field)), identifier_key(field, other.get(field))
+        if key and other_key:
+            score = score + agree if key == other_key else score * conflict
+    return min(score, 1.0)
+
+
+def block_pairs(blocks):
+    """Distinct (id, id) pairs of patients sharing a block, from an iterable of id collections"""
+    pairs = set()
+    for ids in blocks:
+        if 1 < len(ids) <= MAX_BLOCK_SIZE:
+            pairs.update(combinations(sorted(ids, key=str), 2))
+    return pairs
+
+
+def score_pairs(pairs, records, threshold=DUPLICATE_THRESHOLD):
+    """(id, id, score) of the pairs scoring at least `threshold`, best first"""
+    scored = []
+    for record_id, other_id in pairs:
+        record, other = records.get(record_id), records.get(other_id)
+        if record is None or other is None:
+            continue
+        score = match_score(record, other)
+        if score >= threshold:
+            scored.append((record_id, other_id, score))
+    scored.sort(key=lambda item: -item[2])
+    return scored
+
+
+class DuplicateIndex:
+    """
+    Blocks patient ids by their block_keys, so likely duplicates of one
+    patient are found by scoring only the few patients sharing a block, and
+    the whole registry is checked in near-linear time instead of comparing
+    every pair.
+    """
+    def __init__(self):
+        self._blocks = {}
+
+    def add(self, record_id, record):
+        """Index a patient record"""
+        for key in block_keys(record):
+            self._blocks.setdefault(key, {})[record_id] = None
+
+    def remove(self, record_id, record):
+        """Remove a patient record from the index"""
+        for key in block_keys(record):
+            block = self._blocks.get(key)
+            if block is None:
+                continue
+            block.pop(record_id, None)
+            if not block:
+                del self._blocks[key]
+
+    def rebuild(self, records):
+        """Rebuild the index from a collection dict"""
+        self._blocks = {}
+        for record_id, record in records.items():
+            self.add(record_id, record)
+
+    def candidates(self, record):
+        """Ids of the patients sharing a block with a (possibly unsaved) record"""
+        ids = set()
+        for key in block_keys(record):
+            block = self._blocks.get(key, ())
+            if len(block) <= MAX_BLOCK_SIZE:
+                ids.update(block)
+        return ids
+
+    def pairs(self):
+        """Distinct id pairs sharing a block"""
+        return block_pairs(self._blocks.values())
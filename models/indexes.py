@@ -0,0 +1,277 @@
+"""
+Secondary indexes for the in-memory DataStore
+"""
+from bisect import bisect_left, bisect_right, insort
+
+
+class GroupIndex:
+    """
+    Maps a grouping key (e.g. patient_id) to the ids of the records holding it.
+    Ids are kept in insertion order so lookups return records in the same
+    order a full scan of the collection would.
+    """
+    def __init__(self, key_func):
+        self.key_func = key_func
+        self._groups = {}
+
+    def add(self, record_id, record):
+        """Index a record under its grouping key"""
+        key = self.key_func(record_id, record)
+        if key is None:
+            return
+        self._groups.setdefault(key, {})[record_id] = None
+
+    def remove(self, record_id, record):
+        """Remove a record from the index"""
+        key = self.key_func(record_id, record)
+        group = self._groups.get(key)
+        if group is None:
+            return
+        group.pop(record_id, None)
+        if not group:
+            del self._groups[key]
+
+    def get(self, key):
+        """Get the ids of all records with the given key"""
+        return list(self._groups.get(key, ()))
+
+    def count(self, key):
+        """Get the number of records with the given key"""
+        return len(self._groups.get(key, ()))
+
+    def rebuild(self, records):
+        """Rebuild the index from a collection dict"""
+        self._groups = {}
+        for record_id, record in records.items():
+            self.add(record_id, record)
+
+
+class DayIndex:
+    """
+    Buckets record ids by calendar day (YYYY-MM-DD) and keeps the days
+    sorted so date ranges can be answered without scanning the collection.
+    """
+    def __init__(self, day_func):
+        self.day_func = day_func
+        self._buckets = {}
+        self._days = []
+
+    def add(self, record_id, record):
+        """Index a record under its day"""
+        day = self.day_func(record)
+        if not day:
+            return
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            bucket = self._buckets[day] = {}
+            insort(self._days, day)
+        bucket[record_id] = None
+
+    def remove(self, record_id, record):
+        """Remove a record from the index"""
+        day = self.day_func(record)
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            return
+        bucket.pop(record_id, None)
+        if not bucket:
+            del self._buckets[day]
+            del self._days[bisect_left(self._days, day)]
+
+    def get(self, day):
+        """Get the ids of all records on a day"""
+        return list(self._buckets.get(day, ()))
+
+    def count(self, day):
+        """Get the number of records on a day"""
+        return len(self._buckets.get(day, ()))
+
+    def days_between(self, start=None, end=None):
+        """Get the indexed days in the inclusive range [start, end]"""
+        lo = bisect_left(self._days, start) if start else 0
+        hi = bisect_right(self._days, end) if end else len(self._days)
+        return self._days[lo:hi]
+
+    def between(self, start=None, end=None):
+        """Get the ids of all records in the inclusive day range, ordered by day"""
+        ids = []
+        for day in self.days_between(start, end):
+            ids.extend(self._buckets[day])
+        return ids
+
+    def rebuild(self, records):
+        """Rebuild the index from a collection dict"""
+        self._buckets = {}
+        self._days = []
+        for record_id, record in records.items():
+            self.add(record_id, record)
+
+
+class SortedIndex:
+    """
+    Keeps (sort key, record id) entries in sorted order for keyset (cursor)
+    pagination. Entries are also kept in one sorted list per value of each
+    partition field, so a filtered page is read from the matching partition
+    instead of scanning the collection.
+    """
+    def __init__(self, sort_func, partitions=()):
+        self.sort_func = sort_func
+        self.partitions = partitions
+        self._lists = {None: []}
+
+    def _entry(self, record_id, record):
+        return (self.sort_func(record) or '', record_id)
+
+    def _keys(self, record):
+        """Keys of the lists a record belongs to"""
+        keys = [None]
+        for field in self.partitions:
+            value = record.get(field)
+            if value is not None:
+                keys.append((field, str(value)))
+        return keys
+
+    def add(self, record_id, record):
+        """Index a record"""
+        entry = self._entry(record_id, record)
+        for key in self._keys(record):
+            entries = self._lists.get(key)
+            if entries is None:
+                entries = self._lists[key] = []
+            if not entries or entries[-1] < entry:
+                entries.append(entry)
+            else:
+                insort(entries, entry)
+
+    def remove(self, record_id, record):
+        """Remove a record from the index"""
+        entry = self._entry(record_id, record)
+        for key in self._keys(record):
+            entries = self._lists.get(key)
+            if entries is None:
+                continue
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+            if not entries and key is not None:
+                del self._lists[key]
+
+    def page(self, after=None, limit=100, start=None, end=None, descending=False, filters=None, accept=None):
+        """
+        Get up to `limit` (sort key, record id) entries after the `after`
+        entry, within the inclusive sort key range [start, end]. Filters on
+        partition fields pick the smallest matching partition; `accept` is
+        called with the record id to check any remaining conditions.
+        """
+        entries = self._lists[None]
+        for field, value in (filters or {}).items():
+            if field not in self.partitions:
+                raise ValueError(f"Cannot filter on {field}")
+            candidate = self._lists.get((field, str(value)), [])
+            if len(candidate) < len(entries):
+                entries = candidate
+
+        lo = bisect_left(entries, (start,)) if start else 0
+        # A date bound (YYYY-MM-DD) covers every timestamp on that day
+        hi = bisect_right(entries, (end + '\uffff',)) if end else len(entries)
+        if after is not None:
+            if descending:
+                hi = min(hi, bisect_left(entries, after))
+            else:
+                lo = max(lo, bisect_right(entries, after))
+
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        page = []
+        for i in positions:
+            entry = entries[i]
+            if accept is None or accept(entry[1]):
+                page.append(entry)
+                if len(page) == limit:
+                    break
+        return page
+
+    def rebuild(self, records):
+        """Rebuild the index from a collection dict"""
+        # Append everything and sort once; inserting one by one is quadratic
+        lists = {}
+        for record_id, record in records.items():
+            entry = self._entry(record_id, record)
+            for key in self._keys(record):
+                lists.setdefault(key, []).append(entry)
+        lists.setdefault(None, [])
+        for entries in lists.values():
+            entries.sort()
+        self._lists = lists
+
+
+class CountIndex:
+    """
+    Keeps the number of records per key (e.g. users per role) up to date
+    as records are added and removed, so totals are read without a scan.
+    """
+    def __init__(self, key_func):
+        self.key_func = key_func
+        self._counts = {}
+
+    def add(self, record_id, record):
+        """Count a record under its key"""
+        key = self.key_func(record)
+        if key is not None:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def remove(self, record_id, record):
+        """Stop counting a record"""
+        key = self.key_func(record)
+        count = self._counts.get(key)
+        if not count:
+            return
+        if count == 1:
+            del self._counts[key]
+        else:
+            self._counts[key] = count - 1
+
+    def count(self, key):
+        """Get the number of records with the given key"""
+        return self._counts.get(key, 0)
+
+    def rebuild(self, records):
+        """Rebuild the counts from a collection dict"""
+        self._counts = {}
+        for record_id, record in records.items():
+            self.add(record_id, record)
+
+
+def patient_key(record_id, record):
+    """Grouping key for patient-scoped collections"""
+    return record.get('patient_id')
+
+
+def inpatient_key(record_id, record):
+    """Grouping key for inpatients, which are stored keyed by patient id"""
+    return record.get('patient_id') or record_id
+
+
+def field_key(field):
+    """Sort key function reading one field of a record"""
+    def key(record):
+        value = record.get(field)
+        return value if value is None or isinstance(value, str) else str(value)
+    return key
+
+
+def appointment_day(record):
+    """Day key (YYYY-MM-DD) of an appointment"""
+    appointment_date = record.get('appointment_date')
+    if not appointment_date:
+        return None
+    return appointment_date.split('T')[0]
+
+
+def inpatient_status(record):
+    """Counting key of an inpatient stay: active until it has a discharge date"""
+    return 'active' if record.get('discharge_date') is None else 'discharged'
+
+
+def user_role(record):
+    """Counting key of a user"""
+    return record.get('role')
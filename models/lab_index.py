@@ -0,0 +1,171 @@
+"""
+Laboratory worklist and result indexes for the DataStore
+"""
+from bisect import bisect_left, bisect_right, insort
+
+# Request priorities in serving order (as LabRequest.priority); the request
+# form's older "high" option is served as urgent, anything else as normal
+LAB_PRIORITIES = ('stat', 'urgent', 'normal')
+DEFAULT_LAB_PRIORITY = 'normal'
+_PRIORITY_RANK = {'stat': 0, 'urgent': 1, 'high': 1, 'normal': 2}
+
+# Request states (as LabRequest.status); completed and cancelled requests
+# have left the worklist
+PENDING = 'pending'
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+LAB_FINAL_STATUSES = (COMPLETED, CANCELLED)
+
+
+def test_key(test_name):
+    """Case and whitespace insensitive key of a test name"""
+    return ' '.join(str(test_name).lower().split()) if test_name else None
+
+
+def worklist_entry(request_id, request):
+    """Sort entry of an active lab request: highest priority first, then oldest first"""
+    rank = _PRIORITY_RANK.get(request.get('priority'), _PRIORITY_RANK[DEFAULT_LAB_PRIORITY])
+    return (rank, request.get('requested_at') or '', request_id)
+
+
+def is_active(request):
+    """Whether a lab request is still on the worklist"""
+    return request.get('status') not in LAB_FINAL_STATUSES
+
+
+def worklist_row(request_id, request, lookup):
+    """A lab request joined to the current patient and doctor names"""
+    row = dict(request, id=request.get('id', request_id))
+    for collection, field in (('patients', 'patient'), ('users', 'doctor')):
+        joined = lookup(collection, request.get(f"{field}_id"))
+        if joined is not None:
+            row[f"{field}_name"] = joined.get('name')
+        row.setdefault(f"{field}_name", None)
+    return row
+
+
+class LabWorklist:
+    """
+    Active (not completed or cancelled) lab requests kept sorted by priority
+    and request time, plus the completion time of each completed request, so
+    the laboratory page costs as much as the active worklist, not the whole
+    request history.
+    """
+    def __init__(self):
+        self._active = []
+        self._completed = []
+
+    def add(self, request_id, request):
+        """Index a lab request"""
+        if is_active(request):
+            entry = worklist_entry(request_id, request)
+            if not self._active or self._active[-1] < entry:
+                self._active.append(entry)
+            else:
+                insort(self._active, entry)
+        elif request.get('status') == COMPLETED and request.get('completed_at'):
+            insort(self._completed, (request['completed_at'], request_id))
+
+    def remove(self, request_id, request):
+        """Remove a lab request from the index"""
+        if is_active(request):
+            entries, entry = self._active, worklist_entry(request_id, request)
+        elif request.get('status') == COMPLETED and request.get('completed_at'):
+            entries, entry = self._completed, (request['completed_at'], request_id)
+        else:
+            return
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def active(self):
+        """Ids of the active requests, most urgent first"""
+        return [entry[2] for entry in self._active]
+
+    def completed_between(self, start=None, end=None):
+        """Ids of the requests completed between two dates or timestamps (inclusive), in completion order"""
+        entries = self._completed
+        lo = bisect_left(entries, (start,)) if start else 0
+        hi = bisect_right(entries, (end + '\uffff',)) if end else len(entries)
+        return [request_id for _, request_id in entries[lo:hi]]
+
+    def rebuild(self, records):
+        """Rebuild the index from a lab requests dict"""
+        active, completed = [], []
+        for request_id, request in records.items():
+            if is_active(request):
+                active.append(worklist_entry(request_id, request))
+            elif request.get('status') == COMPLETED and request.get('completed_at'):
+                completed.append((request['completed_at'], request_id))
+        active.sort()
+        completed.sort()
+        self._active, self._completed = active, completed
+
+
+class LabResultIndex:
+    """
+    Lab results recorded in medical records, grouped by patient and test and
+    kept in time order, so the trend of one test for one patient is read in
+    O(k) for its k results.
+    """
+    def __init__(self, key_func):
+        self.key_func = key_func
+        self._results = {}
+
+    def _entries(self, record_id, record):
+        """(test key, (recorded at, record id, position)) of the lab results of a record"""
+        visit_date = record.get('visit_date') or ''
+        return [(test_key(result.get('test_name')), (result.get('recorded_at') or visit_date, record_id, position))
+                for position, result in enumerate(record.get('lab_results') or ())
+                if result.get('test_name')]
+
+    def add(self, record_id, record):
+        """Index the lab results of a medical record"""
+        entries = self._entries(record_id, record)
+        if not entries:
+            return
+        tests = self._results.setdefault(self.key_func(record_id, record), {})
+        for key, entry in entries:
+            results = tests.setdefault(key, [])
+            if not results or results[-1] < entry:
+                results.append(entry)
+            else:
+                insort(results, entry)
+
+    def remove(self, record_id, record):
+        """Remove the lab results of a medical record from the index"""
+        entries = self._entries(record_id, record)
+        patient_id = self.key_func(record_id, record)
+        tests = self._results.get(patient_id)
+        if not entries or tests is None:
+            return
+        for key, entry in entries:
+            results = tests.get(key)
+            if results is None:
+                continue
+            i = bisect_left(results, entry)
+            if i < len(results) and results[i] == entry:
+                del results[i]
+            if not results:
+                del tests[key]
+        if not tests:
+            del self._results[patient_id]
+
+    def tests(self, patient_id):
+        """Keys of the tests with results for a patient"""
+        return sorted(self._results.get(patient_id, ()))
+
+    def get(self, patient_id, test_name):
+        """(recorded at, record id, position) of a patient's results of one test, oldest first (do not modify)"""
+        return self._results.get(patient_id, {}).get(test_key(test_name), [])
+
+    def rebuild(self, records):
+        """Rebuild the index from a medical records dict"""
+        self._results = {}
+        for record_id, record in records.items():
+            for key, entry in self._entries(record_id, record):
+                self._results.setdefault(self.key_func(record_id, record), {}).setdefault(key, []).append(entry)
+        for tests in self._results.values():
+            for results in tests.values():
+                results.sort()
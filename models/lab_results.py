@@ -0,0 +1,171 @@
+"""
+Lab result normalisation and vectorised abnormal flags
+"""
+import math
+import re
+from itertools import repeat
+
+import numpy as np
+
+from models.lab_index import test_key
+
+# Flags of a numeric result against its reference range and critical limits
+FLAG_NORMAL = ''
+FLAG_LOW = 'L'
+FLAG_HIGH = 'H'
+FLAG_CRITICAL_LOW = 'LL'
+FLAG_CRITICAL_HIGH = 'HH'
+
+# A change of more than this fraction from the patient's previous value of
+# the same test fails the delta check (a likely mix-up or a real event)
+DELTA_FRACTION = 0.5
+
+# Critical (panic) limits by test key: (unit, low, high). They apply only
+# when the result is reported in that unit (or without one).
+CRITICAL_LIMITS = {
+    'hemoglobin': ('g/dl', 7.0, 20.0), 'hb': ('g/dl', 7.0, 20.0),
+    'kalium': ('mmol/l', 2.5, 6.5), 'potassium': ('mmol/l', 2.5, 6.5),
+    'natrium': ('mmol/l', 120.0, 160.0), 'sodium': ('mmol/l', 120.0, 160.0),
+    'glukosa': ('mg/dl', 40.0, 450.0), 'glucose': ('mg/dl', 40.0, 450.0), 'gula darah': ('mg/dl', 40.0, 450.0),
+    'kalsium': ('mg/dl', 6.0, 13.0), 'calcium': ('mg/dl', 6.0, 13.0),
+    'kreatinin': ('mg/dl', None, 10.0), 'creatinine': ('mg/dl', None, 10.0)
+}
+
+# Indonesian reports write 150.000 for 150000 and 12,5 for 12.5. Dots are read
+# as thousands separators only where that is unambiguous: several 3-digit
+# groups (1.500.000), groups before a decimal comma (1.500,5), or one group
+# after a 2-3 digit number (150.000). One digit before a single group is a
+# decimal (a specific gravity of 1.005). Digits inside words (HbA1c) are not numbers.
+_NUMBER = r'(?<![\w.,])[-+]?\d+(?:[.,]\d+)*'
+_THOUSANDS = re.compile(r'[-+]?(?:\d{1,3}(?:\.\d{3}){2,}(?:,\d+)?|\d{1,3}\.\d{3},\d+|[1-9]\d{1,2}\.\d{3})')
+_RESULT = re.compile(rf'({_NUMBER})\s*(.*)')
+_RANGE = re.compile(rf'({_NUMBER})\s*(?:-|–|—|s/d|s\.d\.?|sampai|to)\s*({_NUMBER})\s*(.*)', re.IGNORECASE)
+_BOUND = re.compile(rf'(<=?|>=?|≤|≥)\s*({_NUMBER})\s*(.*)')
+
+
+def parse_number(text):
+    """A float from a reported number (12.5, 12,5 or 150.000), or None"""
+    text = text.strip()
+    if _THOUSANDS.fullmatch(text):
+        text = text.replace('.', '')
+    try:
+        return float(text.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _unit(text):
+    """A unit from the text after a number, or None"""
+    unit = text.strip().strip('()[]').strip()
+    return unit or None
+
+
+def parse_result(result):
+    """(value, unit) of a reported result such as "12.5 g/dL", "<0,5" or "Hb: 13"; value is None if not numeric"""
+    if isinstance(result, (int, float)) and not isinstance(result, bool):
+        return (float(result) if math.isfinite(result) else None), None
+    match = _RESULT.search(str(result or ''))
+    if match is None:
+        return None, None
+    return parse_number(match.group(1)), _unit(match.group(2))
+
+
+def parse_reference_range(reference_range):
+    """(low, high, unit) of a reference range such as "12-16 g/dL", "3,5 s/d 5,0" or "< 200"; unknown bounds are None"""
+    text = str(reference_range or '').strip()
+    match = _RANGE.search(text)
+    if match is not None:
+        return parse_number(match.group(1)), parse_number(match.group(2)), _unit(match.group(3))
+    match = _BOUND.search(text)
+    if match is not None:
+        bound = parse_number(match.group(2))
+        if match.group(1) in ('<', '<=', '≤'):
+            return None, bound, _unit(match.group(3))
+        return bound, None, _unit(match.group(3))
+    return None, None, None
+
+
+# Fields added to a lab result by normalise_lab_result
+TYPED_FIELDS = ('value', 'unit', 'reference_low', 'reference_high')
+
+
+def normalise_lab_result(result, reference_range=None):
+    """Typed fields of a lab result: value, unit, reference_low and reference_high"""
+    return dict(zip(TYPED_FIELDS, _typed({'result': result, 'reference_range': reference_range})))
+
+
+def _typed(result):
+    """(value, unit, reference_low, reference_high) of a lab result dict"""
+    value = result.get('value')
+    if (isinstance(value, (int, float)) and not isinstance(value, bool)) or (value is None and 'value' in result):
+        return value, result.get('unit'), result.get('reference_low'), result.get('reference_high')
+    value, unit = parse_result(result.get('result'))
+    low, high, range_unit = parse_reference_range(result.get('reference_range'))
+    return value, unit or range_unit, low, high
+
+
+def normalised(result):
+    """A lab result dict's typed fields, parsed now for results stored before normalisation"""
+    return dict(zip(TYPED_FIELDS, _typed(result)))
+
+
+def _column(values):
+    """Float array of optional numbers, missing ones as NaN"""
+    return np.array(values, dtype=np.float64)
+
+
+def compute_flags(values, lows, highs, critical_lows, critical_highs):
+    """Flag of each value (arrays, NaN where unknown): L/H outside the reference range, LL/HH past a critical limit"""
+    flags = np.full(len(values), FLAG_NORMAL, dtype='<U2')
+    flags[values < lows] = FLAG_LOW
+    flags[values > highs] = FLAG_HIGH
+    flags[values <= critical_lows] = FLAG_CRITICAL_LOW
+    flags[values >= critical_highs] = FLAG_CRITICAL_HIGH
+    return flags
+
+
+def delta_checks(values, previous, fraction=DELTA_FRACTION):
+    """Whether each value changed by more than `fraction` from the previous one (NaN where unknown: no)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.abs(values - previous) / np.abs(previous)
+    return change > fraction
+
+
+def flag_results(results, previous=None, fraction=DELTA_FRACTION):
+    """
+    Flags of a batch of lab result dicts (with test_name and either typed
+    fields or result/reference_range text) as one dict per result:
+    flag, critical, delta (failed delta check) and previous_value.
+    `previous` holds the previous result dict (or None) of the same patient
+    and test for each result; a previous value in another unit is ignored.
+    """
+    # One pass over the dicts collects the columns; the comparisons run on whole arrays
+    values, lows, highs, critical_lows, critical_highs, previous_values = [], [], [], [], [], []
+    limits = {}
+    for result, before in zip(results, previous or repeat(None)):
+        value, unit, low, high = _typed(result)
+        unit = unit.lower() if unit else None
+        test_name = result.get('test_name')
+        limit = limits.get(test_name)
+        if limit is None:
+            limit = limits[test_name] = CRITICAL_LIMITS.get(test_key(test_name), (None, None, None))
+        applies = limit[0] is None or unit is None or unit == limit[0]
+        values.append(value)
+        lows.append(low)
+        highs.append(high)
+        critical_lows.append(limit[1] if applies else None)
+        critical_highs.append(limit[2] if applies else None)
+        previous_value = None
+        if before:
+            previous_value, previous_unit, _, _ = _typed(before)
+            if unit and previous_unit and previous_unit.lower() != unit:
+                previous_value = None
+        previous_values.append(previous_value)
+
+    values = _column(values)
+    flags = compute_flags(values, _column(lows), _column(highs), _column(critical_lows), _column(critical_highs))
+    critical = (flags == FLAG_CRITICAL_LOW) | (flags == FLAG_CRITICAL_HIGH)
+    deltas = delta_checks(values, _column(previous_values), fraction)
+    return [{'flag': flag, 'critical': is_critical, 'delta': delta, 'previous_value': previous_value}
+            for flag, is_critical, delta, previous_value
+            in zip(flags.tolist(), critical.tolist(), deltas.tolist(), previous_values)]
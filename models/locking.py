@@ -0,0 +1,72 @@
+"""
+Reader/writer locking for the DataStore
+"""
+import threading
+
+
+class RWLock:
+    """
+    Lock allowing many concurrent readers or a single writer.
+    Waiting writers block new readers, so a steady stream of reads cannot
+    starve writes. Neither side is reentrant: do not take the lock again
+    from code that already holds it.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._read_guard = _Guard(self.acquire_read, self.release_read)
+        self._write_guard = _Guard(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        """Acquire a shared (read) lock"""
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        """Release a shared (read) lock"""
+        with self._cond:
+            self._readers -= 1
+            if not self._readers and self._waiting_writers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """Acquire the exclusive (write) lock"""
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        """Release the exclusive (write) lock"""
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    def read(self):
+        """Context manager holding the read lock"""
+        return self._read_guard
+
+    def write(self):
+        """Context manager holding the write lock"""
+        return self._write_guard
+
+
+class _Guard:
+    """Reusable context manager around an acquire/release pair"""
+    __slots__ = ('_acquire', '_release')
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, *exc_info):
+        self._release()
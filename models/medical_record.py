@@ -1,5 +1,7 @@
 import uuid
 from datetime import datetime
+from models.prescription_queue import DEFAULT_URGENCY, PENDING
+from models.lab_results import normalise_lab_result
 
 class MedicalRecord:
     """Medical Record model for storing patient health information"""
@@ -28,21 +30,23 @@ class MedicalRecord:
         for key, value in kwargs.items():
             setattr(self, key, value)
     
-    def add_prescription(self, medication, dosage, frequency, duration, instructions=None):
-        """Add a prescription to the medical record"""
+    def add_prescription(self, medication, dosage, frequency, duration, instructions=None, urgency=None):
+        """Add a prescription to the medical record; it waits in the pharmacy queue until dispensed"""
         prescription = {
             "medication": medication,
             "dosage": dosage,
             "frequency": frequency,
             "duration": duration,
             "instructions": instructions,
+            "urgency": urgency or DEFAULT_URGENCY,
+            "status": PENDING,
             "prescribed_at": datetime.now().isoformat()
         }
         self.prescriptions.append(prescription)
         self.updated_at = datetime.now().isoformat()
     
     def add_lab_result(self, test_name, result, reference_range=None, notes=None):
-        """Add a lab result to the medical record"""
+        """Add a lab result to the medical record, with its value, unit and reference range parsed"""
         lab_result = {
             "test_name": test_name,
             "result": result,
@@ -50,6 +54,7 @@ class MedicalRecord:
             "notes": notes,
             "recorded_at": datetime.now().isoformat()
         }
+        lab_result.update(normalise_lab_result(result, reference_range))
         self.lab_results.append(lab_result)
         self.updated_at = datetime.now().isoformat()
     
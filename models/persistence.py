@@ -0,0 +1,225 @@
+"""
+Write-behind persistence and per-collection storage for the DataStore
+"""
+import json
+import os
+import logging
+import pickle
+import threading
+from collections.abc import Mapping
+
+
+class WriteBehindFlusher:
+    """
+    Background thread that persists dirty DataStore collections.
+    Writes are debounced: after the first change the flusher waits
+    `interval` seconds so bursts of changes go out in a single flush.
+    While idle it persists queued activities every `interval` seconds
+    without flushing any collection.
+    """
+    def __init__(self, data_store, interval=1.0):
+        self.data_store = data_store
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the flusher thread"""
+        self._thread = threading.Thread(target=self._run, name='datastore-flusher', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Signal that there are changes to persist"""
+        self._wake.set()
+
+    def stop(self):
+        """Stop the flusher thread and write out anything still pending"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.data_store.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if not self._wake.wait(self.interval):
+                try:
+                    self.data_store.persist_activities()
+                except Exception as e:
+                    logging.error(f"Error persisting activities: {str(e)}")
+                continue
+            # Let further changes coalesce into this flush
+            self._stopping.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.data_store.flush()
+            except Exception as e:
+                logging.error(f"Error flushing data: {str(e)}")
+
+
+def encode_default(value):
+    """Encode mapping-like records (e.g. compact records) as plain dicts"""
+    if isinstance(value, Mapping):
+        to_dict = getattr(value, 'to_dict', None)
+        return to_dict() if to_dict is not None else dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _json_codec():
+    return (lambda data: json.dumps(data, default=encode_default)), json.loads, True
+
+
+def _pickle_codec():
+    # Collection files are written by the application itself, so they are
+    # as trusted as the code that reads them
+    return (lambda data: pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL),
+            pickle.loads, False)
+
+
+def _msgpack_codec():
+    import msgpack
+    return (lambda data: msgpack.packb(data, use_bin_type=True, default=encode_default),
+            lambda raw: msgpack.unpackb(raw, raw=False, strict_map_key=False), False)
+
+
+def _no_compression():
+    return (lambda raw: raw), (lambda raw: raw)
+
+
+def _gzip_compression():
+    import gzip
+    return (lambda raw: gzip.compress(raw, compresslevel=1)), gzip.decompress
+
+
+def _zstd_compression():
+    import zstandard
+    return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+
+
+def _lz4_compression():
+    import lz4.frame
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+# Snapshot codecs: name -> factory returning (encode, decode, is_text)
+CODECS = {'json': _json_codec, 'pickle': _pickle_codec, 'msgpack': _msgpack_codec}
+
+# Compression: name -> (file suffix, factory returning (compress, decompress))
+COMPRESSIONS = {
+    'none': ('', _no_compression),
+    'gzip': ('.gz', _gzip_compression),
+    'zstd': ('.zst', _zstd_compression),
+    'lz4': ('.lz4', _lz4_compression),
+}
+
+
+def _load_format(codec, compression):
+    """Resolve a codec/compression pair to (suffix, encode, decode)"""
+    encode, decode, is_text = CODECS[codec]()
+    suffix, factory = COMPRESSIONS[compression]
+    compress, decompress = factory()
+    if is_text:
+        def dump(data):
+            return compress(encode(data).encode('utf-8'))
+
+        def load(raw):
+            return decode(decompress(raw).decode('utf-8'))
+    else:
+        def dump(data):
+            return compress(encode(data))
+
+        def load(raw):
+            return decode(decompress(raw))
+    return f".{codec}{suffix}", dump, load
+
+
+class CollectionFiles:
+    """
+    Stores each DataStore collection in its own file under data_dir,
+    so collections can be loaded and written independently.
+    Files are encoded with a configurable codec (json, pickle, msgpack) and
+    compression (none, gzip, zstd, lz4); files written in another format
+    are converted the first time they are read.
+    """
+    def __init__(self, data_dir, codec='json', compression='none'):
+        self.data_dir = data_dir
+        try:
+            self.suffix, self._dump, self._load = _load_format(codec, compression)
+        except (ImportError, KeyError) as e:
+            logging.warning(f"Snapshot format {codec}/{compression} not available ({str(e)}), using json")
+            codec, compression = 'json', 'none'
+            self.suffix, self._dump, self._load = _load_format(codec, compression)
+        self.codec = codec
+        self.compression = compression
+
+    def path(self, name):
+        """Path of the file holding a collection"""
+        return os.path.join(self.data_dir, f"{name}{self.suffix}")
+
+    def exists(self, name):
+        """Check if a collection has been written"""
+        return os.path.exists(self.path(name))
+
+    def has_data(self):
+        """Check if any collection has been written"""
+        return os.path.isdir(self.data_dir) and any(
+            self._parse_suffix(f) is not None for f in os.listdir(self.data_dir))
+
+    def _parse_suffix(self, filename):
+        """Split a collection file name into (name, codec, compression), or None"""
+        parts = filename.split('.')
+        if len(parts) == 2 and parts[1] in CODECS:
+            return parts[0], parts[1], 'none'
+        if len(parts) == 3 and parts[1] in CODECS:
+            for compression, (suffix, _) in COMPRESSIONS.items():
+                if suffix == f".{parts[2]}":
+                    return parts[0], parts[1], compression
+        return None
+
+    def _find_other_format(self, name):
+        """Find a file for a collection written in a different format"""
+        if not os.path.isdir(self.data_dir):
+            return None
+        for filename in os.listdir(self.data_dir):
+            parsed = self._parse_suffix(filename)
+            if parsed and parsed[0] == name:
+                return filename, parsed[1], parsed[2]
+        return None
+
+    def read(self, name, default):
+        """Read a collection, returning `default` if it was never written"""
+        if self.exists(name):
+            with open(self.path(name), 'rb') as f:
+                return self._load(f.read())
+
+        other = self._find_other_format(name)
+        if other is None:
+            return default
+
+        # One-time migration from the previously configured format
+        filename, codec, compression = other
+        _, _, load = _load_format(codec, compression)
+        with open(os.path.join(self.data_dir, filename), 'rb') as f:
+            data = load(f.read())
+        self.write(name, data)
+        os.remove(os.path.join(self.data_dir, filename))
+        logging.info(f"Converted {filename} to {self.codec}/{self.compression}")
+        return data
+
+    def write(self, name, data):
+        """Write a collection atomically (temp file + rename) and return the bytes written"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        if isinstance(data, dict) and self.codec != 'json':
+            # Keep keys as strings, exactly as a JSON round-trip leaves them
+            data = {str(key): value for key, value in data.items()}
+        body = self._dump(data)
+        path = self.path(name)
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+        return len(body)
@@ -1,6 +1,7 @@
 
 from datetime import datetime
 from app import db
+from models.prescription_queue import PENDING
 
 class PharmacySystem(db.Model):
     """Pharmacy System Configuration"""
@@ -19,6 +20,6 @@ class DrugDispense(db.Model):
     drug_name = db.Column(db.String(100))
     quantity = db.Column(db.Integer)
     unit = db.Column(db.String(20))
-    status = db.Column(db.String(20))  # pending/dispensed/cancelled
+    status = db.Column(db.String(20), default=PENDING)  # pending/dispensed/cancelled, as in the pharmacy queue
     dispensed_at = db.Column(db.DateTime)
     dispensed_by = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -0,0 +1,136 @@
+"""
+Pharmacy work queue of prescriptions for the DataStore
+"""
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+# Prescription states, the same values as DrugDispense.status. Prescriptions
+# written before states were tracked count as pending.
+PENDING = 'pending'
+DISPENSED = 'dispensed'
+CANCELLED = 'cancelled'
+PRESCRIPTION_STATUSES = (PENDING, DISPENSED, CANCELLED)
+
+# Allowed status changes; dispensed and cancelled prescriptions are final
+STATUS_TRANSITIONS = {PENDING: (DISPENSED, CANCELLED), DISPENSED: (), CANCELLED: ()}
+
+# Urgencies in serving order; unknown urgencies are served as routine
+URGENCIES = ('stat', 'urgent', 'routine')
+DEFAULT_URGENCY = 'routine'
+_URGENCY_RANK = {urgency: rank for rank, urgency in enumerate(URGENCIES)}
+
+
+def prescription_status(prescription):
+    """The status of a prescription"""
+    return prescription.get('status') or PENDING
+
+
+def queue_entry(record_id, position, prescription):
+    """Sort entry of a pending prescription: most urgent first, then oldest first"""
+    rank = _URGENCY_RANK.get(prescription.get('urgency'), _URGENCY_RANK[DEFAULT_URGENCY])
+    return (rank, prescription.get('prescribed_at') or '', record_id, position)
+
+
+class PrescriptionQueue:
+    """
+    Keeps the status of every prescription and the pending ones in serving
+    order, so the pharmacy reads the head of the queue instead of scanning
+    every medical record.
+    A status change is a dict update: entries that are no longer pending
+    stay in the sorted list and are skipped, and the head offset moves past
+    the ones at the front (where the pharmacy works), until more than half
+    of the list is stale and it is compacted.
+    """
+    def __init__(self):
+        self._status = {}
+        self._queued = {}
+        self._order = []
+        self._head = 0
+        self._counts = dict.fromkeys(PRESCRIPTION_STATUSES, 0)
+
+    def _live(self, entry):
+        """Whether a sorted list entry is a pending prescription"""
+        key = entry[2:]
+        return self._status.get(key) == PENDING and self._queued.get(key) == entry
+
+    def add(self, record_id, record):
+        """Add the prescriptions of a medical record"""
+        for position, prescription in enumerate(record.get('prescriptions') or ()):
+            key = (record_id, position)
+            status = prescription_status(prescription)
+            self._status[key] = status
+            self._counts[status] = self._counts.get(status, 0) + 1
+            if status != PENDING:
+                continue
+            entry = queue_entry(record_id, position, prescription)
+            # Still listed from before a status change or record update
+            if self._queued.get(key) == entry:
+                self._head = min(self._head, bisect_left(self._order, entry))
+                continue
+            self._queued[key] = entry
+            if not self._order or self._order[-1] < entry:
+                self._order.append(entry)
+            else:
+                i = bisect_right(self._order, entry)
+                self._order.insert(i, entry)
+                self._head = min(self._head, i)
+        self._advance()
+
+    def remove(self, record_id, record):
+        """Remove the prescriptions of a medical record"""
+        for position in range(len(record.get('prescriptions') or ())):
+            status = self._status.pop((record_id, position), None)
+            if status is not None:
+                self._counts[status] -= 1
+
+    def _advance(self):
+        """Move the head past stale entries; drop stale entries once they outnumber the pending ones"""
+        order = self._order
+        while self._head < len(order) and not self._live(order[self._head]):
+            self._head += 1
+        if len(order) - self._head > 2 * self._counts[PENDING] + 64:
+            self._order = [entry for entry in order[self._head:] if self._live(entry)]
+            self._queued = {entry[2:]: entry for entry in self._order}
+            self._head = 0
+        elif self._head > len(order) // 2 and self._head > 64:
+            for entry in order[:self._head]:
+                if self._queued.get(entry[2:]) == entry:
+                    del self._queued[entry[2:]]
+            del order[:self._head]
+            self._head = 0
+
+    def status(self, record_id, position):
+        """Get the status of a prescription, or None if there is no such prescription"""
+        return self._status.get((record_id, position))
+
+    def counts(self):
+        """Number of prescriptions per status"""
+        return dict(self._counts)
+
+    def pending(self, page=1, per_page=50):
+        """Get one page (numbered from 1) of pending (record id, position) keys in serving order, and the total"""
+        offset, keys = (page - 1) * per_page, []
+        for entry in islice(self._order, self._head, None):
+            if not self._live(entry):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            keys.append(entry[2:])
+            if len(keys) == per_page:
+                break
+        return keys, self._counts[PENDING]
+
+    def rebuild(self, records):
+        """Rebuild the queue from a medical records dict"""
+        self._status, self._queued = {}, {}
+        self._counts = dict.fromkeys(PRESCRIPTION_STATUSES, 0)
+        for record_id, record in records.items():
+            for position, prescription in enumerate(record.get('prescriptions') or ()):
+                status = prescription_status(prescription)
+                self._status[(record_id, position)] = status
+                self._counts[status] = self._counts.get(status, 0) + 1
+                if status == PENDING:
+                    self._queued[(record_id, position)] = queue_entry(record_id, position, prescription)
+        self._order = sorted(self._queued.values())
+        self._head = 0
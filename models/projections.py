@@ -0,0 +1,219 @@
+"""
+Denormalised list-view projections for the DataStore
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from models.prescription_queue import DEFAULT_URGENCY, prescription_status
+
+# Row fields holding ids of joined records, and the collection they point into
+JOIN_FIELDS = {'patient_id': 'patients', 'doctor_id': 'users', 'department_id': 'departments'}
+
+# Fields of joined records copied into rows; writes that leave these unchanged
+# (e.g. a new phone number) do not touch any projection
+JOINED_NAME_FIELDS = ('name', 'medical_record_number')
+
+MedicalRecordRow = namedtuple('MedicalRecordRow', (
+    'id', 'patient_id', 'patient_name', 'medical_record_number', 'doctor_id', 'doctor_name',
+    'visit_date', 'diagnosis', 'record_type'))
+BillingRow = namedtuple('BillingRow', (
+    'id', 'patient_id', 'patient_name', 'total_amount', 'patient_responsibility', 'status',
+    'issued_date', 'due_date'))
+AppointmentRow = namedtuple('AppointmentRow', (
+    'id', 'patient_id', 'patient_name', 'doctor_id', 'doctor_name', 'department_id', 'department_name',
+    'appointment_date', 'appointment_time', 'reason', 'status'))
+PrescriptionRow = namedtuple('PrescriptionRow', (
+    'record_id', 'position', 'patient_id', 'patient_name', 'doctor_id', 'doctor_name', 'medication',
+    'dosage', 'frequency', 'duration', 'instructions', 'prescribed_at', 'urgency', 'status'))
+LabResultRow = namedtuple('LabResultRow', (
+    'record_id', 'position', 'patient_id', 'patient_name', 'test_name', 'result', 'reference_range',
+    'notes', 'recorded_at'))
+
+
+def _name(lookup, collection, record_id, field='name'):
+    """A field of a joined record, or 'Unknown'"""
+    record = lookup(collection, record_id)
+    if record is None:
+        return 'Unknown'
+    return record.get(field) or 'Unknown'
+
+
+def medical_record_rows(record_id, record, lookup):
+    """The list row of a medical record"""
+    patient_id, doctor_id = record.get('patient_id'), record.get('doctor_id')
+    return [(record.get('visit_date') or '', 0, MedicalRecordRow(
+        record_id, patient_id, _name(lookup, 'patients', patient_id),
+        _name(lookup, 'patients', patient_id, 'medical_record_number'), doctor_id,
+        _name(lookup, 'users', doctor_id), record.get('visit_date'), record.get('diagnosis'),
+        record.get('record_type')))]
+
+
+def billing_rows(record_id, record, lookup):
+    """The list row of a bill"""
+    patient_id = record.get('patient_id')
+    return [(record.get('issued_date') or '', 0, BillingRow(
+        record_id, patient_id, _name(lookup, 'patients', patient_id), record.get('total_amount'),
+        record.get('patient_responsibility'), record.get('status'), record.get('issued_date'),
+        record.get('due_date')))]
+
+
+def appointment_rows(record_id, record, lookup):
+    """The list row of an appointment"""
+    patient_id, doctor_id, department_id = (record.get('patient_id'), record.get('doctor_id'),
+                                            record.get('department_id'))
+    return [(record.get('appointment_date') or '', 0, AppointmentRow(
+        record_id, patient_id, _name(lookup, 'patients', patient_id), doctor_id, _name(lookup, 'users', doctor_id),
+        department_id, _name(lookup, 'departments', department_id), record.get('appointment_date'),
+        record.get('appointment_time'), record.get('reason'), record.get('status')))]
+
+
+def prescription_rows(record_id, record, lookup):
+    """One row per prescription written in a medical record"""
+    prescriptions = record.get('prescriptions')
+    if not prescriptions:
+        return []
+    patient_id, doctor_id = record.get('patient_id'), record.get('doctor_id')
+    patient_name, doctor_name = _name(lookup, 'patients', patient_id), _name(lookup, 'users', doctor_id)
+    return [(prescription.get('prescribed_at') or '', position, PrescriptionRow(
+        record_id, position, patient_id, patient_name, doctor_id, doctor_name, prescription.get('medication'),
+        prescription.get('dosage'), prescription.get('frequency'), prescription.get('duration'),
+        prescription.get('instructions'), prescription.get('prescribed_at'),
+        prescription.get('urgency') or DEFAULT_URGENCY, prescription_status(prescription)))
+        for position, prescription in enumerate(prescriptions)]
+
+
+def lab_result_rows(record_id, record, lookup):
+    """One row per lab result recorded in a medical record"""
+    results = record.get('lab_results')
+    if not results:
+        return []
+    patient_id = record.get('patient_id')
+    patient_name = _name(lookup, 'patients', patient_id)
+    return [(result.get('recorded_at') or '', position, LabResultRow(
+        record_id, position, patient_id, patient_name, result.get('test_name'), result.get('result'),
+        result.get('reference_range'), result.get('notes'), result.get('recorded_at')))
+        for position, result in enumerate(results)]
+
+
+# Projection name -> (source collection, row function). Row functions return
+# (sort key, position, row) for each list row a record contributes.
+PROJECTIONS = {
+    'medical_records': ('medical_records', medical_record_rows),
+    'billing_records': ('billing_records', billing_rows),
+    'appointments': ('appointments', appointment_rows),
+    'prescriptions': ('medical_records', prescription_rows),
+    'lab_results': ('medical_records', lab_result_rows)
+}
+
+
+class ListProjection:
+    """
+    Ready-made rows of a list page, joined to patient, doctor and department
+    names when their record is written, and kept sorted by the page's sort
+    key so a page is a slice. Rows are rebuilt when a joined record's name
+    changes, found through a reverse index of the ids each row refers to.
+    The rows are built on the first page read (see reset), so loading the
+    source collection does not load the joined ones.
+    """
+    def __init__(self, row_func, lookup):
+        self.row_func = row_func
+        self.lookup = lookup
+        self.built = False
+        self._entries = []
+        self._rows = {}
+        self._refs = {}
+
+    def _joined_keys(self, row):
+        """(collection, id) keys of the joined records a row refers to"""
+        return [(collection, str(getattr(row, field))) for field, collection in JOIN_FIELDS.items()
+                if getattr(row, field, None) is not None]
+
+    def _link(self, record_id, row):
+        for key in self._joined_keys(row):
+            self._refs.setdefault(key, set()).add(record_id)
+
+    def _unlink(self, record_id, row):
+        for key in self._joined_keys(row):
+            refs = self._refs.get(key)
+            if refs is not None:
+                refs.discard(record_id)
+                if not refs:
+                    del self._refs[key]
+
+    def add(self, record_id, record):
+        """Add the rows of a record"""
+        if not self.built:
+            return
+        rows = self.row_func(record_id, record, self.lookup)
+        entries = self._entries
+        for sort_key, position, row in rows:
+            entry = (sort_key, record_id, position)
+            if not entries or entries[-1] < entry:
+                entries.append(entry)
+            else:
+                insort(entries, entry)
+            self._rows[(record_id, position)] = row
+        if rows:
+            self._link(record_id, rows[0][2])
+
+    def remove(self, record_id, record):
+        """Remove the rows of a record"""
+        if not self.built:
+            return
+        # Sort keys and ids do not depend on the joined names, so skip the lookups
+        rows = self.row_func(record_id, record, lambda collection, joined_id: None)
+        for sort_key, position, _ in rows:
+            entry = (sort_key, record_id, position)
+            i = bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+            self._rows.pop((record_id, position), None)
+        if rows:
+            self._unlink(record_id, rows[0][2])
+
+    def refresh(self, collection, joined_id, records):
+        """Rebuild the rows referring to a joined record (e.g. after a rename)"""
+        if not self.built:
+            return
+        for record_id in list(self._refs.get((collection, str(joined_id)), ())):
+            record = records.get(record_id)
+            if record is not None:
+                self.remove(record_id, record)
+                self.add(record_id, record)
+
+    def page(self, page=1, per_page=50, start=None, end=None, descending=True):
+        """
+        Get one page (numbered from 1) of rows as (rows, total rows), within
+        the inclusive sort key range [start, end]; a date bound (YYYY-MM-DD)
+        covers every timestamp on that day.
+        """
+        entries = self._entries
+        lo = bisect_left(entries, (start,)) if start else 0
+        hi = bisect_right(entries, (end + '\uffff',)) if end else len(entries)
+        total = max(hi - lo, 0)
+        offset = (page - 1) * per_page
+        if descending:
+            selected = entries[max(hi - offset - per_page, lo):max(hi - offset, lo)][::-1]
+        else:
+            selected = entries[min(lo + offset, hi):min(lo + offset + per_page, hi)]
+        return [self._rows[(record_id, position)] for _, record_id, position in selected], total
+
+    def rebuild(self, records):
+        """Rebuild the projection from a collection dict"""
+        # Collect unsorted and sort once; inserting one by one is quadratic
+        entries, self._rows, self._refs = [], {}, {}
+        for record_id, record in records.items():
+            rows = self.row_func(record_id, record, self.lookup)
+            for sort_key, position, row in rows:
+                entries.append((sort_key, record_id, position))
+                self._rows[(record_id, position)] = row
+            if rows:
+                self._link(record_id, rows[0][2])
+        entries.sort()
+        self._entries = entries
+        self.built = True
+
+    def reset(self):
+        """Drop the rows until the next rebuild, e.g. when the source collection is (re)loaded"""
+        self._entries, self._rows, self._refs = [], {}, {}
+        self.built = False
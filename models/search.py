@@ -0,0 +1,275 @@
+"""
+Patient search index for the DataStore
+"""
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from functools import lru_cache
+from heapq import nlargest
+
+# Identifier fields looked up by exact (normalised) value
+IDENTIFIER_FIELDS = ('medical_record_number', 'id_number', 'insurance_number', 'phone')
+
+# Titles and honorifics that are not part of the name itself
+NAME_TITLES = frozenset({'an', 'by', 'bpk', 'dr', 'drg', 'drs', 'dra', 'h', 'hj', 'ibu', 'ir', 'ny', 'nn',
+                         'prof', 'sdr', 'sdri', 'tn'})
+
+# Old (pre-1972) Indonesian spellings and common transliteration variants,
+# applied in order so e.g. Soekarno/Sukarno, Djoko/Joko, Tjahjo/Cahyo,
+# Chairul/Khairul, Ramadhan/Ramadan, Fathur/Fatur and Taufiq/Taufik share a key
+SPELLING_VARIANTS = (('oe', 'u'), ('dj', 'j'), ('tj', 'c'), ('ch', 'kh'), ('dh', 'd'), ('th', 't'),
+                     ('ph', 'f'), ('q', 'k'), ('j', 'y'))
+
+# Score of an exact identifier match; any name match scores below 1 per word
+IDENTIFIER_SCORE = 10.0
+
+# Prefix matches considered per query word, and minimum trigram similarity of a fuzzy match
+MAX_PREFIX_TOKENS = 2000
+MIN_SIMILARITY = 0.5
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_REPEATS = re.compile(r'(.)\1+')
+_FINAL_H = re.compile(r'([aiueo])h$')
+_NON_DIGITS = re.compile(r'\D')
+
+
+@lru_cache(maxsize=65536)
+def canonical_token(token):
+    """Spelling-normalised form of one lower-case name word"""
+    for old, new in SPELLING_VARIANTS:
+        if old in token:
+            token = token.replace(old, new)
+    # Muhammad/Muhamad, Abdullah/Abdulah; Fatimah/Fatima, Aminah/Amina
+    return _FINAL_H.sub(r'\1', _REPEATS.sub(r'\1', token))
+
+
+def name_tokens(name):
+    """Canonical search words of a name, without titles"""
+    if not name:
+        return []
+    if name.isascii():
+        text = name.lower()
+    else:
+        text = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').lower()
+    return [canonical_token(word) for word in _NON_ALNUM.split(text) if word and word not in NAME_TITLES]
+
+
+def normalize_phone(value):
+    """Phone number as local digits (0812..., also for +62 812... and 812...)"""
+    digits = _NON_DIGITS.sub('', value)
+    if digits.startswith('62'):
+        digits = '0' + digits[2:]
+    elif digits.startswith('8'):
+        digits = '0' + digits
+    return digits
+
+
+def identifier_key(field, value):
+    """Normalised lookup key of an identifier value, or None"""
+    if value is None:
+        return None
+    value = str(value)
+    if field == 'medical_record_number':
+        key = value.strip().upper()
+    elif field == 'phone':
+        key = normalize_phone(value)
+    else:
+        key = _NON_DIGITS.sub('', value)
+    return key or None
+
+
+def query_identifier_keys(query):
+    """(field, key) pairs a search query could be an identifier for"""
+    keys = [('medical_record_number', identifier_key('medical_record_number', query))]
+    if len(_NON_DIGITS.sub('', query)) >= 5:
+        keys += [(field, identifier_key(field, query)) for field in ('id_number', 'insurance_number', 'phone')]
+    return [(field, key) for field, key in keys if key]
+
+
+def trigrams(token):
+    """Character trigrams of a word, padded so short words have some"""
+    padded = f"^{token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _add_posting(postings, key, record_id):
+    """Add an id under a key; single ids are stored bare to save memory"""
+    ids = postings.get(key)
+    if ids is None:
+        postings[key] = record_id
+    elif isinstance(ids, set):
+        ids.add(record_id)
+    elif ids != record_id:
+        postings[key] = {ids, record_id}
+
+
+def _remove_posting(postings, key, record_id):
+    """Remove an id from a key; returns True if the key has no ids left"""
+    ids = postings.get(key)
+    if ids is None:
+        return False
+    if isinstance(ids, set):
+        ids.discard(record_id)
+        if len(ids) == 1:
+            postings[key] = next(iter(ids))
+        return False
+    if ids == record_id:
+        del postings[key]
+        return True
+    return False
+
+
+def _ids(postings, key):
+    """The ids under a key as an iterable"""
+    ids = postings.get(key)
+    if ids is None:
+        return ()
+    return ids if isinstance(ids, set) else (ids,)
+
+
+class PatientSearchIndex:
+    """
+    Finds patients by identifier or (partial, misspelt) name.
+    Identifiers (MRN, NIK, BPJS number, phone) are exact hash lookups on
+    their normalised value. Names are split into canonical words (see
+    canonical_token); a query word matches indexed words it is a prefix of,
+    found by bisecting a sorted word list, or words with similar trigrams.
+    Multi-word queries only return patients matching every word.
+    """
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._identifiers = {field: {} for field in IDENTIFIER_FIELDS}
+        self._postings = {}
+        self._words = []
+        self._trigrams = {}
+
+    def _add_word(self, word):
+        insort(self._words, word)
+        for trigram in trigrams(word):
+            self._trigrams.setdefault(trigram, set()).add(word)
+
+    def _remove_word(self, word):
+        i = bisect_left(self._words, word)
+        if i < len(self._words) and self._words[i] == word:
+            del self._words[i]
+        for trigram in trigrams(word):
+            words = self._trigrams.get(trigram)
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del self._trigrams[trigram]
+
+    def add(self, record_id, record):
+        """Index a patient record"""
+        for field in IDENTIFIER_FIELDS:
+            key = identifier_key(field, record.get(field))
+            if key:
+                _add_posting(self._identifiers[field], key, record_id)
+        for word in set(name_tokens(record.get('name'))):
+            if word not in self._postings:
+                self._add_word(word)
+            _add_posting(self._postings, word, record_id)
+
+    def remove(self, record_id, record):
+        """Remove a patient record from the index"""
+        for field in IDENTIFIER_FIELDS:
+            key = identifier_key(field, record.get(field))
+            if key:
+                _remove_posting(self._identifiers[field], key, record_id)
+        for word in set(name_tokens(record.get('name'))):
+            if _remove_posting(self._postings, word, record_id):
+                self._remove_word(word)
+
+    def rebuild(self, records):
+        """Rebuild the index from a collection dict"""
+        self._reset()
+        identifiers, postings = self._identifiers, self._postings
+        for record_id, record in records.items():
+            for field in IDENTIFIER_FIELDS:
+                key = identifier_key(field, record.get(field))
+                if key:
+                    _add_posting(identifiers[field], key, record_id)
+            for word in set(name_tokens(record.get('name'))):
+                _add_posting(postings, word, record_id)
+        # Sort the word list once instead of inserting word by word
+        self._words = sorted(postings)
+        for word in self._words:
+            for trigram in trigrams(word):
+                self._trigrams.setdefault(trigram, set()).add(word)
+
+    def _word_matches(self, query_word):
+        """Indexed words matching a query word, with their score (best first)"""
+        matches = {}
+        words = self._words
+        i = bisect_left(words, query_word)
+        end = min(len(words), i + MAX_PREFIX_TOKENS)
+        while i < end and words[i].startswith(query_word):
+            word = words[i]
+            matches[word] = 1.0 if word == query_word else 0.6 + 0.4 * len(query_word) / len(word)
+            i += 1
+        if len(query_word) >= 3:
+            query_trigrams = trigrams(query_word)
+            overlaps = Counter()
+            for trigram in query_trigrams:
+                overlaps.update(self._trigrams.get(trigram, ()))
+            for word, overlap in overlaps.items():
+                # A padded word of n letters has n trigrams
+                similarity = 2 * overlap / (len(query_trigrams) + len(word))
+                if similarity >= MIN_SIMILARITY and word not in matches:
+                    matches[word] = 0.8 * similarity
+        return sorted(matches.items(), key=lambda item: -item[1])
+
+    def _name_scores(self, words, limit):
+        """{record id: score} of the patients matching every query word"""
+        matches = [self._word_matches(word) for word in words]
+        if not all(matches):
+            return {}
+        if len(matches) == 1:
+            # Best words first, so the top results are known without scoring everyone
+            scores = {}
+            for word, score in matches[0]:
+                for record_id in _ids(self._postings, word):
+                    scores.setdefault(record_id, score)
+                if len(scores) >= limit:
+                    break
+            return scores
+        # Narrow down the candidates with set operations, starting from the query
+        # word with the fewest patients, then score only the patients left
+        postings = self._postings
+        matches.sort(key=lambda word_matches: sum(len(_ids(postings, word)) for word, _ in word_matches))
+        candidates = set().union(*(_ids(postings, word) for word, _ in matches[0]))
+        for word_matches in matches[1:]:
+            candidates = set().union(*(candidates.intersection(_ids(postings, word)) for word, _ in word_matches))
+            if not candidates:
+                return {}
+        scores = dict.fromkeys(candidates, 0.0)
+        for word_matches in matches:
+            remaining = set(candidates)
+            for word, score in word_matches:
+                hits = remaining.intersection(_ids(postings, word))
+                for record_id in hits:
+                    scores[record_id] += score
+                remaining -= hits
+                if not remaining:
+                    break
+        return scores
+
+    def search(self, query, limit=10):
+        """
+        Get up to `limit` (record id, score, matched field) results for a
+        query, best first. Identifier matches rank above name matches.
+        """
+        results = {}
+        for field, key in query_identifier_keys(query):
+            for record_id in _ids(self._identifiers[field], key):
+                results.setdefault(record_id, (IDENTIFIER_SCORE, field))
+        words = name_tokens(query)
+        if words:
+            scores = self._name_scores(words, limit)
+            for record_id in nlargest(limit, scores, key=lambda record_id: (scores[record_id], str(record_id))):
+                results.setdefault(record_id, (scores[record_id], 'name'))
+        top = nlargest(limit, results.items(), key=lambda item: (item[1][0], str(item[0])))
+        return [(record_id, score, field) for record_id, (score, field) in top]
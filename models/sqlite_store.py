@@ -0,0 +1,833 @@
+"""
+SQLite-backed DataStore
+Keeps the DataStore method surface but stores every collection in an
+indexed SQLite table, so several gunicorn workers share one consistent
+dataset instead of each holding its own in-memory copy.
+"""
+import json
+import logging
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+
+from models.appointment import Appointment
+from models.data_store import DataStore, COLLECTIONS, PAGE_SORTS, PAGE_FILTERS
+from models.indexes import appointment_day
+from models.aggregates import EXCLUDED_STATUSES
+from models.duplicates import DUPLICATE_THRESHOLD, MAX_BLOCK_SIZE, block_keys, block_pairs, match_score, score_pairs
+from models.projections import PROJECTIONS, prescription_rows
+from models.prescription_queue import PENDING, prescription_status, queue_entry
+from models.lab_index import COMPLETED, LAB_FINAL_STATUSES, test_key, worklist_entry, worklist_row
+from models.timeline import TIMELINE_SOURCES, timeline_entries
+from models.vitals import VITAL_PARAMETERS, VITALS_SOURCES, VitalsIndex, VitalsLog, parse_vitals, to_timestamp
+from models.search import (IDENTIFIER_FIELDS, IDENTIFIER_SCORE, identifier_key, name_tokens,
+                           query_identifier_keys)
+from models.persistence import encode_default
+from models.views import views
+
+TABLE_PREFIX = 'ds_'
+
+# Record fields stored in their own indexed column
+COLUMNS = ('patient_id', 'day', 'department_id', 'doctor_id', 'status')
+
+# Date field ordering each list view; views without one list items nested
+# in the source records, which are kept one row each in NESTED_TABLE
+PROJECTION_SORTS = {'medical_records': 'visit_date', 'billing_records': 'issued_date',
+                    'appointments': 'appointment_date'}
+NESTED_VIEWS = tuple(name for name in PROJECTIONS if name not in PROJECTION_SORTS)
+
+# Items nested in records (prescriptions, lab results): view name, record id,
+# position and sort key of each, so their list pages are read by index;
+# prescriptions also keep their status and urgency rank for the pharmacy queue
+NESTED_TABLE = f"{TABLE_PREFIX}nested_items"
+
+# Patient search terms ("<identifier field>:<key>", "name:<word>" and duplicate
+# detection "block:<key>") -> patient id
+SEARCH_TABLE = f"{TABLE_PREFIX}patient_terms"
+
+# Vitals readings of inpatient stays, one row each: patient id, time (seconds
+# since the epoch) and a column per parameter, NULL when not taken
+VITALS_TABLE = f"{TABLE_PREFIX}vitals"
+
+
+def _column_value(value):
+    """Indexed columns are compared as strings, like JSON-loaded keys"""
+    return None if value is None else str(value)
+
+
+def _field_expr(field):
+    """SQL expression reading a record field"""
+    if field in COLUMNS:
+        return field
+    return f"json_extract(data, '$.{field}')"
+
+
+def _search_terms(record):
+    """Search terms of a patient record, as indexed by PatientSearchIndex and DuplicateIndex"""
+    terms = []
+    for field in IDENTIFIER_FIELDS:
+        key = identifier_key(field, record.get(field))
+        if key:
+            terms.append(f"{field}:{key}")
+    terms += [f"name:{word}" for word in set(name_tokens(record.get('name')))]
+    terms += [f"block:{key}" for key in block_keys(record)]
+    return terms
+
+
+def _vitals_rows(series):
+    """(time, values by parameter) readings of one patient's VitalsLog.snapshot() series"""
+    readings = {}
+    for parameter, (times, values) in series.items():
+        for timestamp, value in zip(times, values):
+            rows = readings.setdefault(timestamp, [])
+            row = next((row for row in rows if parameter not in row), None)
+            if row is None:
+                row = {}
+                rows.append(row)
+            row[parameter] = value
+    return [(timestamp, row) for timestamp, rows in readings.items() for row in rows]
+
+
+def _sort_expr(field):
+    """SQL sort key expression; missing values sort first, as in SortedIndex"""
+    return f"COALESCE({_field_expr(field)}, '')"
+
+
+class SQLiteCollection(MutableMapping):
+    """
+    Dict-like view of one collection table.
+    Rows are stored as JSON next to a few indexed columns used for lookups.
+    """
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self.table = f"{TABLE_PREFIX}{name}"
+
+    def create(self, connection):
+        """Create the table and its indexes"""
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "id TEXT PRIMARY KEY, patient_id TEXT, day TEXT, department_id TEXT, "
+            "doctor_id TEXT, status TEXT, data TEXT NOT NULL)"))
+        for column in COLUMNS:
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{self.table}_{column} ON {self.table} ({column})"))
+        # Keyset pagination indexes: (sort key, id), optionally prefixed by a filter field
+        for sort in PAGE_SORTS.get(self.name, ()):
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{self.table}_by_{sort} "
+                f"ON {self.table} ({_sort_expr(sort)}, id)"))
+            for field in PAGE_FILTERS[self.name]:
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{self.table}_{field}_by_{sort} "
+                    f"ON {self.table} ({_field_expr(field)}, {_sort_expr(sort)}, id)"))
+        if self.name == 'patients':
+            self._create_search_terms(connection)
+        if self._nested_views():
+            self._create_nested_items(connection)
+
+    def _create_search_terms(self, connection):
+        """Create the patient search term table, filling it for existing patients"""
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (term TEXT NOT NULL, patient_id TEXT NOT NULL)"))
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_term ON {SEARCH_TABLE} (term)"))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_patient_id ON {SEARCH_TABLE} (patient_id)"))
+        if connection.execute(text(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")).first() is None:
+            rows = connection.execute(text(f"SELECT id, data FROM {self.table}")).fetchall()
+            self._write_search_terms(connection, [(record_id, json.loads(data)) for record_id, data in rows])
+
+    def _write_search_terms(self, connection, records):
+        """Replace the search terms of (id, record) pairs of the patients table"""
+        if self.name != 'patients' or not records:
+            return
+        connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE patient_id = :id"),
+                           [{'id': str(record_id)} for record_id, _ in records])
+        terms = [{'term': term, 'id': str(record_id)}
+                 for record_id, record in records for term in _search_terms(record)]
+        if terms:
+            connection.execute(text(f"INSERT INTO {SEARCH_TABLE} (term, patient_id) VALUES (:term, :id)"), terms)
+
+    def _nested_views(self):
+        """Names of the nested list views whose items live in this collection"""
+        return [name for name in NESTED_VIEWS if PROJECTIONS[name][0] == self.name]
+
+    def _create_nested_items(self, connection):
+        """Create the nested item table, filling it from existing records when it is new"""
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                    {'name': NESTED_TABLE}).first()
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {NESTED_TABLE} (view TEXT NOT NULL, record_id TEXT NOT NULL, "
+            "position INTEGER NOT NULL, sort_key TEXT NOT NULL, status TEXT, rank INTEGER)"))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{NESTED_TABLE}_by_sort_key "
+            f"ON {NESTED_TABLE} (view, sort_key, record_id, position)"))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{NESTED_TABLE}_queue "
+            f"ON {NESTED_TABLE} (view, status, rank, sort_key, record_id, position)"))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{NESTED_TABLE}_record_id ON {NESTED_TABLE} (record_id)"))
+        if exists is None:
+            rows = connection.execute(text(f"SELECT id, data FROM {self.table}")).fetchall()
+            self._write_nested_items(connection, [(record_id, json.loads(data)) for record_id, data in rows])
+
+    def _write_nested_items(self, connection, records):
+        """Replace the nested items of (id, record) pairs"""
+        views = self._nested_views()
+        if not views or not records:
+            return
+        connection.execute(text(f"DELETE FROM {NESTED_TABLE} WHERE record_id = :id"),
+                           [{'id': str(record_id)} for record_id, _ in records])
+        items = []
+        for name in views:
+            for record_id, record in records:
+                # Sort keys and positions do not depend on joined names, so skip the lookups
+                for sort_key, position, _ in PROJECTIONS[name][1](record_id, record, lambda *_: None):
+                    item = {'view': name, 'id': str(record_id), 'position': position, 'sort_key': sort_key,
+                            'status': None, 'rank': None}
+                    if name == 'prescriptions':
+                        prescription = record['prescriptions'][position]
+                        item['status'] = prescription_status(prescription)
+                        item['rank'] = queue_entry(record_id, position, prescription)[0]
+                    items.append(item)
+        if items:
+            connection.execute(text(
+                f"INSERT INTO {NESTED_TABLE} (view, record_id, position, sort_key, status, rank) "
+                "VALUES (:view, :id, :position, :sort_key, :status, :rank)"), items)
+
+    def _columns(self, record_id, record):
+        """Values of the indexed columns for a record"""
+        patient_id = record.get('patient_id')
+        if patient_id is None and self.name == 'inpatients':
+            patient_id = record_id
+        return {
+            'id': str(record_id),
+            'patient_id': _column_value(patient_id),
+            'day': appointment_day(record) if self.name == 'appointments' else None,
+            'department_id': _column_value(record.get('department_id')),
+            'doctor_id': _column_value(record.get('doctor_id')),
+            'status': _column_value(record.get('status')),
+            'data': json.dumps(record, default=encode_default)
+        }
+
+    def update(self, record_id, update):
+        """
+        Change a record with compare-and-set: `update` gets the current record
+        (or None) and returns the new one, or None to leave it as it is. The
+        write only applies if the row is unchanged since it was read, and is
+        retried otherwise. Returns the new record or None.
+        """
+        while True:
+            with self.engine.connect() as connection:
+                row = connection.execute(text(f"SELECT data FROM {self.table} WHERE id = :id"),
+                                         {'id': str(record_id)}).first()
+            expected = row[0] if row is not None else None
+            record = update(json.loads(expected) if expected is not None else None)
+            if record is None:
+                return None
+            params = dict(self._columns(record_id, record), expected=expected)
+            with self.engine.begin() as connection:
+                if expected is None:
+                    result = connection.execute(text(
+                        f"INSERT OR IGNORE INTO {self.table} "
+                        "(id, patient_id, day, department_id, doctor_id, status, data) "
+                        "VALUES (:id, :patient_id, :day, :department_id, :doctor_id, :status, :data)"), params)
+                else:
+                    result = connection.execute(text(
+                        f"UPDATE {self.table} SET patient_id = :patient_id, day = :day, "
+                        "department_id = :department_id, doctor_id = :doctor_id, status = :status, data = :data "
+                        "WHERE id = :id AND data = :expected"), params)
+                if result.rowcount == 0:
+                    # Another worker changed the row in between: read it again
+                    continue
+                self._write_search_terms(connection, [(record_id, record)])
+                self._write_nested_items(connection, [(record_id, record)])
+                _bump_version(connection, self.name)
+            return record
+
+    def __getitem__(self, record_id):
+        with self.engine.connect() as connection:
+            row = connection.execute(text(f"SELECT data FROM {self.table} WHERE id = :id"),
+                                     {'id': str(record_id)}).first()
+        if row is None:
+            raise KeyError(record_id)
+        return json.loads(row[0])
+
+    def __setitem__(self, record_id, record):
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"INSERT OR REPLACE INTO {self.table} "
+                "(id, patient_id, day, department_id, doctor_id, status, data) "
+                "VALUES (:id, :patient_id, :day, :department_id, :doctor_id, :status, :data)"),
+                self._columns(record_id, record))
+            self._write_search_terms(connection, [(record_id, record)])
+            self._write_nested_items(connection, [(record_id, record)])
+            _bump_version(connection, self.name)
+
+    def __delitem__(self, record_id):
+        with self.engine.begin() as connection:
+            result = connection.execute(text(f"DELETE FROM {self.table} WHERE id = :id"),
+                                        {'id': str(record_id)})
+            if self.name == 'patients':
+                connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE patient_id = :id"),
+                                   {'id': str(record_id)})
+            if self._nested_views():
+                connection.execute(text(f"DELETE FROM {NESTED_TABLE} WHERE record_id = :id"),
+                                   {'id': str(record_id)})
+        if result.rowcount == 0:
+            raise KeyError(record_id)
+
+    def __contains__(self, record_id):
+        with self.engine.connect() as connection:
+            return connection.execute(text(f"SELECT 1 FROM {self.table} WHERE id = :id"),
+                                      {'id': str(record_id)}).first() is not None
+
+    def __iter__(self):
+        return (record_id for record_id, _ in self.items())
+
+    def __len__(self):
+        with self.engine.connect() as connection:
+            return connection.execute(text(f"SELECT COUNT(*) FROM {self.table}")).scalar()
+
+    def items(self):
+        """All (id, record) pairs in insertion order, fetched with one query"""
+        return list(self.where())
+
+    def values(self):
+        """All records in insertion order, fetched with one query"""
+        return [record for _, record in self.where()]
+
+    def where(self, clause=None, params=None, order_by='rowid'):
+        """(id, record) pairs matching an SQL condition on the indexed columns"""
+        sql = f"SELECT id, data FROM {self.table}"
+        if clause:
+            sql += f" WHERE {clause}"
+        sql += f" ORDER BY {order_by}"
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(sql), params or {}).fetchall()
+        return [(record_id, json.loads(data)) for record_id, data in rows]
+
+    def count(self, clause, params=None):
+        """Number of rows matching an SQL condition on the indexed columns"""
+        with self.engine.connect() as connection:
+            return connection.execute(text(f"SELECT COUNT(*) FROM {self.table} WHERE {clause}"),
+                                      params or {}).scalar()
+
+    def bulk_load(self, connection, records):
+        """Insert many records in one transaction"""
+        if records:
+            connection.execute(text(
+                f"INSERT OR REPLACE INTO {self.table} "
+                "(id, patient_id, day, department_id, doctor_id, status, data) "
+                "VALUES (:id, :patient_id, :day, :department_id, :doctor_id, :status, :data)"),
+                [self._columns(record_id, record) for record_id, record in records.items()])
+            self._write_search_terms(connection, list(records.items()))
+            self._write_nested_items(connection, list(records.items()))
+            _bump_version(connection, self.name)
+
+
+def _bump_version(connection, name):
+    """Increment a collection's change counter inside the writing transaction"""
+    connection.execute(text(
+        f"INSERT INTO {TABLE_PREFIX}versions (name, version) VALUES (:name, 1) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1"), {'name': name})
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    """Per-connection SQLite settings for concurrent workers"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+class SQLiteDataStore(DataStore):
+    """
+    DataStore backend storing collections in SQLite tables (WAL mode).
+    Every write goes straight to the database, so there is nothing to flush
+    and all workers sharing the database file see the same data.
+    """
+    def __init__(self, engine, **kwargs):
+        # Journal, write-behind and activity segment settings do not apply
+        # to this backend; activities are kept in their own table
+        kwargs.pop('journal_file', None)
+        kwargs.pop('activity_dir', None)
+        super().__init__(**kwargs)
+        self.engine = engine
+        event.listen(engine, 'connect', _configure_connection)
+        # Connections opened before the listener was added lack its settings
+        engine.dispose()
+        for name in COLLECTIONS:
+            self.__dict__[name] = SQLiteCollection(engine, name)
+
+    def _put(self, collection, record_id, record):
+        """Store a record; the table indexes replace the in-memory ones"""
+        getattr(self, collection)[record_id] = record
+
+    def _update(self, collection, record_id, update):
+        """Change a record atomically across workers, by compare-and-set on its row"""
+        return getattr(self, collection).update(record_id, update)
+
+    def _get_by_patient(self, collection, patient_id):
+        """Get the raw records of a collection belonging to a patient"""
+        return [record for _, record in getattr(self, collection).where(
+            'patient_id = :patient_id', {'patient_id': _column_value(patient_id)})]
+
+    def _timeline_sources(self, patient_id):
+        """Timeline entries of a patient, sorted from the rows of each collection"""
+        sources, records = {}, {}
+        for name in TIMELINE_SOURCES:
+            records[name] = dict(getattr(self, name).where(
+                'patient_id = :patient_id', {'patient_id': _column_value(patient_id)}))
+            sources[name] = sorted(entry for record_id, record in records[name].items()
+                                   for entry in timeline_entries(name, record_id, record))
+        return sources, records
+
+    def search_patients(self, query, limit=10):
+        """
+        Find patients by MRN, NIK, BPJS number, phone or (partial) name.
+        Names match by canonical word prefix; unlike the in-memory index
+        there is no trigram matching of misspelt words.
+        """
+        results = {}
+        with self.engine.connect() as connection:
+            identifier_terms = {f"{field}:{key}": field for field, key in query_identifier_keys(query)}
+            for term, field in identifier_terms.items():
+                for (patient_id,) in connection.execute(text(
+                        f"SELECT patient_id FROM {SEARCH_TABLE} WHERE term = :term"), {'term': term}):
+                    results.setdefault(patient_id, (IDENTIFIER_SCORE, field))
+            words = name_tokens(query)
+            if words:
+                # One (patient, best score) row per matched query word; patients need all words
+                parts, params = [], {'limit': limit}
+                for i, word in enumerate(words):
+                    params.update({f'w{i}': f"name:{word}", f'hi{i}': f"name:{word}\uffff", f'n{i}': len(word)})
+                    parts.append(
+                        f"SELECT patient_id, MAX(CASE WHEN term = :w{i} THEN 1.0 "
+                        f"ELSE 0.6 + 0.4 * :n{i} / (length(term) - 5) END) AS score FROM {SEARCH_TABLE} "
+                        f"WHERE term >= :w{i} AND term < :hi{i} GROUP BY patient_id")
+                rows = connection.execute(text(
+                    f"SELECT patient_id, SUM(score) FROM ({' UNION ALL '.join(parts)}) "
+                    f"GROUP BY patient_id HAVING COUNT(*) = {len(words)} "
+                    "ORDER BY 2 DESC, 1 DESC LIMIT :limit"), params).fetchall()
+                for patient_id, score in rows:
+                    results.setdefault(patient_id, (score, 'name'))
+        top = sorted(results.items(), key=lambda item: (item[1][0], item[0]), reverse=True)[:limit]
+        if not top:
+            return []
+        patients = self._patients_by_id(patient_id for patient_id, _ in top)
+        return [(patients[patient_id], score, field) for patient_id, (score, field) in top
+                if patient_id in patients]
+
+    def _patients_by_id(self, patient_ids):
+        """{id: record} of the given patients, fetched in chunks"""
+        patient_ids = list(patient_ids)
+        patients = {}
+        for i in range(0, len(patient_ids), 500):
+            params = {f'id{n}': patient_id for n, patient_id in enumerate(patient_ids[i:i + 500])}
+            patients.update(self.patients.where(f"id IN ({', '.join(':' + name for name in params)})", params))
+        return patients
+
+    def find_patient_duplicates(self, record, limit=5, threshold=DUPLICATE_THRESHOLD):
+        """Find likely duplicates of a patient record among the patients sharing a block term"""
+        candidates = set()
+        with self.engine.connect() as connection:
+            for key in block_keys(record):
+                ids = [patient_id for (patient_id,) in connection.execute(text(
+                    f"SELECT patient_id FROM {SEARCH_TABLE} WHERE term = :term LIMIT {MAX_BLOCK_SIZE + 1}"),
+                    {'term': f"block:{key}"})]
+                if len(ids) <= MAX_BLOCK_SIZE:
+                    candidates.update(ids)
+        candidates.discard(str(record.get('id')))
+        scored = [(candidate, match_score(record, candidate))
+                  for candidate in self._patients_by_id(candidates).values()]
+        scored = [item for item in scored if item[1] >= threshold]
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+    def find_duplicate_patients(self, threshold=DUPLICATE_THRESHOLD):
+        """Get (patient id, patient id, score) of all likely duplicate pairs, best first"""
+        blocks = {}
+        with self.engine.connect() as connection:
+            for term, patient_id in connection.execute(text(
+                    f"SELECT term, patient_id FROM {SEARCH_TABLE} WHERE term >= 'block:' AND term < 'block;'")):
+                blocks.setdefault(term, []).append(patient_id)
+        pairs = block_pairs(blocks.values())
+        return score_pairs(pairs, self._patients_by_id({record_id for pair in pairs for record_id in pair}),
+                           threshold)
+
+    def get_appointments_by_date(self, date):
+        """Get read-only views of all appointments for a specific date"""
+        return views(Appointment, [a for _, a in self.appointments.where('day = :day', {'day': date})])
+
+    def get_appointments_between(self, start=None, end=None):
+        """Get read-only views of the appointments between two dates (YYYY-MM-DD, inclusive), ordered by date"""
+        clauses, params = ['day IS NOT NULL'], {}
+        if start:
+            clauses.append('day >= :start')
+            params['start'] = start
+        if end:
+            clauses.append('day <= :end')
+            params['end'] = end
+        return views(Appointment, [a for _, a in
+                                   self.appointments.where(' AND '.join(clauses), params, order_by='day, rowid')])
+
+    def page(self, collection, sort=None, after=None, limit=100, start=None, end=None,
+             descending=False, **filters):
+        """Get one page of a collection in sort order, as (records, next cursor)"""
+        sort = sort or PAGE_SORTS[collection][0]
+        if sort not in PAGE_SORTS[collection]:
+            raise ValueError(f"Cannot sort {collection} by {sort}")
+        sort_expr = _sort_expr(sort)
+        clauses, params = [], {'limit': limit + 1}
+        for i, (field, value) in enumerate(filters.items()):
+            if value is None:
+                continue
+            if field not in PAGE_FILTERS[collection]:
+                raise ValueError(f"Cannot filter on {field}")
+            clauses.append(f"{_field_expr(field)} = :filter_{i}")
+            params[f"filter_{i}"] = str(value)
+        if start:
+            clauses.append(f"{sort_expr} >= :start")
+            params['start'] = start
+        if end:
+            # A date bound (YYYY-MM-DD) covers every timestamp on that day
+            clauses.append(f"{sort_expr} <= :end")
+            params['end'] = end + '\uffff'
+        if after is not None:
+            clauses.append(f"({sort_expr}, id) {'<' if descending else '>'} (:after_key, :after_id)")
+            params['after_key'], params['after_id'] = after
+        direction = 'DESC' if descending else 'ASC'
+        table = getattr(self, collection).table
+        sql = f"SELECT {sort_expr}, id, data FROM {table}"
+        if clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        sql += f" ORDER BY {sort_expr} {direction}, id {direction} LIMIT :limit"
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(sql), params).fetchall()
+        page = [json.loads(data) for _, _, data in rows[:limit]]
+        next_after = tuple(rows[limit - 1][:2]) if len(rows) > limit else None
+        return page, next_after
+
+    def _page_lookup(self):
+        """A lookup of joined records that reads each one once, for the rows of one page"""
+        joined = {}
+
+        def lookup(joined_collection, record_id):
+            key = (joined_collection, str(record_id))
+            if key not in joined:
+                joined[key] = getattr(self, joined_collection).get(str(record_id)) if record_id is not None else None
+            return joined[key]
+        return lookup
+
+    def list_page(self, name, page=1, per_page=50, start=None, end=None, descending=True):
+        """Get one page of a list view, joining names for the rows on the page only"""
+        source, row_func = PROJECTIONS[name]
+        collection = getattr(self, source)
+        lookup = self._page_lookup()
+
+        sort = PROJECTION_SORTS.get(name)
+        if sort is None:
+            return self._nested_page(name, page, per_page, start, end, descending)
+
+        sort_expr = _sort_expr(sort)
+        clauses, params = [], {'limit': per_page, 'offset': (page - 1) * per_page}
+        if start:
+            clauses.append(f"{sort_expr} >= :start")
+            params['start'] = start
+        if end:
+            clauses.append(f"{sort_expr} <= :end")
+            params['end'] = end + '\uffff'
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        direction = 'DESC' if descending else 'ASC'
+        with self.engine.connect() as connection:
+            total = connection.execute(text(f"SELECT COUNT(*) FROM {collection.table}{where}"), params).scalar()
+            records = connection.execute(text(
+                f"SELECT id, data FROM {collection.table}{where} "
+                f"ORDER BY {sort_expr} {direction}, id {direction} LIMIT :limit OFFSET :offset"), params).fetchall()
+        return [row_func(record_id, json.loads(data), lookup)[0][2] for record_id, data in records], total
+
+    def _nested_page(self, name, page, per_page, start, end, descending):
+        """One page of a nested list view, read through the nested item index"""
+        source, row_func = PROJECTIONS[name]
+        clauses, params = ['view = :view'], {'view': name, 'limit': per_page, 'offset': (page - 1) * per_page}
+        if start:
+            clauses.append('sort_key >= :start')
+            params['start'] = start
+        if end:
+            clauses.append('sort_key <= :end')
+            params['end'] = end + '\uffff'
+        where = ' AND '.join(clauses)
+        direction = 'DESC' if descending else 'ASC'
+        with self.engine.connect() as connection:
+            total = connection.execute(text(f"SELECT COUNT(*) FROM {NESTED_TABLE} WHERE {where}"), params).scalar()
+            items = connection.execute(text(
+                f"SELECT n.record_id, n.position, r.data FROM {NESTED_TABLE} n "
+                f"JOIN {getattr(self, source).table} r ON r.id = n.record_id WHERE {where} "
+                f"ORDER BY n.sort_key {direction}, n.record_id {direction}, n.position {direction} "
+                "LIMIT :limit OFFSET :offset"), params).fetchall()
+        lookup, rows = self._page_lookup(), {}
+        for record_id, _, data in items:
+            if record_id not in rows:
+                rows[record_id] = {position: row for _, position, row in row_func(record_id, json.loads(data), lookup)}
+        return [rows[record_id][position] for record_id, position, _ in items], total
+
+    def get_pending_prescriptions(self, page=1, per_page=50):
+        """Get one page of the pharmacy queue, read through the status and urgency columns of the nested items"""
+        where = "n.view = 'prescriptions' AND n.status = :status"
+        params = {'status': PENDING, 'limit': per_page, 'offset': (page - 1) * per_page}
+        with self.engine.connect() as connection:
+            total = connection.execute(text(f"SELECT COUNT(*) FROM {NESTED_TABLE} n WHERE {where}"), params).scalar()
+            rows = connection.execute(text(
+                f"SELECT n.record_id, n.position, r.data FROM {NESTED_TABLE} n "
+                f"JOIN {self.medical_records.table} r ON r.id = n.record_id WHERE {where} "
+                "ORDER BY n.rank, n.sort_key, n.record_id, n.position LIMIT :limit OFFSET :offset"), params).fetchall()
+        lookup = self._page_lookup()
+        return [prescription_rows(record_id, json.loads(data), lookup)[position][2]
+                for record_id, position, data in rows], total
+
+    def get_lab_worklist(self):
+        """Get the active lab requests, read through the status column and sorted by priority"""
+        final = ', '.join(f"'{status}'" for status in LAB_FINAL_STATUSES)
+        requests = self.lab_requests.where(f"status IS NULL OR status NOT IN ({final})")
+        requests.sort(key=lambda item: worklist_entry(*item))
+        lookup = self._page_lookup()
+        return [worklist_row(request_id, request, lookup) for request_id, request in requests]
+
+    def get_completed_lab_requests(self, start=None, end=None):
+        """Get the lab requests completed between two dates, read through the status column"""
+        completed = [request for _, request in self.lab_requests.where('status = :status', {'status': COMPLETED})
+                     if request.get('completed_at') and (not start or request['completed_at'] >= start)
+                     and (not end or request['completed_at'] <= end + '\uffff')]
+        completed.sort(key=lambda request: request['completed_at'])
+        return completed
+
+    def _lab_result_series(self, patient_id, test_name):
+        """(time, result) of a patient's results of one test, read from the patient's medical records"""
+        key = test_key(test_name)
+        results = [((result.get('recorded_at') or record.get('visit_date') or '', record_id, position),
+                    dict(result, record_id=record_id))
+                   for record_id, record in self.medical_records.where(
+                       'patient_id = :patient_id', {'patient_id': _column_value(patient_id)})
+                   for position, result in enumerate(record.get('lab_results') or ())
+                   if result.get('test_name') and test_key(result['test_name']) == key]
+        results.sort(key=lambda item: item[0])
+        return [(time, result) for (time, _, _), result in results]
+
+    def add_vitals(self, patient_id, vitals):
+        """Record a vitals reading of a patient's active stay, checking the stay in the same statement"""
+        values = parse_vitals(vitals)
+        timestamp = to_timestamp(vitals.get('recorded_at') or datetime.now().isoformat())
+        if not values or timestamp is None:
+            return False
+        params = {parameter: values.get(parameter) for parameter in VITAL_PARAMETERS}
+        params.update(patient_id=_column_value(patient_id), recorded_at=timestamp)
+        with self.engine.begin() as connection:
+            added = connection.execute(text(
+                f"INSERT INTO {VITALS_TABLE} (patient_id, recorded_at, {', '.join(VITAL_PARAMETERS)}) "
+                f"SELECT :patient_id, :recorded_at, {', '.join(':' + parameter for parameter in VITAL_PARAMETERS)} "
+                f"WHERE EXISTS (SELECT 1 FROM {self.inpatients.table} WHERE id = :patient_id "
+                "AND json_extract(data, '$.discharge_date') IS NULL)"), params).rowcount
+            if added:
+                _bump_version(connection, 'vitals')
+        return bool(added)
+
+    def _vitals_log(self, patient_id=None):
+        """A VitalsLog of the vitals table rows, or of one patient's rows"""
+        clause, params = ('patient_id = :patient_id', {'patient_id': _column_value(patient_id)}) \
+            if patient_id is not None else ('1', {})
+        log = VitalsLog()
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                f"SELECT patient_id, recorded_at, {', '.join(VITAL_PARAMETERS)} FROM {VITALS_TABLE} "
+                f"WHERE {clause} ORDER BY recorded_at"), params).fetchall()
+        for row_patient_id, recorded_at, *values in rows:
+            # One patient's readings are read back under the id asked for
+            log.append(row_patient_id if patient_id is None else patient_id, recorded_at,
+                       {parameter: value for parameter, value in zip(VITAL_PARAMETERS, values) if value is not None})
+        return log
+
+    @property
+    def vitals(self):
+        return self._vitals_log()
+
+    def _vitals_sources(self, patient_id):
+        """Vitals indexes built from the patient's rows of each source collection and of the vitals table"""
+        params = {'patient_id': _column_value(patient_id)}
+        sources = []
+        for name in VITALS_SOURCES:
+            source = VitalsIndex(name, lambda record_id, record: patient_id)
+            source.rebuild(dict(getattr(self, name).where('patient_id = :patient_id', params)))
+            sources.append(source)
+        return sources + [self._vitals_log(patient_id)]
+
+    def get_outpatient_count(self):
+        """Get today's outpatient count"""
+        return self.appointments.count('day = :day', {'day': datetime.now().strftime('%Y-%m-%d')})
+
+    def get_inpatient_count(self):
+        """Get current inpatient count"""
+        return self.inpatients.count("json_extract(data, '$.discharge_date') IS NULL")
+
+    def get_doctor_count(self):
+        """Get the number of doctors"""
+        return self.users.count("json_extract(data, '$.role') = 'doctor'")
+
+    def _rebuild_indexes(self):
+        """The table indexes are maintained by SQLite"""
+
+    def _visit_rows(self, group_expr, days, department_id=None):
+        """(group, visits) rows for appointments from X days ago onwards (cancelled ones excluded)"""
+        params = {'start': (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')}
+        clause = 'day >= :start'
+        for i, status in enumerate(sorted(EXCLUDED_STATUSES)):
+            clause += f' AND status IS NOT :status{i}'
+            params[f'status{i}'] = status
+        if department_id is not None:
+            clause += ' AND department_id = :department_id'
+            params['department_id'] = _column_value(department_id)
+        with self.engine.connect() as connection:
+            return connection.execute(text(
+                f"SELECT {group_expr}, COUNT(*) FROM {self.appointments.table} "
+                f"WHERE {clause} GROUP BY 1"), params).fetchall()
+
+    def get_department_visits(self, days=30):
+        """Get visit statistics by department for past X days"""
+        department_visits = {dept_id: 0 for dept_id in self.departments.keys()}
+        by_column = {_column_value(dept_id): dept_id for dept_id in department_visits}
+        for department_id, visits in self._visit_rows('department_id', days):
+            if department_id in by_column:
+                department_visits[by_column[department_id]] += visits
+        return department_visits
+
+    def get_doctor_visits(self, days=30):
+        """Get visit statistics by doctor for past X days"""
+        return {doctor_id: visits for doctor_id, visits in self._visit_rows('doctor_id', days)
+                if doctor_id is not None}
+
+    def get_weekday_visits(self, days=30, department_id=None):
+        """Get visits per day of the week (Monday first) for past X days, optionally for one department"""
+        weekdays = [0] * 7
+        # strftime('%w') counts from Sunday
+        for weekday, visits in self._visit_rows("CAST(strftime('%w', day) AS INTEGER)", days, department_id):
+            weekdays[(weekday + 6) % 7] += visits
+        return weekdays
+
+    def log_activity(self, activity):
+        """Log system activity"""
+        with self.engine.begin() as connection:
+            seq = connection.execute(text(
+                f"INSERT INTO {TABLE_PREFIX}activities (timestamp, data) VALUES (:timestamp, :data)"),
+                {'timestamp': activity.get('timestamp'), 'data': json.dumps(activity)}).lastrowid
+            connection.execute(text(f"DELETE FROM {TABLE_PREFIX}activities WHERE seq <= :oldest"),
+                               {'oldest': seq - self.activity_retention})
+            _bump_version(connection, 'activities')
+
+    def get_recent_activities(self, limit=10):
+        """Get recent activities"""
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                f"SELECT data FROM {TABLE_PREFIX}activities ORDER BY timestamp DESC LIMIT :limit"),
+                {'limit': limit}).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    @property
+    def activities(self):
+        return self.get_recent_activities(self.activity_retention)[::-1]
+
+    def collection_version(self, collection):
+        """Get the change counter of a collection"""
+        with self.engine.connect() as connection:
+            return connection.execute(text(
+                f"SELECT version FROM {TABLE_PREFIX}versions WHERE name = :name"),
+                {'name': collection}).scalar() or 0
+
+    def etag(self, *collections):
+        """Get a strong ETag for the current contents of the given collections"""
+        with self.engine.connect() as connection:
+            versions = dict(connection.execute(text(f"SELECT name, version FROM {TABLE_PREFIX}versions")).fetchall())
+        return f"{versions.get('_epoch', 0):x}-" + '.'.join(str(versions.get(name, 0)) for name in collections)
+
+    # Every write is already durable
+    def start_flusher(self, interval=1.0):
+        pass
+
+    def stop_flusher(self):
+        pass
+
+    def flush(self):
+        return 0
+
+    def save_to_file(self):
+        pass
+
+    def get_persistence_metrics(self):
+        """Get persistence metrics"""
+        metrics = super().get_persistence_metrics()
+        metrics['mode'] = 'sqlite'
+        return metrics
+
+    def load_from_file(self):
+        """Create the tables, switch to WAL mode and import file-based data once"""
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(text("PRAGMA journal_mode=WAL"))
+                for name in COLLECTIONS:
+                    self.__dict__[name].create(connection)
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {TABLE_PREFIX}activities ("
+                    "seq INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, data TEXT NOT NULL)"))
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{TABLE_PREFIX}activities_timestamp "
+                    f"ON {TABLE_PREFIX}activities (timestamp)"))
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {VITALS_TABLE} (patient_id TEXT NOT NULL, "
+                    "recorded_at INTEGER NOT NULL, " + ', '.join(f"{parameter} REAL" for parameter in VITAL_PARAMETERS)
+                    + ")"))
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{VITALS_TABLE}_patient_id "
+                    f"ON {VITALS_TABLE} (patient_id, recorded_at)"))
+                # Change counters shared by all workers; the epoch row tells
+                # this database apart from one recreated from scratch
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {TABLE_PREFIX}versions ("
+                    "name TEXT PRIMARY KEY, version INTEGER NOT NULL)"))
+                connection.execute(text(
+                    f"INSERT OR IGNORE INTO {TABLE_PREFIX}versions (name, version) "
+                    "VALUES ('_epoch', abs(random()) % 4294967296)"))
+
+            if len(self.users) == 0 and len(self.departments) == 0:
+                self._import_file_data()
+
+            if len(self.users) or len(self.departments):
+                self._initialized = True
+                logging.info("Data store backed by SQLite")
+            else:
+                self.initialize()
+        except Exception as e:
+            logging.error(f"Error loading data: {str(e)}")
+            raise
+
+    def _import_file_data(self):
+        """Import collections from the file-based data store, if any"""
+        file_store = DataStore(data_dir=self.storage.data_dir, data_file=self.data_file,
+                               codec=self.storage.codec, compression=self.storage.compression)
+        file_store.load_from_file()
+        if not file_store.is_initialized():
+            return
+        with self.engine.begin() as connection:
+            for name in COLLECTIONS:
+                self.__dict__[name].bulk_load(connection, getattr(file_store, name))
+            readings = [{**dict.fromkeys(VITAL_PARAMETERS), **values,
+                         'patient_id': _column_value(patient_id), 'recorded_at': int(recorded_at)}
+                        for patient_id, log in file_store.vitals.snapshot().items()
+                        for recorded_at, values in _vitals_rows(log)]
+            if readings:
+                connection.execute(text(
+                    f"INSERT INTO {VITALS_TABLE} (patient_id, recorded_at, {', '.join(VITAL_PARAMETERS)}) "
+                    f"VALUES (:patient_id, :recorded_at, {', '.join(':' + parameter for parameter in VITAL_PARAMETERS)})"),
+                    readings)
+        for activity in file_store.activities:
+            self.log_activity(activity)
+        logging.info(f"Imported file-based data from {self.storage.data_dir} into SQLite")
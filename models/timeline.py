@@ -0,0 +1,159 @@
+"""
+Per-patient event timelines for the DataStore
+"""
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+
+
+def _time(value):
+    """Sortable event time: an ISO date or timestamp cut to whole seconds"""
+    return str(value)[:19] if value else None
+
+
+def appointment_events(record):
+    """The appointment, at its scheduled time"""
+    return [(_time(record.get('appointment_date')), 0, 'appointment')]
+
+
+def medical_record_events(record):
+    """The visit itself plus each prescription and lab result written in it"""
+    visit_time = _time(record.get('visit_date'))
+    events = [(visit_time, 0, 'visit')]
+    for position, prescription in enumerate(record.get('prescriptions') or ()):
+        events.append((_time(prescription.get('prescribed_at')) or visit_time, position, 'prescription'))
+    for position, result in enumerate(record.get('lab_results') or ()):
+        events.append((_time(result.get('recorded_at')) or visit_time, position, 'lab_result'))
+    return events
+
+
+def billing_events(record):
+    """The bill, when it was issued"""
+    return [(_time(record.get('issued_date')), 0, 'bill')]
+
+
+def request_events(event_type):
+    """Events of a lab or radiology request"""
+    def events(record):
+        return [(_time(record.get('requested_at')), 0, event_type)]
+    return events
+
+
+def inpatient_events(record):
+    """Admission and (once discharged) discharge of a stay"""
+    return [(_time(record.get('admission_date')), 0, 'admission'),
+            (_time(record.get('discharge_date')), 0, 'discharge')]
+
+
+# Collections on a patient timeline and the events each record contributes,
+# as (time, position, event type); position tells nested items apart
+TIMELINE_SOURCES = {
+    'appointments': appointment_events,
+    'medical_records': medical_record_events,
+    'billing_records': billing_events,
+    'lab_requests': request_events('lab_request'),
+    'radiology_requests': request_events('radiology_request'),
+    'inpatients': inpatient_events
+}
+
+# Event types whose data is an item nested in the record, by record field
+NESTED_EVENTS = {'prescription': 'prescriptions', 'lab_result': 'lab_results'}
+
+EVENT_TYPES = ('appointment', 'visit', 'prescription', 'lab_result', 'bill', 'lab_request',
+               'radiology_request', 'admission', 'discharge')
+
+
+def timeline_entries(collection, record_id, record):
+    """Sorted (time, record id, position, event type) entries of a record; events without a time are left out"""
+    return sorted((time, record_id, position, event_type)
+                  for time, position, event_type in TIMELINE_SOURCES[collection](record) if time)
+
+
+def timeline_event(collection, entry, record):
+    """The API form of a timeline entry"""
+    time, record_id, position, event_type = entry
+    data = dict(record)
+    if event_type in NESTED_EVENTS:
+        data = dict(data[NESTED_EVENTS[event_type]][position], record_id=record_id,
+                    doctor_id=record.get('doctor_id'))
+    return {'time': time, 'type': event_type, 'collection': collection, 'id': record_id, 'data': data}
+
+
+def _newest_first(collection, entries, before):
+    """(key, entry) pairs of one collection, newest first, starting below the `before` key"""
+    hi = len(entries)
+    if before is not None:
+        time, before_collection = before[0], before[1]
+        if collection < before_collection:
+            hi = bisect_right(entries, time, key=lambda entry: entry[0])
+        elif collection > before_collection:
+            hi = bisect_left(entries, time, key=lambda entry: entry[0])
+        else:
+            hi = bisect_left(entries, (time,) + tuple(before[2:]))
+    for i in range(hi - 1, -1, -1):
+        entry = entries[i]
+        yield (entry[0], collection) + entry[1:], entry
+
+
+def merge_timelines(sources, before=None):
+    """
+    Merge the sorted entry lists of several collections ({collection:
+    entries}) into one stream of (key, entry), newest first, where the key's
+    second item is the collection.
+    Keys are (time, collection, record id, position, event type) and totally
+    ordered, so a page can continue below the last key of the previous one.
+    Only as many entries are visited as are consumed, plus one per list.
+    """
+    streams = [_newest_first(collection, entries, before) for collection, entries in sources.items()]
+    return merge(*streams, key=lambda item: item[0], reverse=True)
+
+
+class TimelineIndex:
+    """
+    Keeps the timeline entries of one collection in a sorted list per
+    patient, so a patient's timeline is a merge of a few presorted lists
+    instead of a scan and sort of every collection.
+    """
+    def __init__(self, collection, key_func):
+        self.collection = collection
+        self.key_func = key_func
+        self._timelines = {}
+
+    def add(self, record_id, record):
+        """Index the events of a record"""
+        patient_id = self.key_func(record_id, record)
+        if patient_id is None:
+            return
+        entries = self._timelines.setdefault(patient_id, [])
+        for entry in timeline_entries(self.collection, record_id, record):
+            if not entries or entries[-1] < entry:
+                entries.append(entry)
+            else:
+                insort(entries, entry)
+
+    def remove(self, record_id, record):
+        """Remove the events of a record from the index"""
+        patient_id = self.key_func(record_id, record)
+        entries = self._timelines.get(patient_id)
+        if entries is None:
+            return
+        for entry in timeline_entries(self.collection, record_id, record):
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        if not entries:
+            del self._timelines[patient_id]
+
+    def get(self, patient_id):
+        """Get the entries of a patient, oldest first (the list itself; do not modify)"""
+        return self._timelines.get(patient_id, [])
+
+    def rebuild(self, records):
+        """Rebuild the index from a collection dict"""
+        timelines = {}
+        for record_id, record in records.items():
+            patient_id = self.key_func(record_id, record)
+            if patient_id is not None:
+                timelines.setdefault(patient_id, []).extend(timeline_entries(self.collection, record_id, record))
+        for entries in timelines.values():
+            entries.sort()
+        self._timelines = timelines
@@ -0,0 +1,80 @@
+"""
+Read-only views over stored DataStore records
+"""
+import inspect
+
+
+class RecordView:
+    """
+    Read-only, attribute-style view of a stored record dict.
+    It deliberately is not a Mapping, so record fields such as a bill's
+    `items` are never shadowed by mapping methods.
+    Reads go straight to the stored dict instead of building a model object
+    (which would run the model's default logic for every row); call
+    to_model() when a mutable model instance is actually needed.
+    """
+    __slots__ = ('_data',)
+    _model = None
+    _fields = frozenset()
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', data)
+
+    def __getattr__(self, name):
+        try:
+            return self._data[name]
+        except KeyError:
+            # Model fields missing from older records read as None, as the model would set them
+            if name in self._fields:
+                return None
+            raise AttributeError(f"{type(self).__name__} has no attribute {name!r}") from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only; use to_model() to modify it")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only; use to_model() to modify it")
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._data!r})"
+
+    def to_dict(self):
+        """Convert the view to a plain dictionary"""
+        return dict(self._data)
+
+    def to_model(self):
+        """Build a mutable model instance from the record"""
+        return self._model(**self._data)
+
+
+_view_classes = {}
+
+
+def view_class(model):
+    """
+    Get the read-only view class for a model.
+    The view borrows the model's non-mutating helper methods (e.g.
+    Patient.calculate_age); methods that assign attributes raise on a view.
+    """
+    cls = _view_classes.get(model)
+    if cls is None:
+        namespace = {name: member for name, member in vars(model).items()
+                     if inspect.isfunction(member) and not name.startswith('__') and name != 'to_dict'}
+        namespace['__slots__'] = ()
+        namespace['_model'] = model
+        namespace['_fields'] = frozenset(name for name in inspect.signature(model.__init__).parameters
+                                        if name not in ('self', 'kwargs'))
+        cls = _view_classes[model] = type(f"{model.__name__}View", (RecordView,), namespace)
+    return cls
+
+
+def views(model, records):
+    """Wrap an iterable of stored record dicts in read-only views of a model"""
+    cls = view_class(model)
+    return [cls(record) for record in records]
@@ -0,0 +1,256 @@
+"""
+Per-patient vital sign time series in compact typed arrays
+"""
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from models.lab_results import parse_result
+
+# Charted parameters and their units. Blood pressure is entered as one
+# "120/80" field and kept as two series.
+VITAL_PARAMETERS = {
+    'systolic': 'mmHg',
+    'diastolic': 'mmHg',
+    'heart_rate': 'bpm',
+    'temperature': '°C',
+    'respiratory_rate': 'x/min',
+    'oxygen_saturation': '%',
+    'weight': 'kg'
+}
+
+# Collections whose records hold vitals: one reading in a medical record's
+# `vitals`. Readings taken during inpatient stays are kept in a VitalsLog.
+VITALS_SOURCES = ('medical_records',)
+
+# Points per series returned for charts unless asked otherwise
+DEFAULT_CHART_POINTS = 200
+
+# Reading times are whole seconds since 1970-01-01 in local (naive) time,
+# stored as unsigned 32-bit integers (good until 2106); values as 32-bit floats
+_EPOCH = datetime(1970, 1, 1)
+_BLOOD_PRESSURE = re.compile(r'(\d+(?:[.,]\d+)?)\s*/\s*(\d+(?:[.,]\d+)?)')
+
+
+def to_timestamp(value, end=False):
+    """Seconds since the epoch of an ISO date or timestamp, or None; with `end` a date means its last second"""
+    try:
+        moment = datetime.fromisoformat(str(value)).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+    seconds = int((moment - _EPOCH).total_seconds())
+    if end and len(str(value)) <= 10:
+        seconds += 86399
+    return seconds if 0 <= seconds < 2 ** 32 else None
+
+
+def from_timestamp(seconds):
+    """ISO timestamp of seconds since the epoch"""
+    return (_EPOCH + timedelta(seconds=int(seconds))).isoformat()
+
+
+def parse_vitals(vitals):
+    """Numeric values of a vitals dict by parameter; blood pressure splits into systolic and diastolic"""
+    values = {}
+    match = _BLOOD_PRESSURE.search(str(vitals.get('blood_pressure') or ''))
+    if match is not None:
+        values['systolic'] = float(match.group(1).replace(',', '.'))
+        values['diastolic'] = float(match.group(2).replace(',', '.'))
+    for parameter in VITAL_PARAMETERS:
+        if parameter not in values and vitals.get(parameter) not in (None, ''):
+            value, _ = parse_result(vitals[parameter])
+            if value is not None:
+                values[parameter] = value
+    return values
+
+
+def vitals_readings(collection, record):
+    """(timestamp, values by parameter) of the vitals readings held by a record"""
+    if collection == 'medical_records':
+        vitals = record.get('vitals')
+        readings = [(vitals, vitals.get('recorded_at') or record.get('visit_date'))] if vitals else []
+    else:
+        readings = [(vitals, vitals.get('recorded_at')) for vitals in record.get('vitals') or ()]
+    result = []
+    for vitals, recorded_at in readings:
+        timestamp = to_timestamp(recorded_at)
+        values = parse_vitals(vitals) if timestamp is not None else None
+        if values:
+            result.append((timestamp, values))
+    return result
+
+
+class VitalSeries:
+    """
+    Readings of one vital sign of one patient as two parallel typed arrays,
+    timestamps (4 bytes) and values (4 bytes), kept in time order. Readings
+    normally arrive in order and are appended.
+    """
+    __slots__ = ('times', 'values')
+
+    def __init__(self):
+        self.times = array('I')
+        self.values = array('f')
+
+    def add(self, timestamp, value):
+        """Add a reading"""
+        if not self.times or self.times[-1] <= timestamp:
+            self.times.append(timestamp)
+            self.values.append(value)
+        else:
+            i = bisect_right(self.times, timestamp)
+            self.times.insert(i, timestamp)
+            self.values.insert(i, value)
+
+    def remove(self, timestamp, value):
+        """Remove a reading, if present"""
+        value = array('f', (value,))[0]
+        for i in range(bisect_left(self.times, timestamp), bisect_right(self.times, timestamp)):
+            if self.values[i] == value:
+                del self.times[i]
+                del self.values[i]
+                return
+
+    def between(self, start=None, end=None):
+        """(timestamps, values) NumPy arrays of the readings within [start, end] (copies)"""
+        lo = bisect_left(self.times, start) if start is not None else 0
+        hi = bisect_right(self.times, end) if end is not None else len(self.times)
+        return (np.frombuffer(self.times[lo:hi], dtype=np.uint32),
+                np.frombuffer(self.values[lo:hi], dtype=np.float32))
+
+    def __len__(self):
+        return len(self.times)
+
+
+class VitalsIndex:
+    """
+    Vitals readings held by one collection's records, by patient and
+    parameter, so a patient's chart reads a few typed arrays instead of
+    every record. A reading costs 8 bytes per parameter.
+    """
+    def __init__(self, collection, key_func):
+        self.collection = collection
+        self.key_func = key_func
+        self._series = {}
+
+    def add(self, record_id, record):
+        """Index the vitals readings of a record"""
+        readings = vitals_readings(self.collection, record)
+        if not readings:
+            return
+        series = self._series.setdefault(self.key_func(record_id, record), {})
+        for timestamp, values in readings:
+            for parameter, value in values.items():
+                series.setdefault(parameter, VitalSeries()).add(timestamp, value)
+
+    def remove(self, record_id, record):
+        """Remove the vitals readings of a record from the index"""
+        readings = vitals_readings(self.collection, record)
+        patient_id = self.key_func(record_id, record)
+        series = self._series.get(patient_id)
+        if not readings or series is None:
+            return
+        for timestamp, values in readings:
+            for parameter, value in values.items():
+                if parameter in series:
+                    series[parameter].remove(timestamp, value)
+                    if not series[parameter]:
+                        del series[parameter]
+        if not series:
+            del self._series[patient_id]
+
+    def get(self, patient_id, parameter):
+        """A patient's series of one parameter, or None (do not modify)"""
+        return self._series.get(patient_id, {}).get(parameter)
+
+    def rebuild(self, records):
+        """Rebuild the index from a collection dict"""
+        self._series = {}
+        for record_id, record in records.items():
+            self.add(record_id, record)
+
+
+class VitalsLog(VitalsIndex):
+    """
+    Vitals readings taken during inpatient stays, by patient and parameter.
+    Unlike VitalsIndex, the typed arrays are the stored data: readings are
+    appended one at a time and never kept as dicts. snapshot() gives the
+    columns to persist and VitalsLog(columns) reads them back.
+    """
+    def __init__(self, columns=None):
+        super().__init__('vitals', None)
+        for patient_id, series in (columns or {}).items():
+            for parameter, (times, values) in series.items():
+                vital = self._series.setdefault(patient_id, {}).setdefault(parameter, VitalSeries())
+                # Written in time order
+                vital.times.extend(times)
+                vital.values.extend(values)
+
+    def append(self, patient_id, timestamp, values):
+        """Add one reading of a patient (values by parameter)"""
+        series = self._series.setdefault(patient_id, {})
+        for parameter, value in values.items():
+            series.setdefault(parameter, VitalSeries()).add(timestamp, value)
+
+    def snapshot(self):
+        """Copy the series as {patient id: {parameter: [timestamps, values]}} of plain lists"""
+        return {patient_id: {parameter: [vital.times.tolist(), vital.values.tolist()]
+                             for parameter, vital in series.items()}
+                for patient_id, series in self._series.items()}
+
+    def __len__(self):
+        return len(self._series)
+
+
+def merge_series(parts):
+    """One time-ordered (timestamps, values) pair from several"""
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float32)
+    if len(parts) == 1:
+        return parts[0]
+    times = np.concatenate([times for times, _ in parts])
+    order = np.argsort(times, kind='stable')
+    return times[order], np.concatenate([values for _, values in parts])[order]
+
+
+def downsample(times, values, points):
+    """
+    At most `points` (time, mean, min, max) buckets of equal time width,
+    as NumPy arrays, skipping empty buckets; short series are returned as
+    they are (mean, min and max all the value).
+    """
+    if len(times) <= points:
+        return times, values, values, values
+    first = int(times[0])
+    span = int(times[-1]) - first + 1
+    buckets = (times.astype(np.int64) - first) * points // span
+    # Times are sorted, so each bucket is a contiguous run
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(times)])
+    mean_times = np.add.reduceat(times.astype(np.float64), starts) / counts
+    means = np.add.reduceat(values.astype(np.float64), starts) / counts
+    return (mean_times.round().astype(np.uint32), means, np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts))
+
+
+def chart_series(series, points=DEFAULT_CHART_POINTS):
+    """
+    Chart-ready columns of each parameter's (timestamps, values): unit,
+    count of readings and per point the time, value (bucket mean), min and max.
+    """
+    charts = {}
+    for parameter, (times, values) in series.items():
+        bucket_times, means, lows, highs = downsample(times, values, points)
+        charts[parameter] = {
+            'unit': VITAL_PARAMETERS[parameter],
+            'count': len(times),
+            'time': [from_timestamp(seconds) for seconds in bucket_times.tolist()],
+            'value': [round(value, 2) for value in np.asarray(means, dtype=np.float64).tolist()],
+            'min': [round(value, 2) for value in np.asarray(lows, dtype=np.float64).tolist()],
+            'max': [round(value, 2) for value in np.asarray(highs, dtype=np.float64).tolist()]
+        }
+    return charts
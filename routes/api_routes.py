@@ -1,5 +1,8 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, Response, request, jsonify, g, url_for, make_response
 from datetime import datetime
+from functools import wraps
+import base64
+import binascii
 import uuid
 import json
 
@@ -7,16 +10,302 @@ from models.patient import Patient
 from models.appointment import Appointment
 from models.medical_record import MedicalRecord
 from models.billing import BillingRecord
+from models.data_store import PAGE_FILTERS
+from models.duplicates import DUPLICATE_THRESHOLD
+from models.timeline import EVENT_TYPES, TIMELINE_SOURCES
+from models.lab_results import flag_results, normalised
+from models.vitals import DEFAULT_CHART_POINTS, VITAL_PARAMETERS, chart_series, to_timestamp
+from models.persistence import encode_default
 
 api_bp = Blueprint('api_bp', __name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Rows read from the data store per chunk of a streamed export
+STREAM_CHUNK_SIZE = 1000
+DEFAULT_TIMELINE_SIZE = 50
+DEFAULT_SEARCH_RESULTS = 10
+MAX_SEARCH_RESULTS = 100
+# Lab results flagged per request by /api/lab/results/flags
+MAX_FLAG_BATCH = 10000
+# Points per vitals series served by /api/patients/<id>/vitals
+MAX_CHART_POINTS = 5000
+# Longest window served by /api/statistics/visits (the visit matrices cover about two years)
+MAX_VISIT_DAYS = 366
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+def _encode_cursor(entry):
+    """Encode a (sort key, id) pagination position as an opaque cursor"""
+    raw = json.dumps(list(entry), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor, size=2):
+    """Decode a cursor back to its (sort key, id) position, or another position of `size` items"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    entry = json.loads(raw)
+    if not isinstance(entry, list) or len(entry) != size:
+        raise ValueError('Invalid cursor')
+    return tuple(entry)
+
+def _stream_format():
+    """Streaming format requested by the client: 'ndjson', 'json' or None"""
+    if (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson'):
+        return 'ndjson'
+    if request.args.get('stream') == '1':
+        return 'json'
+    return None
+
+# Shared encoder; json.dumps() with arguments builds a new encoder on every call
+_row_encoder = json.JSONEncoder(default=encode_default, separators=(',', ':'))
+
+def _encoded_chunks(records, separator):
+    """Encode records to JSON, joined into one chunk per STREAM_CHUNK_SIZE rows"""
+    encode = _row_encoder.encode
+    rows = []
+    for record in records:
+        rows.append(encode(record))
+        if len(rows) == STREAM_CHUNK_SIZE:
+            yield separator.join(rows)
+            rows = []
+    if rows:
+        yield separator.join(rows)
+
+def _stream_ndjson(records):
+    """Encode records as newline-delimited JSON, one row per line"""
+    for chunk in _encoded_chunks(records, '\n'):
+        yield chunk + '\n'
+
+def _stream_json(records):
+    """Encode records as a JSON array without building it in memory"""
+    yield '['
+    separator = ''
+    for chunk in _encoded_chunks(records, ','):
+        yield separator + chunk
+        separator = ','
+    yield ']\n'
+
+def conditional(*collections, daily=False):
+    """
+    Answer If-None-Match with 304 Not Modified while none of `collections`
+    has changed, without running the view. The ETag is derived from the
+    collections' version counters (plus today's date for views that depend
+    on it, and the streaming format for list endpoints).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = g.data_store.etag(*collections)
+            if daily:
+                etag += '-' + datetime.now().strftime('%Y%m%d')
+            stream_format = _stream_format()
+            if stream_format:
+                etag += '-' + stream_format
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
+
+def _paginated(collection, start=None, end=None):
+    """
+    Serve one page of a collection. Query parameters: limit, after (cursor
+    from the previous page), sort, order (asc/desc), from/to (inclusive
+    bounds on the sort key) and the collection's filter fields. The body
+    stays a JSON list; the next page's cursor is sent in the X-Next-Cursor
+    and Link headers.
+    With ?stream=1 (JSON array) or Accept: application/x-ndjson / ?format=ndjson
+    every matching row is streamed instead, ignoring limit.
+    """
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        after = request.args.get('after')
+        after = _decode_cursor(after) if after else None
+    except (ValueError, TypeError, binascii.Error):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    # Positions are (sort key, id) strings; anything else cannot be compared with the index
+    if limit < 1 or (after is not None and not all(isinstance(item, str) for item in after)):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    filters = {field: request.args.get(field) for field in PAGE_FILTERS[collection]}
+    page_args = dict(sort=request.args.get('sort'),
+                     start=request.args.get('from', start),
+                     end=request.args.get('to', end),
+                     descending=request.args.get('order') == 'desc',
+                     **filters)
+
+    stream_format = _stream_format()
+    if stream_format:
+        data_store = g.data_store
+        try:
+            # Validate the arguments before the response starts
+            data_store.page(collection, limit=1, **page_args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        records = data_store.iter_records(collection, STREAM_CHUNK_SIZE, after=after, **page_args)
+        if stream_format == 'ndjson':
+            return Response(_stream_ndjson(records), mimetype='application/x-ndjson')
+        return Response(_stream_json(records), mimetype='application/json')
+
+    try:
+        records, next_after = g.data_store.page(collection, after=after, limit=limit, **page_args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify(records)
+    if next_after is not None:
+        cursor = _encode_cursor(next_after)
+        args = request.args.to_dict()
+        args['after'] = cursor
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response
+
 @api_bp.route('/patients', methods=['GET'])
+@conditional('patients')
 def get_patients():
-    """API endpoint to get all patients"""
-    patients = g.data_store.get_all_patients()
-    return jsonify([p.__dict__ for p in patients])
+    """API endpoint to get patients, one page at a time"""
+    return _paginated('patients')
+
+@api_bp.route('/patients/search', methods=['GET'])
+@conditional('patients')
+def search_patients():
+    """API endpoint to search patients by identifier or name"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query'}), 400
+    limit = request.args.get('limit', DEFAULT_SEARCH_RESULTS, type=int)
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        return jsonify({'error': f'limit must be between 1 and {MAX_SEARCH_RESULTS}'}), 400
+    results = g.data_store.search_patients(query, limit)
+    return jsonify([{**dict(patient), 'match': field, 'score': round(score, 3)}
+                    for patient, score, field in results])
+
+@api_bp.route('/patients/duplicates', methods=['GET'])
+@conditional('patients')
+def get_duplicate_patients():
+    """API endpoint to list likely duplicate patient pairs across the registry"""
+    threshold = request.args.get('threshold', DUPLICATE_THRESHOLD, type=float)
+    if not 0 < threshold <= 1:
+        return jsonify({'error': 'threshold must be between 0 and 1'}), 400
+    pairs = g.data_store.find_duplicate_patients(threshold)
+    return jsonify([{'patient_ids': [patient_id, other_id], 'score': round(score, 3)}
+                    for patient_id, other_id, score in pairs])
+
+@api_bp.route('/patients/<patient_id>/duplicates', methods=['GET'])
+@conditional('patients')
+def get_patient_duplicates(patient_id):
+    """API endpoint to get the likely duplicates of a patient"""
+    patient = g.data_store.get_patient(patient_id)
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    duplicates = g.data_store.find_patient_duplicates(patient.__dict__)
+    return jsonify([{**dict(record), 'score': round(score, 3)} for record, score in duplicates])
+
+@api_bp.route('/patients/<patient_id>/timeline', methods=['GET'])
+@conditional('patients', *TIMELINE_SOURCES)
+def get_patient_timeline(patient_id):
+    """
+    API endpoint to get a patient's events from every module, newest first.
+    Query parameters: limit, before (cursor from the previous page) and
+    types (comma-separated event types). The next page's cursor is sent in
+    the X-Next-Cursor and Link headers, as for the list endpoints.
+    """
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_TIMELINE_SIZE)), MAX_PAGE_SIZE)
+        before = request.args.get('before')
+        before = _decode_cursor(before, size=5) if before else None
+    except (ValueError, TypeError, binascii.Error):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    if limit < 1 or (before is not None and not (
+            isinstance(before[0], str) and before[1] in TIMELINE_SOURCES and isinstance(before[3], int))):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    types = request.args.get('types')
+    types = set(types.split(',')) if types else None
+    if types and not types <= set(EVENT_TYPES):
+        return jsonify({'error': f"types must be among {', '.join(EVENT_TYPES)}"}), 400
+    if not g.data_store.get_patient(patient_id):
+        return jsonify({'error': 'Patient not found'}), 404
+
+    events, next_before = g.data_store.get_patient_timeline(patient_id, limit, before, types)
+    response = jsonify(events)
+    if next_before is not None:
+        cursor = _encode_cursor(next_before)
+        args = request.args.to_dict()
+        args['before'] = cursor
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, patient_id=patient_id, **args)}>; rel="next"'
+    return response
+
+@api_bp.route('/patients/<patient_id>/lab-results', methods=['GET'])
+@conditional('medical_records')
+def get_patient_lab_results(patient_id):
+    """API endpoint to get a patient's results of one test (?test=), oldest first, for trending"""
+    test_name = request.args.get('test', '').strip()
+    if not test_name:
+        return jsonify({'error': 'Missing test name'}), 400
+    if not g.data_store.get_patient(patient_id):
+        return jsonify({'error': 'Patient not found'}), 404
+    results = g.data_store.get_lab_results(patient_id, test_name)
+    flags = flag_results(results, [None] + results[:-1])
+    return jsonify([{**result, **normalised(result), **result_flags} for result, result_flags in zip(results, flags)])
+
+@api_bp.route('/patients/<patient_id>/vitals', methods=['GET'])
+@conditional('medical_records', 'vitals')
+def get_patient_vitals(patient_id):
+    """
+    API endpoint to get a patient's vital signs as chart-ready series.
+    Query parameters: parameters (comma-separated, default all), start and
+    end (ISO dates or timestamps, inclusive) and points (per series,
+    default 200). Longer series are averaged into equal time buckets,
+    each with the min and max of its readings.
+    """
+    try:
+        points = int(request.args.get('points', DEFAULT_CHART_POINTS))
+    except ValueError:
+        return jsonify({'error': 'Invalid points'}), 400
+    if not 1 <= points <= MAX_CHART_POINTS:
+        return jsonify({'error': f'points must be between 1 and {MAX_CHART_POINTS}'}), 400
+    parameters = request.args.get('parameters')
+    parameters = parameters.split(',') if parameters else None
+    if parameters and not set(parameters) <= set(VITAL_PARAMETERS):
+        return jsonify({'error': f"parameters must be among {', '.join(VITAL_PARAMETERS)}"}), 400
+    start, end = request.args.get('start'), request.args.get('end')
+    start_time = to_timestamp(start) if start else None
+    end_time = to_timestamp(end, end=True) if end else None
+    if (start and start_time is None) or (end and end_time is None):
+        return jsonify({'error': 'Invalid start or end'}), 400
+    if not g.data_store.get_patient(patient_id):
+        return jsonify({'error': 'Patient not found'}), 404
+
+    series = g.data_store.get_vitals(patient_id, parameters, start_time, end_time)
+    return jsonify({'patient_id': patient_id, 'points': points, 'series': chart_series(series, points)})
+
+@api_bp.route('/lab/results/flags', methods=['POST'])
+def flag_lab_results():
+    """
+    API endpoint to flag a batch of lab results (e.g. from an analyser): a
+    JSON list of objects with patient_id, test_name, result and
+    reference_range. Returns, in the same order, the parsed value and
+    unit, the H/L/LL/HH flag and the delta check against the patient's
+    previous result of the test.
+    """
+    results = request.get_json(silent=True)
+    if not isinstance(results, list) or not all(isinstance(result, dict) for result in results):
+        return jsonify({'error': 'Expected a JSON list of lab results'}), 400
+    if len(results) > MAX_FLAG_BATCH:
+        return jsonify({'error': f'At most {MAX_FLAG_BATCH} results per request'}), 400
+    flags = g.data_store.flag_lab_results([(result.get('patient_id'), result) for result in results])
+    return jsonify([{**normalised(result), **result_flags} for result, result_flags in zip(results, flags)])
 
 @api_bp.route('/patients/<patient_id>', methods=['GET'])
+@conditional('patients')
 def get_patient(patient_id):
     """API endpoint to get a specific patient"""
     patient = g.data_store.get_patient(patient_id)
@@ -25,16 +314,14 @@ def get_patient(patient_id):
     return jsonify(patient.__dict__)
 
 @api_bp.route('/appointments', methods=['GET'])
+@conditional('appointments')
 def get_appointments():
-    """API endpoint to get appointments"""
+    """API endpoint to get appointments, one page at a time"""
     date = request.args.get('date')
-    if date:
-        appointments = g.data_store.get_appointments_by_date(date)
-    else:
-        appointments = [Appointment(**a) for a in g.data_store.appointments.values()]
-    return jsonify([a.__dict__ for a in appointments])
+    return _paginated('appointments', start=date, end=date)
 
 @api_bp.route('/appointments/<appointment_id>', methods=['GET'])
+@conditional('appointments')
 def get_appointment(appointment_id):
     """API endpoint to get a specific appointment"""
     appointment = g.data_store.get_appointment(appointment_id)
@@ -43,16 +330,13 @@ def get_appointment(appointment_id):
     return jsonify(appointment.__dict__)
 
 @api_bp.route('/medical-records', methods=['GET'])
+@conditional('medical_records')
 def get_medical_records():
-    """API endpoint to get medical records"""
-    patient_id = request.args.get('patient_id')
-    if patient_id:
-        records = g.data_store.get_medical_records_by_patient(patient_id)
-    else:
-        records = [MedicalRecord(**r) for r in g.data_store.medical_records.values()]
-    return jsonify([r.__dict__ for r in records])
+    """API endpoint to get medical records, one page at a time"""
+    return _paginated('medical_records')
 
 @api_bp.route('/medical-records/<record_id>', methods=['GET'])
+@conditional('medical_records')
 def get_medical_record(record_id):
     """API endpoint to get a specific medical record"""
     record = g.data_store.get_medical_record(record_id)
@@ -60,20 +344,31 @@ def get_medical_record(record_id):
         return jsonify({'error': 'Medical record not found'}), 404
     return jsonify(record.__dict__)
 
+@api_bp.route('/lab/worklist', methods=['GET'])
+@conditional('lab_requests', 'patients', 'users')
+def get_lab_worklist():
+    """API endpoint to get the active lab requests, most urgent and then oldest first"""
+    return jsonify(g.data_store.get_lab_worklist())
+
+@api_bp.route('/lab/completed', methods=['GET'])
+@conditional('lab_requests')
+def get_completed_lab_requests():
+    """API endpoint to get the lab requests completed between start and end (YYYY-MM-DD, inclusive)"""
+    start, end = request.args.get('start'), request.args.get('end')
+    return jsonify(g.data_store.get_completed_lab_requests(start, end))
+
 @api_bp.route('/dashboard/statistics', methods=['GET'])
+@conditional('patients', 'appointments', 'inpatients', 'users', 'departments', daily=True)
 def get_dashboard_statistics():
     """API endpoint to get dashboard statistics"""
     data_store = g.data_store
     
     # Get statistics for dashboard
-    total_patients = len(data_store.patients)
-    appointments_today = len(data_store.get_today_appointments())
-    inpatient_count = data_store.get_inpatient_count()
-    doctors_on_duty = len([u for u in data_store.users.values() if u.get('role') == 'doctor'])
+    counts = data_store.get_dashboard_counts()
     
     # Get department visit statistics
     department_visits = data_store.get_department_visits(30)
-    departments = {d_id: d.get('name') for d_id, d in data_store.departments.items()}
+    departments = {d_id: d.get('name') for d_id, d in data_store.items('departments')}
     
     # Format department statistics for chart
     department_stats = []
@@ -85,13 +380,34 @@ def get_dashboard_statistics():
             })
     
     return jsonify({
-        'total_patients': total_patients,
-        'appointments_today': appointments_today,
-        'inpatient_count': inpatient_count,
-        'doctors_on_duty': doctors_on_duty,
+        **counts,
         'department_visits': department_stats
     })
 
+@api_bp.route('/statistics/visits', methods=['GET'])
+@conditional('appointments', 'departments', 'users', daily=True)
+def get_visit_statistics():
+    """API endpoint to get visit counts by department, doctor and day of the week"""
+    data_store = g.data_store
+    days = request.args.get('days', 30, type=int)
+    if not 1 <= days <= MAX_VISIT_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_VISIT_DAYS}'}), 400
+    department_id = request.args.get('department_id')
+    
+    departments = {d_id: d.get('name') for d_id, d in data_store.items('departments')}
+    doctors = {str(u_id): u.get('name') for u_id, u in data_store.items('users')}
+    
+    return jsonify({
+        'days': days,
+        'departments': [{'department_id': dept_id, 'department': departments[dept_id], 'visits': visits}
+                        for dept_id, visits in data_store.get_department_visits(days).items()
+                        if dept_id in departments],
+        'doctors': [{'doctor_id': doctor_id, 'doctor': doctors.get(str(doctor_id)), 'visits': visits}
+                    for doctor_id, visits in data_store.get_doctor_visits(days).items()],
+        'weekdays': [{'day': day, 'visits': visits}
+                     for day, visits in zip(WEEKDAYS, data_store.get_weekday_visits(days, department_id))]
+    })
+
 @api_bp.route('/bpjs/verify', methods=['GET'])
 def verify_bpjs():
     """Mock BPJS verification endpoint"""
@@ -111,6 +427,11 @@ def verify_bpjs():
             'error': 'Invalid insurance number'
         }), 400
 
+@api_bp.route('/system/persistence', methods=['GET'])
+def get_persistence_metrics():
+    """API endpoint to get write-behind persistence metrics"""
+    return jsonify(g.data_store.get_persistence_metrics())
+
 @api_bp.route('/activities', methods=['GET'])
 def get_activities():
     """API endpoint to get recent activities"""
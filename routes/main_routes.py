@@ -7,9 +7,29 @@ from models.patient import Patient
 from models.appointment import Appointment
 from models.medical_record import MedicalRecord
 from models.billing import BillingRecord
+from models.prescription_queue import URGENCIES, DISPENSED, CANCELLED
+from models.lab_index import PROCESSING, COMPLETED, CANCELLED as LAB_CANCELLED
+from models.vitals import parse_vitals
 
 main_bp = Blueprint('main_bp', __name__)
 
+# Rows per page of the list pages
+LIST_PAGE_SIZE = 50
+
+def _requested_page():
+    """The page number asked for with ?page="""
+    return max(request.args.get('page', 1, type=int), 1)
+
+def _pagination(page, total):
+    """Pagination info for the template"""
+    return {'page': page, 'pages': max(-(-total // LIST_PAGE_SIZE), 1), 'total': total}
+
+def _list_page(name, **kwargs):
+    """Get the requested page of a list view as (rows, pagination info for the template)"""
+    page = _requested_page()
+    rows, total = g.data_store.list_page(name, page, LIST_PAGE_SIZE, **kwargs)
+    return rows, _pagination(page, total)
+
 @main_bp.route('/')
 def index():
     """Main entry point, redirects to dashboard"""
@@ -21,23 +41,17 @@ def dashboard():
     data_store = g.data_store
     
     # Get statistics for dashboard
-    total_patients = len(data_store.patients)
-    appointments_today = len(data_store.get_today_appointments())
-    inpatient_count = data_store.get_inpatient_count()
-    doctors_on_duty = len([u for u in data_store.users.values() if u.get('role') == 'doctor'])
+    counts = data_store.get_dashboard_counts()
     
     # Get department visit statistics
     department_visits = data_store.get_department_visits(30)
-    departments = {d_id: d.get('name') for d_id, d in data_store.departments.items()}
+    departments = {d_id: d.get('name') for d_id, d in data_store.items('departments')}
     
     # Get recent activities
     activities = data_store.get_recent_activities(5)
     
     return render_template('dashboard.html', 
-                           total_patients=total_patients,
-                           appointments_today=appointments_today,
-                           inpatient_count=inpatient_count,
-                           doctors_on_duty=doctors_on_duty,
+                           **counts,
                            department_visits=department_visits,
                            departments=departments,
                            activities=activities)
@@ -83,6 +97,11 @@ def add_patient():
         })
         
         flash('Patient added successfully', 'success')
+        duplicates = getattr(new_patient, 'possible_duplicates', None)
+        if duplicates:
+            patients = [g.data_store.get_patient(patient_id) for patient_id in duplicates]
+            names = ', '.join(f"{patient.name} ({patient.medical_record_number})" for patient in patients if patient)
+            flash(f'Possible duplicate of existing patient(s): {names}', 'warning')
         return redirect(url_for('main_bp.patient_list'))
     
     return render_template('patient.html', action="add")
@@ -117,36 +136,22 @@ def appointment_list():
     elif date_filter == 'tomorrow':
         tomorrow = datetime.now() + timedelta(days=1)
         date_filter = tomorrow.strftime('%Y-%m-%d')
-    elif date_filter == 'week':
+    
+    if date_filter == 'week':
         # Show appointments for the next 7 days
         start_date = datetime.now()
         end_date = start_date + timedelta(days=7)
-        appointments = []
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            daily_appointments = g.data_store.get_appointments_by_date(date_str)
-            appointments.extend(daily_appointments)
-            current_date += timedelta(days=1)
+        start, end = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
     else:
         # Show appointments for specific date
-        appointments = g.data_store.get_appointments_by_date(date_filter)
-    
-    # If not showing for a week, get appointments for the specific date
-    if date_filter != 'week':
-        appointments = g.data_store.get_appointments_by_date(date_filter)
+        start = end = date_filter
     
-    # Get patient and doctor information for displaying in the list
-    patients = {p_id: p.get('name') for p_id, p in g.data_store.patients.items()}
-    doctors = {d_id: d.get('name') for d_id, d in g.data_store.users.items() 
-               if d.get('role') == 'doctor'}
-    departments = {d_id: d.get('name') for d_id, d in g.data_store.departments.items()}
+    # Rows come with patient, doctor and department names already joined
+    appointments, pagination = _list_page('appointments', start=start, end=end, descending=False)
     
     return render_template('appointment.html', 
                            appointments=appointments,
-                           patients=patients,
-                           doctors=doctors,
-                           departments=departments,
+                           pagination=pagination,
                            date_filter=date_filter)
 
 @main_bp.route('/appointment/add', methods=['GET', 'POST'])
@@ -193,23 +198,8 @@ def add_appointment():
 @main_bp.route('/medical-record')
 def medical_record_list():
     """Display the medical records list page"""
-    records = []
-    for record_id, record in g.data_store.medical_records.items():
-        patient_id = record.get('patient_id')
-        patient_name = g.data_store.patients.get(patient_id, {}).get('name', 'Unknown')
-        doctor_id = record.get('doctor_id')
-        doctor_name = g.data_store.users.get(doctor_id, {}).get('name', 'Unknown')
-        
-        records.append({
-            'id': record_id,
-            'patient_name': patient_name,
-            'doctor_name': doctor_name,
-            'visit_date': record.get('visit_date'),
-            'diagnosis': record.get('diagnosis'),
-            'record_type': record.get('record_type')
-        })
-    
-    return render_template('medical_record.html', records=records)
+    records, pagination = _list_page('medical_records')
+    return render_template('medical_record.html', records=records, pagination=pagination)
 
 @main_bp.route('/medical-record/add', methods=['GET', 'POST'])
 def add_medical_record():
@@ -248,6 +238,7 @@ def add_medical_record():
             frequencies = request.form.getlist('frequency')
             durations = request.form.getlist('duration')
             instructions = request.form.getlist('instructions')
+            urgencies = request.form.getlist('urgency')
             
             for i in range(len(medications)):
                 if medications[i]:
@@ -256,7 +247,8 @@ def add_medical_record():
                         dosage=dosages[i] if i < len(dosages) else "",
                         frequency=frequencies[i] if i < len(frequencies) else "",
                         duration=durations[i] if i < len(durations) else "",
-                        instructions=instructions[i] if i < len(instructions) else ""
+                        instructions=instructions[i] if i < len(instructions) else "",
+                        urgency=urgencies[i] if i < len(urgencies) and urgencies[i] in URGENCIES else None
                     )
         
         # Save medical record to data store
@@ -304,13 +296,19 @@ def view_medical_record(record_id):
 def inpatient_list():
     """Display the inpatient list page"""
     inpatients = []
-    for patient_id, inpatient in g.data_store.inpatients.items():
+    today = datetime.now().date()
+    for patient_id, inpatient in g.data_store.items('inpatients'):
         if not inpatient.get('discharge_date'):  # Only show active inpatients
             patient = g.data_store.patients.get(patient_id, {})
+            try:
+                days = (today - datetime.fromisoformat(inpatient.get('admission_date')[:10]).date()).days
+            except (TypeError, ValueError):
+                days = None
             inpatients.append({
                 'id': patient_id,
                 'name': patient.get('name', 'Unknown'),
                 'admission_date': inpatient.get('admission_date'),
+                'days': days,
                 'diagnosis': inpatient.get('primary_diagnosis'),
                 'room': inpatient.get('room'),
                 'doctor': g.data_store.users.get(inpatient.get('attending_doctor_id'), {}).get('name', 'Unknown')
@@ -318,68 +316,100 @@ def inpatient_list():
     
     return render_template('inpatient.html', inpatients=inpatients)
 
+@main_bp.route('/inpatient/vitals', methods=['POST'])
+def add_inpatient_vitals():
+    """Record a vitals reading of an admitted patient"""
+    patient_id = request.form.get('patient_id')
+    vitals = {field: request.form.get(field) for field in (
+        'blood_pressure', 'heart_rate', 'temperature', 'respiratory_rate', 'oxygen_saturation', 'weight')
+        if request.form.get(field)}
+    # Only the charted numbers are stored with the reading
+    if not parse_vitals(vitals):
+        flash('Enter at least one vital sign', 'error')
+        return redirect(url_for('main_bp.inpatient_list'))
+    taken_by = request.form.get('taken_by')
+    if request.form.get('vitals_date'):
+        vitals['recorded_at'] = f"{request.form['vitals_date']}T{request.form.get('vitals_time') or '00:00'}"
+    if not g.data_store.add_vitals(patient_id, vitals):
+        flash('Patient is not admitted', 'error')
+        return redirect(url_for('main_bp.inpatient_list'))
+    
+    # Log activity
+    patient_name = g.data_store.patients.get(patient_id, {}).get('name', 'Unknown')
+    details = f"Vital signs recorded for {patient_name}"
+    if request.form.get('pain_scale'):
+        details += f", pain scale {request.form['pain_scale']}"
+    if request.form.get('vitals_notes'):
+        details += f": {request.form['vitals_notes']}"
+    g.data_store.log_activity({
+        'timestamp': datetime.now().isoformat(),
+        'user': taken_by or 'System',
+        'action': 'Vitals Recorded',
+        'details': details
+    })
+    
+    flash('Vital signs recorded', 'success')
+    return redirect(url_for('main_bp.inpatient_list'))
+
 @main_bp.route('/pharmacy')
 def pharmacy():
     """Display the pharmacy page"""
-    # Get prescriptions from medical records
-    prescriptions = []
-    for record_id, record in g.data_store.medical_records.items():
-        for prescription in record.get('prescriptions', []):
-            patient_id = record.get('patient_id')
-            patient_name = g.data_store.patients.get(patient_id, {}).get('name', 'Unknown')
-            
-            prescriptions.append({
-                'record_id': record_id,
-                'patient_id': patient_id,
-                'patient_name': patient_name,
-                'medication': prescription.get('medication'),
-                'dosage': prescription.get('dosage'),
-                'frequency': prescription.get('frequency'),
-                'duration': prescription.get('duration'),
-                'instructions': prescription.get('instructions'),
-                'prescribed_at': prescription.get('prescribed_at')
-            })
+    # Pending prescriptions from the head of the pharmacy queue
+    page = _requested_page()
+    prescriptions, total = g.data_store.get_pending_prescriptions(page, LIST_PAGE_SIZE)
+    pagination = _pagination(page, total)
+    
+    # Latest prescriptions of any status for the history card
+    history, _ = g.data_store.list_page('prescriptions', 1, 10)
     
     # Get pharmacy inventory
-    inventory = g.data_store.pharmacy_inventory
+    inventory = dict(g.data_store.items('pharmacy_inventory'))
     
     return render_template('pharmacy.html', 
                           prescriptions=prescriptions,
+                          pagination=pagination,
+                          history=history,
                           inventory=inventory)
 
+@main_bp.route('/pharmacy/prescriptions/<record_id>/<int:position>/<action>', methods=['POST'])
+def update_prescription(record_id, position, action):
+    """Dispense or cancel a pending prescription"""
+    status = {'dispense': DISPENSED, 'cancel': CANCELLED}.get(action)
+    if status is None or not g.data_store.set_prescription_status(record_id, position, status):
+        flash('Prescription not found or no longer pending', 'error')
+        return redirect(url_for('main_bp.pharmacy'))
+    
+    # Log activity
+    g.data_store.log_activity({
+        'timestamp': datetime.now().isoformat(),
+        'user': 'System',
+        'action': 'Prescription Dispensed' if status == DISPENSED else 'Prescription Cancelled',
+        'details': f"Prescription {position + 1} of medical record {record_id} {status}"
+    })
+    
+    flash(f'Prescription {status}', 'success')
+    return redirect(url_for('main_bp.pharmacy', page=_requested_page()))
+
 @main_bp.route('/laboratory')
 def laboratory():
     """Display the laboratory page"""
-    # Get lab requests
-    lab_requests = g.data_store.lab_requests
-    
-    # Get completed lab results from medical records
-    lab_results = []
-    for record_id, record in g.data_store.medical_records.items():
-        for result in record.get('lab_results', []):
-            patient_id = record.get('patient_id')
-            patient_name = g.data_store.patients.get(patient_id, {}).get('name', 'Unknown')
-            
-            lab_results.append({
-                'record_id': record_id,
-                'patient_id': patient_id,
-                'patient_name': patient_name,
-                'test_name': result.get('test_name'),
-                'result': result.get('result'),
-                'reference_range': result.get('reference_range'),
-                'notes': result.get('notes'),
-                'recorded_at': result.get('recorded_at')
-            })
+    # Get the active lab requests in worklist order
+    lab_requests = g.data_store.get_lab_worklist()
+    
+    # Get completed lab results from medical records, newest first, with their flags
+    lab_results, pagination = _list_page('lab_results')
+    flags = g.data_store.flag_lab_results([(result.patient_id, result._asdict()) for result in lab_results])
     
     return render_template('laboratory.html', 
                           lab_requests=lab_requests,
-                          lab_results=lab_results)
+                          lab_results=list(zip(lab_results, flags)),
+                          pagination=pagination)
 
 @main_bp.route('/radiology')
 def radiology():
     """Display the radiology page"""
     # Get radiology requests
-    radiology_requests = g.data_store.radiology_requests
+    radiology_requests = dict(g.data_store.items('radiology_requests'))
     
     return render_template('radiology.html', 
                           radiology_requests=radiology_requests)
@@ -398,26 +428,30 @@ def physiotherapy():
                           physiotherapy_sessions=physiotherapy_sessions,
                           today=today)
 
+@main_bp.route('/laboratory/requests/<request_id>/<action>', methods=['POST'])
+def update_lab_request(request_id, action):
+    """Start, complete or cancel an active lab request"""
+    status = {'process': PROCESSING, 'complete': COMPLETED, 'cancel': LAB_CANCELLED}.get(action)
+    if status is None or not g.data_store.set_lab_request_status(request_id, status):
+        flash('Lab request not found or no longer active', 'error')
+        return redirect(url_for('main_bp.laboratory'))
+    
+    # Log activity
+    g.data_store.log_activity({
+        'timestamp': datetime.now().isoformat(),
+        'user': 'System',
+        'action': f'Lab Request {status.title()}',
+        'details': f"Lab request {request_id} {status}"
+    })
+    
+    flash(f'Lab request {status}', 'success')
+    return redirect(url_for('main_bp.laboratory'))
+
 @main_bp.route('/billing')
 def billing_list():
     """Display the billing list page"""
-    bills = []
-    for bill_id, bill in g.data_store.billing_records.items():
-        patient_id = bill.get('patient_id')
-        patient_name = g.data_store.patients.get(patient_id, {}).get('name', 'Unknown')
-        
-        bills.append({
-            'id': bill_id,
-            'patient_id': patient_id,
-            'patient_name': patient_name,
-            'total_amount': bill.get('total_amount'),
-            'patient_responsibility': bill.get('patient_responsibility'),
-            'status': bill.get('status'),
-            'issued_date': bill.get('issued_date'),
-            'due_date': bill.get('due_date')
-        })
-    
-    return render_template('billing.html', bills=bills)
+    bills, pagination = _list_page('billing_records')
+    return render_template('billing.html', bills=bills, pagination=pagination)
 
 @main_bp.route('/billing/add', methods=['GET', 'POST'])
 def add_billing():
@@ -483,7 +517,7 @@ def add_billing():
     
     # Get appointments and medical records for visit selection
     appointments = []
-    for app_id, app in g.data_store.appointments.items():
+    for app_id, app in g.data_store.items('appointments'):
         patient_id = app.get('patient_id')
         patient_name = g.data_store.patients.get(patient_id, {}).get('name', 'Unknown')
         
@@ -538,7 +572,7 @@ def pay_billing(bill_id):
     bill.record_payment(amount, method)
     
     # Update billing record in data store
-    g.data_store.billing_records[bill_id] = bill.__dict__
+    g.data_store.update_billing_record(bill)
     
     # Log activity
     patient_name = g.data_store.patients.get(bill.patient_id, {}).get('name', 'Unknown')
@@ -652,7 +686,7 @@ def payment_notification():
                         )
                         
                         # Update billing record in data store
-                        g.data_store.billing_records[bill_id] = bill.__dict__
+                        g.data_store.update_billing_record(bill)
                         
                         # Log activity
                         patient_name = g.data_store.patients.get(bill.patient_id, {}).get('name', 'Unknown')
@@ -74,11 +74,19 @@ function addPrescriptionItem() {
             </div>
         </div>
         <div class="row g-2 mt-2">
-            <div class="col-md-4">
+            <div class="col-md-3">
                 <label class="form-label">Durasi</label>
                 <input type="text" class="form-control" name="duration" placeholder="Cth: 7 hari">
             </div>
-            <div class="col-md-8">
+            <div class="col-md-3">
+                <label class="form-label">Urgensi</label>
+                <select class="form-select" name="urgency">
+                    <option value="routine" selected>Rutin</option>
+                    <option value="urgent">Segera</option>
+                    <option value="stat">Cito</option>
+                </select>
+            </div>
+            <div class="col-md-6">
                 <label class="form-label">Instruksi</label>
                 <input type="text" class="form-control" name="instructions" placeholder="Cth: Setelah makan">
             </div>
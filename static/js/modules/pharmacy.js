@@ -8,9 +8,6 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Initialize inventory management
     initInventoryManagement();
-    
-    // Initialize prescription dispensing
-    initPrescriptionDispensing();
 });
 
 /**
@@ -58,19 +55,6 @@ function initInventoryManagement() {
     checkLowInventory();
 }
 
-/**
- * Initialize prescription dispensing functionality
- */
-function initPrescriptionDispensing() {
-    // Mark prescription as dispensed
-    document.querySelectorAll('.dispense-prescription-btn').forEach(function(button) {
-        button.addEventListener('click', function() {
-            const prescriptionId = this.getAttribute('data-id');
-            dispensePrescription(prescriptionId);
-        });
-    });
-}
-
 /**
  * Show modal for adding new inventory item
  */
@@ -117,19 +101,6 @@ function showUpdateInventoryModal(itemId) {
     modal.show();
 }
 
-/**
- * Mark prescription as dispensed
- * @param {string} prescriptionId - Prescription ID
- */
-function dispensePrescription(prescriptionId) {
-    // In a real application, this would be an API call
-    // For now, just show an alert and reload
-    alert('Resep akan ditandai sebagai telah dikeluarkan');
-    
-    // In a real application, update the UI without reloading
-    window.location.reload();
-}
-
 /**
  * Check for low inventory items and show notification
  */
@@ -0,0 +1,51 @@
+"""
+Query the on-disk activity (audit) log
+
+Prints the logged activities matching the given filters as NDJSON, oldest
+first. Segments outside the time range are skipped without being opened,
+and only one segment is held in memory at a time.
+
+Usage:
+    python -m utils.activity_query [--dir simrs_activity] [--endpoint api_bp.get_patients]
+                                   [--ip 10.0.0.5] [--method POST] [--from 2025-01-01] [--to 2025-01-31T12:00]
+                                   [--count]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.activity_segments import query_segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--dir', default=os.environ.get('SIMRS_ACTIVITY_DIR') or 'simrs_activity',
+                        help='activity segment directory (default: $SIMRS_ACTIVITY_DIR or simrs_activity)')
+    parser.add_argument('--endpoint', help='Flask endpoint name, e.g. main_bp.patient_list')
+    parser.add_argument('--ip', help='client IP address')
+    parser.add_argument('--method', help='HTTP method')
+    parser.add_argument('--from', dest='start', help='inclusive start (ISO date or timestamp)')
+    parser.add_argument('--to', dest='end', help='inclusive end (ISO date or timestamp)')
+    parser.add_argument('--count', action='store_true', help='print only the number of matches')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        parser.error(f"{args.dir} is not a directory")
+    activities = query_segments(args.dir, endpoint=args.endpoint, ip=args.ip, method=args.method,
+                                start=args.start, end=args.end)
+    if args.count:
+        print(sum(1 for _ in activities))
+        return
+    try:
+        for activity in activities:
+            sys.stdout.write(json.dumps(activity) + '\n')
+    except BrokenPipeError:
+        # e.g. piped into head
+        sys.stderr.close()
+
+
+if __name__ == '__main__':
+    main()